@@ -71,16 +71,10 @@ def play_game_to_test_second_mover_agent(
                 reward = 1  # Winning the game
             else:
                 # if the opponent can win in the next move, we will choose this to accelerate the learning process.
-                use_check_win_move = False
-                valid_actions = game.get_valid_actions()
-                for i in valid_actions:
-                    game.make_move(*i, player2)
-                    if game.check_win(player2):
-                        use_check_win_move = True
-                        break
-                    else:
-                        game.withdraw_move(*i)
-                if not use_check_win_move:
+                winning_moves = game.winning_moves(player2)
+                if winning_moves:
+                    game.make_move(*winning_moves[0], player2)
+                else:
                     # ai opponent.
                     agent1_state_key = game.get_state_key().translate(
                         str.maketrans("12", "21")
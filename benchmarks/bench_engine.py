@@ -0,0 +1,136 @@
+"""
+Benchmark the bitboard TicTacToe engine against the original NumPy engine.
+
+Both engines are driven through play_game_agent_move_second with the same seed, so the only difference
+between the two runs is the board representation.
+
+Run from the root directory of the project:
+python -m benchmarks.bench_engine --episodes 20000
+"""
+import argparse
+import random
+from time import perf_counter
+
+import numpy as np
+
+import training_agent_that_move_second
+from game_and_agent import QLearningAgent, TicTacToe
+
+
+class NumpyTicTacToe(TicTacToe):
+    """
+    The original TicTacToe engine that stores the board as a 3x3 NumPy array. Kept as the baseline.
+    """
+
+    def __init__(self) -> None:
+        self.array = np.zeros((3, 3), dtype=int)
+        self.move_record = []
+
+    @property
+    def board(self) -> np.ndarray:
+        return self.array
+
+    @board.setter
+    def board(self, board: np.ndarray) -> None:
+        self.array = board
+
+    def is_valid_move(self, x: int, y: int) -> bool:
+        return self.array[x, y] == 0
+
+    def make_move(self, x: int, y: int, player: int) -> bool:
+        if self.is_valid_move(x, y):
+            self.array[x, y] = player
+            self.move_record.append((player, (x, y)))
+            return True
+        return False
+
+    def withdraw_move(self, x: int, y: int) -> bool:
+        if not self.is_valid_move(x, y):
+            self.array[x, y] = 0
+            self.move_record.pop()
+            return True
+        return False
+
+    def check_win(self, player: int) -> bool:
+        for row in range(3):
+            if np.all(self.array[row, :] == player):
+                return True
+        for col in range(3):
+            if np.all(self.array[:, col] == player):
+                return True
+        if np.all(np.diag(self.array) == player):
+            return True
+        if np.all(np.diag(np.fliplr(self.array)) == player):
+            return True
+        return False
+
+    def check_draw(self) -> bool:
+        return np.all(self.array != 0)
+
+    def reset(self) -> None:
+        self.array.fill(0)
+        self.move_record = []
+
+    def get_state_key(self) -> str:
+        return self.board_to_state_key(self.array)
+
+    def get_valid_actions(self) -> list:
+        return [(x, y) for x in range(3) for y in range(3) if self.is_valid_move(x, y)]
+
+    def winning_moves(self, player: int) -> list:
+        # The original scan: try every valid move and keep the ones that win. blocking_moves relies on it too.
+        moves = []
+        for action in self.get_valid_actions():
+            self.make_move(*action, player)
+            if self.check_win(player):
+                moves.append(action)
+            self.withdraw_move(*action)
+        return moves
+
+    def set_board_by_state_key(self, state_key: str) -> None:
+        self.array = self.state_key_to_board(state_key)
+
+
+def episodes_per_second(game_class: type, episodes: int, seed: int) -> float:
+    """
+    Train a fresh second mover agent for a number of episodes with the given engine.
+
+    Parameters:
+    game_class (type): The TicTacToe class used by play_game_agent_move_second.
+    episodes (int): The number of episodes to play.
+    seed (int): The seed of the random module.
+
+    Returns:
+    float: The number of episodes played per second.
+    """
+    random.seed(seed)
+    agent = QLearningAgent()
+    agent1 = QLearningAgent(
+        epsilon=0.5,
+        pre_trained_q_table="q_table_ubuntu_agent_move_first.pkl",
+    )
+
+    original_game_class = training_agent_that_move_second.TicTacToe
+    training_agent_that_move_second.TicTacToe = game_class
+    try:
+        start = perf_counter()
+        training_agent_that_move_second.play_game_agent_move_second(
+            agent, agent1, episodes=episodes
+        )
+        elapsed = perf_counter() - start
+    finally:
+        training_agent_that_move_second.TicTacToe = original_game_class
+    return episodes / elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--episodes", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    before = episodes_per_second(NumpyTicTacToe, args.episodes, args.seed)
+    after = episodes_per_second(TicTacToe, args.episodes, args.seed)
+    print(f"NumPy engine:    {before:10.1f} episodes/sec")
+    print(f"Bitboard engine: {after:10.1f} episodes/sec")
+    print(f"Speedup:         {after / before:10.2f}x")
@@ -0,0 +1,280 @@
+"""
+Micro-benchmark the hot paths of the game engine and the Q-learning agent, the operations that a training run calls
+millions of times.
+
+Each operation is applied to the same inputs, positions reached by seeded random play, in several rounds after a
+warmup round, with the garbage collector disabled as timeit does. A round repeats the inputs until it lasts at
+least MIN_ROUND_SECONDS, so that the fast operations are not lost in the timer resolution. The time of an empty
+call on the same inputs is subtracted, and the fastest round is compared with the baseline, since the slower ones
+only add noise from the rest of the system. On a shared machine, the noise can still exceed 20%: compare runs made
+on the same idle machine, or raise --rounds and --threshold.
+
+Run from the root directory of the project:
+python -m benchmarks.bench_micro
+python -m benchmarks.bench_micro --output baseline.json
+python -m benchmarks.bench_micro --baseline baseline.json
+With --baseline, the exit status is 1 if an operation is slower than in the baseline by more than --threshold.
+"""
+import argparse
+import gc
+import json
+import platform
+import random
+import sys
+from statistics import median
+from time import perf_counter
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from game_and_agent import QLearningAgent, TicTacToe
+
+# The pre-trained Q-table used by the choose_action operations.
+Q_TABLE_PATH = "q_table_ubuntu_agent_move_first.pkl"
+MIN_ROUND_SECONDS = 0.05
+
+
+def random_games(positions: int, seed: int) -> List[TicTacToe]:
+    """
+    Returns games in random positions reached by random play, with at least one valid action left.
+    """
+    rng = random.Random(seed)
+    games = []
+    while len(games) < positions:
+        game = TicTacToe()
+        player = rng.choice([1, 2])
+        for _ in range(rng.randrange(9)):
+            game.make_move(*rng.choice(game.get_valid_actions()), player)
+            if game.check_win(player):
+                break
+            player = 3 - player
+        if game.get_valid_actions():
+            games.append(game)
+    return games
+
+
+def random_transitions(games: List[TicTacToe], seed: int) -> List[tuple]:
+    """
+    Returns an argument tuple of QLearningAgent.learn for each game: a random action of player 1, and the state after
+    a random reply of player 2, or a terminal state without valid actions.
+    """
+    rng = random.Random(seed)
+    transitions = []
+    for game in games:
+        state_key = game.get_state_key()
+        action = rng.choice(game.get_valid_actions())
+        game.make_move(*action, 1)
+        reply = None
+        if not game.check_win(1) and not game.check_draw():
+            reply = rng.choice(game.get_valid_actions())
+            game.make_move(*reply, 2)
+        next_valid_actions = (
+            [] if game.check_win(1) or game.check_win(2) else game.get_valid_actions()
+        )
+        transitions.append(
+            (state_key, action, rng.choice([-1, 0, 1, -0.1]), game.get_state_key(), next_valid_actions)
+        )
+        if reply is not None:
+            game.withdraw_move(*reply)
+        game.withdraw_move(*action)
+    return transitions
+
+
+def operations(positions: int, seed: int) -> Dict[str, Tuple[Callable, list]]:
+    """
+    Returns the benchmarked operations: for each name, a function of one input and the inputs.
+    """
+    games = random_games(positions, seed)
+    state_keys = [game.get_state_key() for game in games]
+    actions = [random.Random(seed).choice(game.get_valid_actions()) for game in games]
+    transitions = random_transitions(games, seed)
+    pre_trained_agent = QLearningAgent(pre_trained_q_table=Q_TABLE_PATH)
+    dense_pre_trained_agent = QLearningAgent(pre_trained_q_table=Q_TABLE_PATH, dense_q_table=True)
+    learning_agent = QLearningAgent()
+    dense_learning_agent = QLearningAgent(dense_q_table=True)
+    return {
+        "TicTacToe.check_win": (lambda game: game.check_win(1), games),
+        "TicTacToe.check_draw": (lambda game: game.check_draw(), games),
+        "TicTacToe.get_state_key": (lambda game: game.get_state_key(), games),
+        "TicTacToe.get_valid_actions": (lambda game: game.get_valid_actions(), games),
+        "TicTacToe.make_move+withdraw_move": (
+            lambda game_action: (
+                game_action[0].make_move(*game_action[1], 1),
+                game_action[0].withdraw_move(*game_action[1]),
+            ),
+            list(zip(games, actions)),
+        ),
+        "TicTacToe.set_board_by_state_key": (
+            lambda state_key: games[0].set_board_by_state_key(state_key),
+            state_keys,
+        ),
+        "TicTacToe.state_key_to_board": (TicTacToe.state_key_to_board, state_keys),
+        "QLearningAgent.get_symmetrical_state_action_pairs": (
+            lambda state_action: learning_agent.get_symmetrical_state_action_pairs(*state_action),
+            list(zip(state_keys, actions)),
+        ),
+        "QLearningAgent.choose_action": (
+            lambda game: pre_trained_agent.choose_action(
+                game.get_state_key(), game.get_valid_actions()
+            ),
+            games,
+        ),
+        "QLearningAgent.choose_action (dense)": (
+            lambda game: dense_pre_trained_agent.choose_action(
+                game.get_state_key(), game.get_valid_actions()
+            ),
+            games,
+        ),
+        "QLearningAgent.learn": (
+            lambda transition: learning_agent.learn(*transition),
+            transitions,
+        ),
+        "QLearningAgent.learn (dense)": (
+            lambda transition: dense_learning_agent.learn(*transition),
+            transitions,
+        ),
+    }
+
+
+def time_rounds(function: Callable, inputs: list, rounds: int, loops: int) -> List[float]:
+    """
+    Applies function to every input loops times in each of rounds timed rounds.
+
+    Returns:
+    List[float]: The time of each round in seconds.
+    """
+    times = []
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(rounds):
+            start = perf_counter()
+            for _ in range(loops):
+                for value in inputs:
+                    function(value)
+            times.append(perf_counter() - start)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return times
+
+
+def time_per_call(function: Callable, inputs: list, rounds: int) -> List[float]:
+    """
+    Times function on the inputs after a warmup round, and subtracts the time of an empty call.
+
+    Returns:
+    List[float]: The time per call of each round in seconds.
+    """
+    warmup = time_rounds(function, inputs, 1, 1)[0]
+    loops = max(1, int(MIN_ROUND_SECONDS / max(warmup, 1e-9)) + 1)
+    overhead = min(time_rounds(lambda value: None, inputs, rounds, loops))
+    calls = loops * len(inputs)
+    return [
+        max(0.0, time - overhead) / calls for time in time_rounds(function, inputs, rounds, loops)
+    ]
+
+
+def measure(
+    positions: int, rounds: int, seed: int, names: Optional[List[str]] = None
+) -> Dict[str, Dict[str, float]]:
+    """
+    Times the operations.
+
+    Parameters:
+    positions (int): The number of inputs of each operation.
+    rounds (int): The number of timed rounds.
+    seed (int): The seed of the inputs and of the random module.
+    names (Optional[List[str]]): Only time the operations whose name contains one of these strings (default: None).
+
+    Returns:
+    Dict[str, Dict[str, float]]: The best and the median time per call of each operation, in nanoseconds.
+    """
+    results = {}
+    for name, (function, inputs) in operations(positions, seed).items():
+        if names and not any(part in name for part in names):
+            continue
+        random.seed(seed)
+        np.random.seed(seed)
+        times = time_per_call(function, inputs, rounds)
+        results[name] = {"best_ns": min(times) * 1e9, "median_ns": median(times) * 1e9}
+    return results
+
+
+def compare(
+    results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]], threshold: float
+) -> List[str]:
+    """
+    Returns the regressions of the results against a baseline: the operations whose best time is slower by more
+    than the threshold. The operations that are missing from either side are skipped.
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        if result["best_ns"] > baseline[name]["best_ns"] * (1 + threshold):
+            regressions.append(
+                f"{name} {result['best_ns']:.0f}ns > {baseline[name]['best_ns']:.0f}ns "
+                f"({result['best_ns'] / baseline[name]['best_ns'] - 1:+.0%})"
+            )
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--positions", type=int, default=2000)
+    parser.add_argument("--rounds", type=int, default=7)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--filter", nargs="+", help="Only time the operations whose name contains one of these strings."
+    )
+    parser.add_argument("--output", help="Save the results as JSON.")
+    parser.add_argument("--baseline", help="Compare the results with results saved with --output.")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="Relative slowdown against the baseline reported as a regression (default: 0.2).",
+    )
+    args = parser.parse_args(argv)
+
+    results = measure(args.positions, args.rounds, args.seed, args.filter)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)["operations"]
+
+    print(
+        f"{'operation':55s}{'best (ns)':>12s}{'median (ns)':>14s}"
+        + (f"{'baseline':>12s}" if baseline else "")
+    )
+    for name, result in results.items():
+        line = f"{name:55s}{result['best_ns']:12.0f}{result['median_ns']:14.0f}"
+        if baseline and name in baseline:
+            line += f"{baseline[name]['best_ns']:12.0f}"
+        print(line)
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(
+                {
+                    "python": platform.python_version(),
+                    "machine": platform.machine(),
+                    "positions": args.positions,
+                    "rounds": args.rounds,
+                    "seed": args.seed,
+                    "operations": results,
+                },
+                file,
+                indent=2,
+            )
+    if baseline is not None:
+        regressions = compare(results, baseline, args.threshold)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
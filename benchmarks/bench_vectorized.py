@@ -0,0 +1,98 @@
+"""
+Benchmark the vectorized training loop of the first mover agent against the serial one.
+
+Run from the root directory of the project:
+python -m benchmarks.bench_vectorized --episodes 50000 --n-games 1024
+"""
+import argparse
+import random
+from time import perf_counter
+
+import numpy as np
+
+import training_agent_that_move_first
+from game_and_agent import QLearningAgent, TicTacToe, VecTicTacToe
+
+
+class CountingTicTacToe(TicTacToe):
+    """
+    A TicTacToe that counts the plies played, not counting the moves that are withdrawn.
+    """
+
+    plies = 0
+
+    def make_move(self, x: int, y: int, player: int) -> bool:
+        made = super().make_move(x, y, player)
+        CountingTicTacToe.plies += made
+        return made
+
+    def withdraw_move(self, x: int, y: int) -> bool:
+        withdrawn = super().withdraw_move(x, y)
+        CountingTicTacToe.plies -= withdrawn
+        return withdrawn
+
+
+class CountingVecTicTacToe(VecTicTacToe):
+    """
+    A VecTicTacToe that counts the plies played.
+    """
+
+    plies = 0
+
+    def step(self, cells, player, active=None):
+        CountingVecTicTacToe.plies += (
+            self.n_games if active is None else int(np.count_nonzero(active))
+        )
+        return super().step(cells, player, active)
+
+
+def measure(vectorized: bool, episodes: int, n_games: int, seed: int) -> tuple:
+    """
+    Train a fresh first mover agent and measure its throughput.
+
+    Parameters:
+    vectorized (bool): Use play_game_agent_move_first_vectorized instead of play_game_agent_move_first.
+    episodes (int): The number of episodes to play.
+    n_games (int): The number of games played in lockstep by the vectorized loop.
+    seed (int): The seed of the random modules.
+
+    Returns:
+    tuple: The number of episodes and plies played per second.
+    """
+    random.seed(seed)
+    np.random.seed(seed)
+    module = training_agent_that_move_first
+    original_classes = module.TicTacToe, module.VecTicTacToe
+    module.TicTacToe, module.VecTicTacToe = CountingTicTacToe, CountingVecTicTacToe
+    CountingTicTacToe.plies = CountingVecTicTacToe.plies = 0
+    try:
+        start = perf_counter()
+        if vectorized:
+            agent = QLearningAgent(dense_q_table=True)
+            module.play_game_agent_move_first_vectorized(
+                agent, episodes=episodes, n_games=n_games
+            )
+        else:
+            agent = QLearningAgent()
+            module.play_game_agent_move_first(agent, episodes=episodes)
+        elapsed = perf_counter() - start
+    finally:
+        module.TicTacToe, module.VecTicTacToe = original_classes
+    plies = CountingVecTicTacToe.plies if vectorized else CountingTicTacToe.plies
+    return episodes / elapsed, plies / elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--episodes", type=int, default=50000)
+    parser.add_argument("--n-games", type=int, default=1024)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for name, vectorized in (("Serial", False), ("Vectorized", True)):
+        episodes_per_second, plies_per_second = measure(
+            vectorized, args.episodes, args.n_games, args.seed
+        )
+        print(
+            f"{name:10s} {episodes_per_second:12.1f} episodes/sec {plies_per_second:12.1f} plies/sec"
+        )
@@ -0,0 +1,347 @@
+"""
+Load-test the web app by replaying games against /make_move, in-process through an ASGI transport or against a
+local uvicorn server.
+
+Each client plays whole games, one request per move, with a scripted human player: it wins or blocks when it
+can, and otherwise prefers the center and the corners, as most players do. Half of the games are started by the
+AI, with a random first move placed by the client as the HTML client did. The clients and the AI draw from seeded
+random generators, so an in-process run with the same options replays the same games.
+
+The report gives the requests/sec, the latency percentiles and the CPU time of the server, split into:
+- pydantic: the validation of the requests and the serialization of the responses, measured after the run by
+  replaying the recorded bodies through the models, since it happens inside FastAPI;
+- board_conversion, cache_hit, win_check and choose_action: the sums of these stages on /metrics, which time
+  synchronous code, so their wall-clock time is CPU time. An AI's turn is a cache_hit when it is in the move cache,
+  and a win_check and a choose_action otherwise;
+- other: the rest, mostly the ASGI server, routing and JSON, and, in-process, the clients.
+
+Run from the root directory of the project:
+python -m benchmarks.bench_webapp --games 2000 --concurrency 32
+python -m benchmarks.bench_webapp --server uvicorn --workers 1 --games 2000 --concurrency 32
+Save a result with --output and compare a later run with it with --baseline.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import resource
+import socket
+import subprocess
+import sys
+from time import perf_counter, process_time
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+from game_and_agent import TicTacToe
+
+# The preference of the scripted human for each cell when it can neither win nor block.
+CELL_WEIGHTS = (3, 1, 3, 1, 6, 1, 3, 1, 3)
+TERMINAL_MESSAGES = ("You win!", "AI wins!", "It is a draw!")
+# The stages of /metrics that are part of the CPU time split. The parse stage is left out: it spans the awaits
+# of reading the body, so under load it also counts the time spent waiting for the event loop.
+STAGES = ("board_conversion", "cache_hit", "win_check", "choose_action")
+
+
+def human_move(board: List[List[str]], rng: random.Random) -> Tuple[int, int]:
+    """
+    Returns the move of the scripted human ('O'): a winning move, else a move that blocks the AI, else a weighted
+    random move.
+    """
+    game = TicTacToe()
+    game.set_board_by_state_key(
+        "".join({"": "0", "X": "1", "O": "2"}[cell] for row in board for cell in row)
+    )
+    for moves in (game.winning_moves(2), game.blocking_moves(2)):
+        if moves:
+            return moves[0]
+    valid_actions = game.get_valid_actions()
+    return rng.choices(valid_actions, [CELL_WEIGHTS[3 * x + y] for x, y in valid_actions])[0]
+
+
+async def play_games(
+    client: httpx.AsyncClient,
+    games: int,
+    seed: int,
+    latencies: List[float],
+    outcomes: Dict[str, int],
+    bodies: List[Tuple[dict, dict]],
+) -> None:
+    """
+    Plays games one after another on one client, and records the latency, the request body and the response body
+    of each request.
+    """
+    rng = random.Random(seed)
+    for game_index in range(games):
+        player_who_move_first = "X" if game_index % 2 == 0 else "O"
+        board = [["", "", ""], ["", "", ""], ["", "", ""]]
+        if player_who_move_first == "X":
+            board[rng.randrange(3)][rng.randrange(3)] = "X"
+        message = ""
+        while message not in TERMINAL_MESSAGES:
+            x, y = human_move(board, rng)
+            body = {
+                "state": {
+                    "board": board,
+                    "player_who_move_first": player_who_move_first,
+                    "message": "",
+                },
+                "x": x,
+                "y": y,
+            }
+            start = perf_counter()
+            response = await client.post("/make_move", json=body)
+            latencies.append(perf_counter() - start)
+            response.raise_for_status()
+            state = response.json()
+            bodies.append((body, state))
+            board, message = state["board"], state["message"]
+            if message == "Invalid Move!":
+                raise RuntimeError(f"The server rejected the move {(x, y)} on {board}.")
+        outcomes[message] = outcomes.get(message, 0) + 1
+
+
+def parse_stage_sums(metrics_text: str) -> Dict[str, float]:
+    """
+    Returns the total time of each stage from the text of /metrics.
+    """
+    sums = dict.fromkeys(STAGES, 0.0)
+    for stage, value in re.findall(
+        r'^tictactoe_stage_duration_seconds_sum\{stage="(\w+)"\} (\S+)$', metrics_text, re.MULTILINE
+    ):
+        sums[stage] = float(value)
+    return sums
+
+
+async def run_load(
+    client: httpx.AsyncClient, games: int, concurrency: int, seed: int
+) -> Tuple[List[float], Dict[str, int], List[Tuple[dict, dict]], float]:
+    """
+    Plays the games on concurrency clients at once.
+
+    Returns:
+    Tuple[List[float], Dict[str, int], List[Tuple[dict, dict]], float]: The latencies of the requests, the number
+                                                                        of games by final message, the request and
+                                                                        response bodies and the wall-clock time.
+    """
+    latencies = []
+    outcomes = {}
+    bodies = []
+    shares = [games // concurrency + (index < games % concurrency) for index in range(concurrency)]
+    start = perf_counter()
+    await asyncio.gather(
+        *(
+            play_games(client, share, seed * 1000003 + index, latencies, outcomes, bodies)
+            for index, share in enumerate(shares)
+            if share
+        )
+    )
+    return latencies, outcomes, bodies, perf_counter() - start
+
+
+def pydantic_seconds(bodies: List[Tuple[dict, dict]]) -> float:
+    """
+    Replays the request and response bodies through the models of the app, as FastAPI does for /make_move: the
+    validation of the request, and the validation and serialization of the response.
+
+    Returns:
+    float: The total time in seconds.
+    """
+    from fastapi.encoders import jsonable_encoder
+
+    from tictactoe_webapp import GameState, Item
+
+    start = process_time()
+    for request_body, response_body in bodies:
+        Item(**request_body)
+        jsonable_encoder(GameState(**response_body))
+    return process_time() - start
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """
+    Returns a percentile of sorted values, by the nearest-rank method.
+    """
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def summarize(
+    latencies: List[float],
+    outcomes: Dict[str, int],
+    elapsed: float,
+    cpu_time: float,
+    stage_sums: Dict[str, float],
+    bodies: List[Tuple[dict, dict]],
+) -> dict:
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "games": sum(outcomes.values()),
+        "outcomes": outcomes,
+        "requests_per_second": len(latencies) / elapsed,
+        "latency_ms": {
+            name: percentile(latencies, fraction) * 1000
+            for name, fraction in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99))
+        },
+        "cpu_seconds": cpu_time,
+        "stage_cpu_seconds": {"pydantic": pydantic_seconds(bodies), **stage_sums},
+    }
+
+
+async def run_in_process(games: int, concurrency: int, seed: int) -> dict:
+    """
+    Drives the app in this process through httpx.ASGITransport. The measured CPU time includes the clients.
+    """
+    import tictactoe_webapp
+
+    random.seed(seed)
+    tictactoe_webapp.resolve_agent_turn.cache_clear()
+    before = {stage: stage_sum(tictactoe_webapp, stage) for stage in STAGES}
+    transport = httpx.ASGITransport(app=tictactoe_webapp.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+        cpu_start = process_time()
+        latencies, outcomes, bodies, elapsed = await run_load(client, games, concurrency, seed)
+        cpu_time = process_time() - cpu_start
+    stage_sums = {stage: stage_sum(tictactoe_webapp, stage) - before[stage] for stage in STAGES}
+    return summarize(latencies, outcomes, elapsed, cpu_time, stage_sums, bodies)
+
+
+def stage_sum(module, stage: str) -> float:
+    counts = module.STAGE_LATENCY.values.get((stage,))
+    return counts[-1] if counts else 0.0
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def run_against_uvicorn(games: int, concurrency: int, seed: int, workers: int) -> dict:
+    """
+    Starts uvicorn in a subprocess and drives it over HTTP. The measured CPU time is the CPU time of the server.
+    With several workers, the stage times are those of the worker that answers /metrics.
+    """
+    port = free_port()
+    env = dict(os.environ, TICTACTOE_LOG_SAMPLE_RATE="0", TICTACTOE_WATCH_INTERVAL="0")
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "tictactoe_webapp:app",
+            "--port",
+            str(port),
+            "--workers",
+            str(workers),
+            "--log-level",
+            "warning",
+        ],
+        env=env,
+    )
+    try:
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        async with httpx.AsyncClient(
+            base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=30
+        ) as client:
+            for _ in range(300):
+                try:
+                    await client.get("/metrics")
+                    break
+                except httpx.TransportError:
+                    await asyncio.sleep(0.1)
+            else:
+                raise RuntimeError("uvicorn did not start.")
+            before = parse_stage_sums((await client.get("/metrics")).text)
+            latencies, outcomes, bodies, elapsed = await run_load(
+                client, games, concurrency, seed
+            )
+            after = parse_stage_sums((await client.get("/metrics")).text)
+    finally:
+        server.terminate()
+        server.wait()
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    stage_sums = {stage: after.get(stage, 0.0) - before.get(stage, 0.0) for stage in STAGES}
+    return summarize(
+        latencies, outcomes, elapsed, usage.ru_utime + usage.ru_stime, stage_sums, bodies
+    )
+
+
+def report(result: dict) -> str:
+    latency = result["latency_ms"]
+    lines = [
+        f"Played {result['games']} games with {result['requests']} requests: {result['outcomes']}.",
+        f"{result['requests_per_second']:.1f} requests/sec, latency p50 {latency['p50']:.2f}ms "
+        f"p95 {latency['p95']:.2f}ms p99 {latency['p99']:.2f}ms.",
+        f"CPU time: {result['cpu_seconds']:.2f}s",
+    ]
+    stages_total = 0.0
+    for stage, seconds in result["stage_cpu_seconds"].items():
+        stages_total += seconds
+        lines.append(
+            f"  {stage:18s} {seconds:8.3f}s {seconds / result['cpu_seconds']:6.1%} "
+            f"{seconds / result['requests'] * 1e6:8.1f}us/request"
+        )
+    other = result["cpu_seconds"] - stages_total
+    lines.append(f"  {'other':18s} {other:8.3f}s {other / result['cpu_seconds']:6.1%}")
+    return "\n".join(lines)
+
+
+def compare(result: dict, baseline: dict, threshold: float) -> List[str]:
+    """
+    Returns the regressions of a result against a baseline: a drop of the requests/sec or a rise of a latency
+    percentile by more than the threshold.
+    """
+    regressions = []
+    if result["requests_per_second"] < baseline["requests_per_second"] * (1 - threshold):
+        regressions.append(
+            f"requests/sec {result['requests_per_second']:.1f} < {baseline['requests_per_second']:.1f}"
+        )
+    for name, value in result["latency_ms"].items():
+        if value > baseline["latency_ms"][name] * (1 + threshold):
+            regressions.append(f"{name} {value:.2f}ms > {baseline['latency_ms'][name]:.2f}ms")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--server", choices=["asgi", "uvicorn"], default="asgi")
+    parser.add_argument("--games", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=1, help="Workers of the uvicorn server.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Save the result as JSON.")
+    parser.add_argument("--baseline", help="Compare the result with a result saved with --output.")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="Relative change against the baseline reported as a regression (default: 0.2).",
+    )
+    args = parser.parse_args(argv)
+
+    if args.server == "asgi":
+        result = asyncio.run(run_in_process(args.games, args.concurrency, args.seed))
+    else:
+        result = asyncio.run(
+            run_against_uvicorn(args.games, args.concurrency, args.seed, args.workers)
+        )
+    print(report(result))
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(result, file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(result, json.load(file), args.threshold)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,177 @@
+"""
+Benchmark the serialization and parsing cost of the two wire formats of the web app: the nested-list boards of
+/make_move and the state keys of /make_move_compact.
+
+Each stage of a request is timed separately on the same random positions: the client encoding the request, the
+server parsing it into the model and then into a state key, the server encoding the response and the client
+decoding it. The original conversion of /make_move, three np.where passes and astype(int), is timed as a baseline.
+
+Run from the root directory of the project:
+python -m benchmarks.bench_wire_format --positions 10000
+"""
+import argparse
+import json
+import random
+from time import perf_counter
+from typing import Callable, Dict, List
+
+import numpy as np
+from fastapi.encoders import jsonable_encoder
+
+from game_and_agent import TicTacToe
+from tictactoe_webapp import (
+    CELL_TO_STATE_KEY,
+    CompactGameState,
+    CompactItem,
+    GameState,
+    Item,
+    state_key_to_cells,
+)
+
+
+def random_state_keys(positions: int, seed: int) -> List[str]:
+    """
+    Returns the state keys of random positions reached by random play.
+    """
+    rng = random.Random(seed)
+    state_keys = []
+    game = TicTacToe()
+    for _ in range(positions):
+        game.reset()
+        player = rng.choice([1, 2])
+        for _ in range(rng.randrange(8)):
+            game.make_move(*rng.choice(game.get_valid_actions()), player)
+            if game.check_win(player):
+                break
+            player = 3 - player
+        state_keys.append(game.get_state_key())
+    return state_keys
+
+
+def numpy_state_key(board: List[List[str]]) -> str:
+    """
+    The conversion of a nested-list board of the original /make_move: three np.where passes and astype(int).
+    """
+    board = np.array(board)
+    board = np.where(board == "X", "1", board)
+    board = np.where(board == "O", "2", board)
+    board = np.where(board == "", "0", board)
+    board = board.astype(int)
+    return TicTacToe.board_to_state_key(board)
+
+
+def time_stage(function: Callable, inputs: list) -> tuple:
+    """
+    Applies function to every input after a warmup pass.
+
+    Returns:
+    tuple: The outputs and the mean time per input in microseconds.
+    """
+    for value in inputs[:100]:
+        function(value)
+    start = perf_counter()
+    outputs = [function(value) for value in inputs]
+    return outputs, (perf_counter() - start) / len(inputs) * 1e6
+
+
+def measure(state_keys: List[str]) -> Dict[str, Dict[str, float]]:
+    """
+    Times each stage of a request in both formats.
+
+    Returns:
+    Dict[str, Dict[str, float]]: The mean time of each stage in microseconds, and the mean payload sizes in bytes,
+                                 for each format.
+    """
+    results = {}
+
+    # Nested-list boards.
+    requests = [
+        {
+            "state": {
+                "board": state_key_to_cells(state_key),
+                "player_who_move_first": "X",
+                "message": "",
+            },
+            "x": 0,
+            "y": 0,
+        }
+        for state_key in state_keys
+    ]
+    bodies, encode_request = time_stage(json.dumps, requests)
+    items, parse_request = time_stage(lambda body: Item(**json.loads(body)), bodies)
+    boards = [item.state.board for item in items]
+    _, to_state_key = time_stage(
+        lambda board: "".join(CELL_TO_STATE_KEY[cell] for row in board for cell in row),
+        boards,
+    )
+    _, to_state_key_numpy = time_stage(numpy_state_key, boards)
+    responses, encode_response = time_stage(
+        lambda state_key: json.dumps(
+            jsonable_encoder(
+                GameState(
+                    board=state_key_to_cells(state_key),
+                    player_who_move_first="X",
+                    message="",
+                )
+            )
+        ),
+        state_keys,
+    )
+    _, decode_response = time_stage(json.loads, responses)
+    results["nested"] = {
+        "encode request": encode_request,
+        "parse request": parse_request,
+        "to state key": to_state_key,
+        "encode response": encode_response,
+        "decode response": decode_response,
+        "request bytes": sum(map(len, bodies)) / len(bodies),
+        "response bytes": sum(map(len, responses)) / len(responses),
+    }
+    results["nested (NumPy)"] = {**results["nested"], "to state key": to_state_key_numpy}
+
+    # State keys.
+    requests = [
+        {"state_key": state_key, "player_who_move_first": "X", "x": 0, "y": 0}
+        for state_key in state_keys
+    ]
+    bodies, encode_request = time_stage(json.dumps, requests)
+    items, parse_request = time_stage(
+        lambda body: CompactItem(**json.loads(body)), bodies
+    )
+    responses, encode_response = time_stage(
+        lambda state_key: json.dumps(
+            jsonable_encoder(
+                CompactGameState(
+                    state_key=state_key, player_who_move_first="X", message=""
+                )
+            )
+        ),
+        state_keys,
+    )
+    _, decode_response = time_stage(json.loads, responses)
+    results["state key"] = {
+        "encode request": encode_request,
+        "parse request": parse_request,
+        "to state key": 0.0,
+        "encode response": encode_response,
+        "decode response": decode_response,
+        "request bytes": sum(map(len, bodies)) / len(bodies),
+        "response bytes": sum(map(len, responses)) / len(responses),
+    }
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--positions", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    results = measure(random_state_keys(args.positions, args.seed))
+    columns = list(next(iter(results.values())))
+    print(f"{'format':15s}" + "".join(f"{column:>17s}" for column in columns) + f"{'total (us)':>17s}")
+    for name, stages in results.items():
+        total = sum(value for column, value in stages.items() if "bytes" not in column)
+        print(
+            f"{name:15s}" + "".join(f"{stages[column]:17.2f}" for column in columns) + f"{total:17.2f}"
+        )
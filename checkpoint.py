@@ -0,0 +1,129 @@
+import os
+import pickle
+import random
+from typing import Optional, Tuple
+
+import numpy as np
+
+from game_and_agent import QLearningAgent
+
+SNAPSHOT_FILE = "snapshot.pkl"
+DELTA_LOG_FILE = "deltas.log"
+
+
+def write_durably(file) -> None:
+    file.flush()
+    os.fsync(file.fileno())
+
+
+class Checkpointer:
+    """
+    Periodic checkpoints of a serial training loop, from which the training can be resumed bit for bit.
+
+    A checkpoint is taken at the start of an episode and holds the episode counter, the learning rate, the
+    exponential moving average of the reward, the states of the random generators and the Q-table. Every
+    snapshot_every checkpoints, the whole state is written to a snapshot file, replaced atomically, and the delta log
+    is emptied. The checkpoints in between are appended to the delta log with only the Q-table entries that changed
+    since the previous checkpoint, since the entries of a Q-table are never removed. A record cut short by a crash
+    at the end of the log is dropped on restore.
+
+    Only dict Q-tables are supported, as used by the serial training loops.
+    """
+
+    def __init__(self, directory: str, interval: int = 10000, snapshot_every: int = 10) -> None:
+        """
+        Parameters:
+        directory (str): The directory of the checkpoint files, created if needed.
+        interval (int): The number of episodes between checkpoints (default: 10000).
+        snapshot_every (int): Write a full snapshot every snapshot_every checkpoints (default: 10).
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.snapshot_path = os.path.join(directory, SNAPSHOT_FILE)
+        self.delta_log_path = os.path.join(directory, DELTA_LOG_FILE)
+        self.interval = interval
+        self.snapshot_every = snapshot_every
+        # The Q-table as of the last checkpoint, to find the changed entries, or None before the first one.
+        self.saved_q_table: Optional[dict] = None
+        self.deltas_since_snapshot = 0
+
+    def save(self, agent: QLearningAgent, episode: int, average_reward: float) -> None:
+        """
+        Takes a checkpoint before the given episode is played.
+
+        Parameters:
+        agent (QLearningAgent): The agent being trained.
+        episode (int): The number of episodes played.
+        average_reward (float): The moving average of the reward of the training loop.
+        """
+        state = {
+            "episode": episode,
+            "alpha": agent.alpha,
+            "average_reward": average_reward,
+            "random_state": random.getstate(),
+            "numpy_random_state": np.random.get_state(),
+        }
+        if self.saved_q_table is None or self.deltas_since_snapshot + 1 >= self.snapshot_every:
+            state["q_table"] = agent.q_table
+            temporary_path = self.snapshot_path + ".tmp"
+            with open(temporary_path, "wb") as file:
+                pickle.dump(state, file)
+                write_durably(file)
+            os.replace(temporary_path, self.snapshot_path)
+            open(self.delta_log_path, "wb").close()
+            self.deltas_since_snapshot = 0
+        else:
+            saved_q_table = self.saved_q_table
+            state["changes"] = {
+                key: value
+                for key, value in agent.q_table.items()
+                if saved_q_table.get(key) != value
+            }
+            with open(self.delta_log_path, "ab") as file:
+                pickle.dump(state, file)
+                write_durably(file)
+            self.deltas_since_snapshot += 1
+        self.saved_q_table = dict(agent.q_table)
+
+    def restore(self, agent: QLearningAgent) -> Optional[Tuple[int, float]]:
+        """
+        Restores the last checkpoint into the agent and the random generators.
+
+        Parameters:
+        agent (QLearningAgent): The agent being trained.
+
+        Returns:
+        Optional[Tuple[int, float]]: The number of episodes played and the moving average of the reward, or None if
+                                     there is no checkpoint.
+        """
+        if not os.path.exists(self.snapshot_path):
+            return None
+        with open(self.snapshot_path, "rb") as file:
+            state = pickle.load(file)
+        q_table = state.pop("q_table")
+
+        deltas = 0
+        if os.path.exists(self.delta_log_path):
+            with open(self.delta_log_path, "r+b") as file:
+                end_of_records = 0
+                while True:
+                    try:
+                        record = pickle.load(file)
+                    except (EOFError, pickle.UnpicklingError):
+                        break
+                    end_of_records = file.tell()
+                    # Records older than the snapshot are left over by a crash between the snapshot and the
+                    # emptying of the log.
+                    if record["episode"] <= state["episode"]:
+                        continue
+                    q_table.update(record.pop("changes"))
+                    state = record
+                    deltas += 1
+                file.truncate(end_of_records)
+
+        agent.q_table = q_table
+        agent.alpha = state["alpha"]
+        random.setstate(state["random_state"])
+        np.random.set_state(state["numpy_random_state"])
+        self.saved_q_table = dict(q_table)
+        self.deltas_since_snapshot = deltas
+        return state["episode"], state["average_reward"]
@@ -0,0 +1,69 @@
+import argparse
+import pickle
+
+from game_and_agent import (
+    DenseQTable,
+    canonicalize_q_table,
+    is_q_table_file,
+    read_q_table_file,
+    write_q_table_file,
+)
+
+Q_TABLE_FILE_EXTENSION = ".qtab"
+
+
+def convert_q_table(input_path: str, output_path: str, canonical: bool = False) -> None:
+    """
+    Convert a Q-table between the pickle format and the binary Q-table file format, and optionally into the
+    canonical layout that stores one entry per class of symmetrical state-action pairs.
+
+    The format of the input is detected from its content. The output is written in the binary Q-table file format
+    if output_path ends with '.qtab', and pickled otherwise. A canonical Q-table must be loaded with
+    QLearningAgent(canonical_q_table=True), unless it is a binary Q-table file, which records its layout.
+
+    Parameters:
+    input_path (str): Path to the Q-table to convert.
+    output_path (str): Path of the converted Q-table.
+    canonical (bool): Convert the Q-table into the canonical layout (default: False).
+    """
+    if is_q_table_file(input_path):
+        dense_q_table, is_canonical = read_q_table_file(input_path, mmap_mode="r")
+        q_table = dense_q_table.to_dict()
+    else:
+        with open(input_path, "rb") as file:
+            q_table = pickle.load(file)
+        is_canonical = False
+
+    if canonical and not is_canonical:
+        q_table = canonicalize_q_table(q_table)
+        is_canonical = True
+
+    if output_path.endswith(Q_TABLE_FILE_EXTENSION):
+        write_q_table_file(output_path, DenseQTable.from_dict(q_table), is_canonical)
+    else:
+        with open(output_path, "wb") as file:
+            pickle.dump(q_table, file)
+
+    layout = "canonical" if is_canonical else "full"
+    print(
+        f"Converted {input_path} into {output_path} with {len(q_table)} entries in the {layout} layout."
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Convert a Q-table between the pickle and the binary Q-table file formats."
+    )
+    parser.add_argument("input_path")
+    parser.add_argument(
+        "output_path",
+        help="Path of the converted Q-table. A '.qtab' extension selects the binary Q-table file format.",
+    )
+    parser.add_argument(
+        "--canonical",
+        action="store_true",
+        help="Store one entry per class of symmetrical state-action pairs.",
+    )
+    args = parser.parse_args()
+
+    convert_q_table(args.input_path, args.output_path, args.canonical)
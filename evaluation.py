@@ -0,0 +1,362 @@
+import argparse
+import os
+import random
+import sys
+from dataclasses import dataclass, field
+from multiprocessing import Pool
+from time import perf_counter
+from typing import Dict, List, Tuple
+
+from game_and_agent import QLearningAgent, TicTacToe
+
+# The agent being evaluated and its opponent, loaded once in each worker process by init_worker.
+_agent = None
+_opponent = None
+
+
+@dataclass
+class EvaluationReport:
+    """
+    The aggregated result of evaluation games, from the point of view of the evaluated agent.
+    """
+
+    wins: int = 0
+    draws: int = 0
+    losses: int = 0
+    # The move_record of every game the agent lost.
+    losing_games: List[List[Tuple[int, Tuple[int, int]]]] = field(default_factory=list)
+    elapsed: float = 0.0
+
+    @property
+    def games(self) -> int:
+        return self.wins + self.draws + self.losses
+
+    @property
+    def games_per_second(self) -> float:
+        return self.games / self.elapsed if self.elapsed else 0.0
+
+    def add(self, other: "EvaluationReport") -> None:
+        """
+        Add the counts and the losing games of another report to this one.
+        """
+        self.wins += other.wins
+        self.draws += other.draws
+        self.losses += other.losses
+        self.losing_games.extend(other.losing_games)
+
+    def summary(self) -> str:
+        return (
+            f"Played {self.games} games: {self.wins} wins, {self.draws} draws and {self.losses} losses "
+            f"in {self.elapsed:.2f}s ({self.games_per_second:.1f} games/sec)."
+        )
+
+
+def play_evaluation_game(
+    game: TicTacToe,
+    agent: QLearningAgent,
+    opponent: QLearningAgent,
+    agent_moves_first: bool,
+    opponent_is_learning: bool = True,
+) -> int:
+    """
+    Play one game between the agent, which always takes its best action, and an AI opponent, as in
+    agent_play_with_agent_test_first_mover_agent.py and agent_play_with_agent_test_second_mover_agent.py.
+
+    The opponent takes a winning move whenever it has one. Otherwise it chooses its action in the state seen by
+    itself (1 and 2 swapped). If the agent moves second, the first move of the opponent is random.
+
+    Parameters:
+    game (TicTacToe): The game to play on. It is reset first, and holds the move_record of the game afterwards.
+    agent (QLearningAgent): The agent being evaluated. It plays 1 'X'.
+    opponent (QLearningAgent): The opponent. It plays 2 'O'.
+    agent_moves_first (bool): Whether the agent makes the first move.
+    opponent_is_learning (bool): Whether the opponent explores with its epsilon (default: True).
+
+    Returns:
+    int: 1 if the agent wins, 0 for a draw, -1 if the agent loses.
+    """
+    player1 = 1
+    player2 = 2
+
+    game.reset()
+    if not agent_moves_first:
+        game.make_move(*random.choice(game.get_valid_actions()), player2)
+
+    while True:
+        action = agent.choose_action(
+            game.get_state_key(), game.get_valid_actions(), is_learning=False
+        )
+        game.make_move(*action, player1)
+        if game.check_win(player1):
+            return 1
+        if game.check_draw():
+            return 0
+
+        # The opponent wins if it can.
+        winning_moves = game.winning_moves(player2)
+        if winning_moves:
+            game.make_move(*winning_moves[0], player2)
+            return -1
+
+        opponent_state_key = game.get_state_key().translate(str.maketrans("12", "21"))
+        opponent_action = opponent.choose_action(
+            opponent_state_key, game.get_valid_actions(), is_learning=opponent_is_learning
+        )
+        game.make_move(*opponent_action, player2)
+        if game.check_win(player2):
+            return -1
+        if game.check_draw():
+            return 0
+
+
+@dataclass
+class VerificationResult:
+    """
+    The result of the exhaustive verification of a policy.
+
+    If never_loses is True, the verification is a proof: every game that the agent can reach by taking one of its
+    best actions, against every possible sequence of opponent moves, ends in a win or a draw for the agent.
+    """
+
+    never_loses: bool
+    # The losing games, as move_records, at most max_losing_lines of them.
+    losing_lines: List[List[Tuple[int, Tuple[int, int]]]]
+    # The number of distinct states in which the agent is to move.
+    states_checked: int
+
+
+def verify_policy(
+    agent: QLearningAgent, agent_moves_first: bool, max_losing_lines: int = 100
+) -> VerificationResult:
+    """
+    Verify that the greedy policy of an agent, choose_action(..., is_learning=False), never loses.
+
+    Walks the whole game tree in which the agent takes each of its best actions (so that every way of breaking ties
+    is covered) and the opponent takes every valid move. The subtrees are memoized by the state_key of the states in
+    which the agent is to move.
+
+    Parameters:
+    agent (QLearningAgent): The agent to verify. It plays 1 'X'.
+    agent_moves_first (bool): Whether the agent makes the first move.
+    max_losing_lines (int): The maximum number of losing games to return (default: 100).
+
+    Returns:
+    VerificationResult: Whether the policy never loses, and the losing games otherwise.
+    """
+    player1 = 1
+    player2 = 2
+    game = TicTacToe()
+    # state_key -> (whether the agent can lose from this state, the losing continuations)
+    memo: Dict[str, Tuple[bool, List[List[Tuple[int, Tuple[int, int]]]]]] = {}
+
+    def agent_to_move() -> Tuple[bool, List[List[Tuple[int, Tuple[int, int]]]]]:
+        state_key = game.get_state_key()
+        if state_key in memo:
+            return memo[state_key]
+
+        loses = False
+        lines = []
+        for action in agent.get_best_actions(state_key, game.get_valid_actions()):
+            game.make_move(*action, player1)
+            if not (game.check_win(player1) or game.check_draw()):
+                for reply in game.get_valid_actions():
+                    game.make_move(*reply, player2)
+                    prefix = [(player1, action), (player2, reply)]
+                    if game.check_win(player2):
+                        loses = True
+                        lines.append(prefix)
+                    elif not game.check_draw():
+                        reply_loses, reply_lines = agent_to_move()
+                        loses = loses or reply_loses
+                        lines.extend(
+                            prefix + line
+                            for line in reply_lines[: max_losing_lines - len(lines)]
+                        )
+                    game.withdraw_move(*reply)
+            game.withdraw_move(*action)
+
+        memo[state_key] = (loses, lines[:max_losing_lines])
+        return memo[state_key]
+
+    if agent_moves_first:
+        loses, losing_lines = agent_to_move()
+    else:
+        loses = False
+        losing_lines = []
+        for opening in game.get_valid_actions():
+            game.make_move(*opening, player2)
+            opening_loses, opening_lines = agent_to_move()
+            loses = loses or opening_loses
+            losing_lines.extend(
+                [(player2, opening)] + line
+                for line in opening_lines[: max_losing_lines - len(losing_lines)]
+            )
+            game.withdraw_move(*opening)
+
+    return VerificationResult(
+        never_loses=not loses, losing_lines=losing_lines, states_checked=len(memo)
+    )
+
+
+def init_worker(agent_q_table: str, opponent_q_table: str) -> None:
+    """
+    Load the agent being evaluated and its opponent in a worker process.
+
+    Parameters:
+    agent_q_table (str): Path to the Q-table of the agent being evaluated.
+    opponent_q_table (str): Path to the Q-table of the opponent.
+    """
+    global _agent, _opponent
+    _agent = QLearningAgent(pre_trained_q_table=agent_q_table)
+    _opponent = QLearningAgent(pre_trained_q_table=opponent_q_table)
+
+
+def evaluate_shard(task: Tuple[int, bool, bool, str]) -> EvaluationReport:
+    """
+    Play a shard of the evaluation games in a worker process, with its own random stream.
+
+    Parameters:
+    task (Tuple[int, bool, bool, str]): The number of games, agent_moves_first, opponent_is_learning and the seed
+                                        of the random module.
+
+    Returns:
+    EvaluationReport: The result of the games of the shard.
+    """
+    games, agent_moves_first, opponent_is_learning, seed = task
+    random.seed(seed)
+
+    report = EvaluationReport()
+    game = TicTacToe()
+    for _ in range(games):
+        reward = play_evaluation_game(
+            game, _agent, _opponent, agent_moves_first, opponent_is_learning
+        )
+        if reward == 1:
+            report.wins += 1
+        elif reward == 0:
+            report.draws += 1
+        else:
+            report.losses += 1
+            report.losing_games.append(list(game.move_record))
+    return report
+
+
+def evaluate(
+    agent_q_table: str,
+    opponent_q_table: str,
+    agent_moves_first: bool,
+    games: int = 50000,
+    workers: int = None,
+    shard_size: int = 1000,
+    seed: int = 0,
+    opponent_is_learning: bool = True,
+    verbose: bool = True,
+) -> EvaluationReport:
+    """
+    Evaluate an agent against an opponent by playing games on a pool of worker processes.
+
+    The games are split into shards of shard_size games, and each shard uses its own random stream derived from seed
+    and the shard index, so the result does not depend on the number of workers. The counts are printed as the shards
+    finish, and a lost game does not stop the evaluation.
+
+    Parameters:
+    agent_q_table (str): Path to the Q-table of the agent being evaluated.
+    opponent_q_table (str): Path to the Q-table of the opponent.
+    agent_moves_first (bool): Whether the agent makes the first move.
+    games (int): The number of games to play (default: 50000).
+    workers (int): The number of worker processes (default: None, the number of CPUs).
+    shard_size (int): The number of games in a shard (default: 1000).
+    seed (int): The base seed of the random streams (default: 0).
+    opponent_is_learning (bool): Whether the opponent explores with its epsilon (default: True).
+    verbose (bool): Print the counts as the shards finish (default: True).
+
+    Returns:
+    EvaluationReport: The aggregated result of all the games.
+    """
+    tasks = [
+        (
+            min(shard_size, games - first_game),
+            agent_moves_first,
+            opponent_is_learning,
+            f"{seed}:{shard_index}",
+        )
+        for shard_index, first_game in enumerate(range(0, games, shard_size))
+    ]
+
+    report = EvaluationReport()
+    start = perf_counter()
+    with Pool(
+        workers or os.cpu_count(),
+        initializer=init_worker,
+        initargs=(agent_q_table, opponent_q_table),
+    ) as pool:
+        for shard_report in pool.imap_unordered(evaluate_shard, tasks):
+            report.add(shard_report)
+            report.elapsed = perf_counter() - start
+            if verbose:
+                print(report.summary())
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Evaluate an agent against an AI opponent on a pool of worker processes."
+    )
+    parser.add_argument(
+        "role",
+        choices=["first", "second"],
+        help="Whether the evaluated agent moves first or second.",
+    )
+    parser.add_argument(
+        "--agent-q-table",
+        help="Q-table of the evaluated agent (default: q_table_ubuntu_agent_move_<role>.pkl).",
+    )
+    parser.add_argument(
+        "--opponent-q-table",
+        help="Q-table of the opponent (default: the pre-trained agent of the other role).",
+    )
+    parser.add_argument("--games", type=int, default=50000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--shard-size", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--optimal-opponent",
+        action="store_true",
+        help="The opponent never explores (is_learning=False).",
+    )
+    parser.add_argument(
+        "--exhaustive",
+        action="store_true",
+        help="Verify the agent against every possible opponent move instead of playing random games.",
+    )
+    args = parser.parse_args()
+
+    agent_q_table = args.agent_q_table or f"q_table_ubuntu_agent_move_{args.role}.pkl"
+    if args.exhaustive:
+        start = perf_counter()
+        result = verify_policy(
+            QLearningAgent(pre_trained_q_table=agent_q_table),
+            agent_moves_first=args.role == "first",
+        )
+        print(
+            f"Checked {result.states_checked} states in {perf_counter() - start:.3f}s. "
+            f"The agent {'never loses' if result.never_loses else 'can lose'}."
+        )
+        for move_record in result.losing_lines:
+            print(f"Losing line: {move_record}")
+        sys.exit(0 if result.never_loses else 1)
+
+    other_role = "second" if args.role == "first" else "first"
+    final_report = evaluate(
+        agent_q_table,
+        args.opponent_q_table or f"q_table_ubuntu_agent_move_{other_role}.pkl",
+        agent_moves_first=args.role == "first",
+        games=args.games,
+        workers=args.workers,
+        shard_size=args.shard_size,
+        seed=args.seed,
+        opponent_is_learning=not args.optimal_opponent,
+    )
+    for move_record in final_report.losing_games:
+        print(f"Lost game: {move_record}")
+    sys.exit(1 if final_report.losses else 0)
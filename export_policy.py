@@ -0,0 +1,43 @@
+import argparse
+
+from game_and_agent import PolicyAgent, QLearningAgent
+
+
+def export_policy(q_table_path: str, agent_moves_first: bool, output_path: str) -> None:
+    """
+    Export the best actions of a trained agent in all its reachable states into a policy file for PolicyAgent.
+
+    Parameters:
+    q_table_path (str): Path to the Q-table of the agent.
+    agent_moves_first (bool): Whether the agent makes the first move.
+    output_path (str): Path of the .npy policy file.
+    """
+    agent = QLearningAgent(pre_trained_q_table=q_table_path)
+    policy_agent = PolicyAgent.from_agent(agent, agent_moves_first)
+    policy_agent.save(output_path)
+    print(
+        f"Exported the best actions of {int((policy_agent.best_action_masks != 0).sum())} states to {output_path}."
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Export the policy of a trained agent for O(1) serving."
+    )
+    parser.add_argument("role", choices=["first", "second"])
+    parser.add_argument(
+        "--q-table",
+        help="Q-table of the agent (default: q_table_ubuntu_agent_move_<role>.pkl, whose float64 Q-values keep the "
+        "ties between the best actions of the trained agent).",
+    )
+    parser.add_argument(
+        "--output",
+        help="Path of the policy file (default: policy_agent_move_<role>.npy).",
+    )
+    args = parser.parse_args()
+
+    export_policy(
+        args.q_table or f"q_table_ubuntu_agent_move_{args.role}.pkl",
+        args.role == "first",
+        args.output or f"policy_agent_move_{args.role}.npy",
+    )
@@ -1,25 +1,240 @@
 import numpy as np
+import os
 import random
-from typing import List, Tuple
+import struct
+from functools import lru_cache
+from operator import itemgetter
+from typing import BinaryIO, Callable, Dict, List, Tuple
 
 import pickle
 
 
 INIT_Q_VALUE = 0
 
+# The number of boards, including unreachable ones. The rank of a board is its state_key read as a base-3 number.
+N_STATES = 3**9
+
+# Q-table file format: a 32-byte header (magic, version, flags, number of states, number of actions, padding),
+# then the float64 Q-values and the uint8 visited flags of a DenseQTable, both in C order. All little-endian.
+# Version 1 files hold float32 Q-values, which turn nearly equal Q-values into ties and so change the best actions;
+# they can still be read.
+Q_TABLE_FILE_MAGIC = b"TTTQTAB\0"
+Q_TABLE_FILE_VERSION = 2
+Q_TABLE_FILE_DTYPES = {1: "<f4", 2: "<f8"}
+Q_TABLE_FILE_HEADER = struct.Struct("<8sIIII8x")
+Q_TABLE_FILE_CANONICAL_FLAG = 1
+
+
+# Cell (x, y) of the board is stored in bit 3 * x + y of a player's bitmask.
+CELL_BITS = tuple(1 << cell for cell in range(9))
+FULL_BOARD_MASK = 0b111111111
+
+# The eight lines (3 rows, 3 columns, main diagonal, anti-diagonal) as bitmasks.
+WIN_MASKS = (
+    0b000000111,
+    0b000111000,
+    0b111000000,
+    0b001001001,
+    0b010010010,
+    0b100100100,
+    0b100010001,
+    0b001010100,
+)
+
+# The number of stones of a player on each line is kept in a 2-bit field of one integer, the line counters: bits
+# 2 * line and 2 * line + 1 for the line WIN_MASKS[line]. A stone on a cell adds CELL_LINE_INCREMENTS[cell] to the
+# line counters, i.e. 1 to each line through the cell, and a line is complete when its field is 3, i.e. when both
+# of its bits are set, which LINE_COUNTERS_LOW_BITS tests for all the lines at once.
+CELL_LINE_INCREMENTS = tuple(
+    sum(1 << 2 * line for line, mask in enumerate(WIN_MASKS) if mask & bit)
+    for bit in CELL_BITS
+)
+LINE_COUNTERS_LOW_BITS = sum(1 << 2 * line for line in range(len(WIN_MASKS)))
+
+# LINE_COUNTERS_BY_BITBOARD[bitboard] is the line counters of a player whose stones are `bitboard`.
+LINE_COUNTERS_BY_BITBOARD = tuple(
+    sum(CELL_LINE_INCREMENTS[cell] for cell in range(9) if bitboard & CELL_BITS[cell])
+    for bitboard in range(FULL_BOARD_MASK + 1)
+)
+
+# WINNING_CELLS_BY_BITBOARD[bitboard] is the bitmask of the cells that complete a line of a player whose stones
+# are `bitboard`, i.e. the missing cell of each line on which the player has two stones, empty or not.
+WINNING_CELLS_BY_BITBOARD = tuple(
+    sum(
+        bit
+        for bit in CELL_BITS
+        if any(mask & ~bitboard == bit for mask in WIN_MASKS)
+    )
+    for bitboard in range(FULL_BOARD_MASK + 1)
+)
+
+# VALID_ACTIONS_BY_OCCUPANCY[occupied] is the tuple of empty cells for the occupancy bitmask `occupied`.
+VALID_ACTIONS_BY_OCCUPANCY = tuple(
+    tuple(
+        (cell // 3, cell % 3) for cell in range(9) if not occupied & CELL_BITS[cell]
+    )
+    for occupied in range(FULL_BOARD_MASK + 1)
+)
+
+# ROW_STATE_KEYS[(row1 << 3) | row2] is the 3-char state_key of a row, where row1 and row2 are the
+# 3-bit masks of player 1 and player 2 in that row.
+ROW_STATE_KEYS = tuple(
+    "".join(
+        "1" if row1 >> col & 1 else "2" if row2 >> col & 1 else "0" for col in range(3)
+    )
+    for row1 in range(8)
+    for row2 in range(8)
+)
+
+# The eight symmetries of the board: identity, rotations by 90, 180 and 270 degrees counter-clockwise,
+# left-right flip, up-down flip, flip about the 45-degree line (axillary diagonal) and flip about the
+# 135-degree line (main diagonal). SYMMETRY_PERMUTATIONS[t][cell] is the cell of the original board that
+# is moved to `cell` by the transformation t.
+_CELLS = np.arange(9).reshape((3, 3))
+SYMMETRY_PERMUTATIONS = tuple(
+    tuple(int(cell) for cell in transformed_cells.flatten())
+    for transformed_cells in (
+        _CELLS,
+        np.rot90(_CELLS),
+        np.rot90(_CELLS, 2),
+        np.rot90(_CELLS, 3),
+        np.fliplr(_CELLS),
+        np.flipud(_CELLS),
+        np.fliplr(np.rot90(_CELLS)),
+        np.fliplr(np.rot90(_CELLS, 3)),
+    )
+)
+
+# SYMMETRY_STATE_KEY_GETTERS[t](state_key) returns the characters of the state_key transformed by t.
+SYMMETRY_STATE_KEY_GETTERS = tuple(
+    itemgetter(*permutation) for permutation in SYMMETRY_PERMUTATIONS
+)
+
+# SYMMETRY_ACTIONS[t][cell] is the action that the action on `cell` is moved to by the transformation t.
+SYMMETRY_ACTIONS = tuple(
+    tuple(divmod(permutation.index(cell), 3) for cell in range(9))
+    for permutation in SYMMETRY_PERMUTATIONS
+)
+
+# The same tables in array form, for boards stored as arrays of shape (N, 9) of cells.
+# WIN_LINES[l] are the 3 cells of the line l, RANK_POWERS the place values of the cells in the base-3 rank.
+# SYMMETRY_CELLS[t, cell] is the cell that `cell` is moved to by the transformation t, and
+# SYMMETRY_RANKS[rank, t] is the rank of the board of rank `rank` transformed by t.
+WIN_LINES = np.array(
+    [[cell for cell in range(9) if mask >> cell & 1] for mask in WIN_MASKS]
+)
+RANK_POWERS = 3 ** np.arange(8, -1, -1)
+SYMMETRY_CELLS = np.array(
+    [[3 * x + y for x, y in transformed_actions] for transformed_actions in SYMMETRY_ACTIONS]
+)
+SYMMETRY_RANKS = (
+    (np.arange(N_STATES)[:, None] // RANK_POWERS % 3)[:, SYMMETRY_PERMUTATIONS]
+    @ RANK_POWERS
+)
+
+
+@lru_cache(maxsize=None)
+def canonical_state_action(
+    state_key: str, action: Tuple[int, int]
+) -> Tuple[str, Tuple[int, int]]:
+    """
+    Returns the canonical representative of the symmetry class of a state-action pair.
+
+    The representative is the smallest of the 8 symmetrical state-action pairs, so all the pairs of one
+    class share it. The result is cached because there are only a few thousand reachable pairs.
+
+    Parameters:
+    state_key (str): A string representing the state of the game.
+    action (Tuple[int, int]): A tuple representing the coordinates of the action.
+
+    Returns:
+    Tuple[str, Tuple[int, int]]: The canonical state-action pair.
+    """
+    cell = 3 * action[0] + action[1]
+    return min(
+        ("".join(transform_state_key(state_key)), transformed_actions[cell])
+        for transform_state_key, transformed_actions in zip(
+            SYMMETRY_STATE_KEY_GETTERS, SYMMETRY_ACTIONS
+        )
+    )
+
+
+def canonicalize_q_table(
+    q_table: Dict[Tuple[str, Tuple[int, int]], float]
+) -> Dict[Tuple[str, Tuple[int, int]], float]:
+    """
+    Converts a Q-table that stores all symmetrical state-action pairs into a Q-table that stores only the
+    canonical pair of each symmetry class.
+
+    If a class has several entries, the value stored at the canonical pair itself is kept.
+
+    Parameters:
+    q_table (Dict[Tuple[str, Tuple[int, int]], float]): A Q-table in the full layout.
+
+    Returns:
+    Dict[Tuple[str, Tuple[int, int]], float]: The Q-table in the canonical layout.
+    """
+    canonical_q_table = {}
+    for (state_key, action), value in q_table.items():
+        action = (int(action[0]), int(action[1]))
+        canonical_pair = canonical_state_action(state_key, action)
+        if canonical_pair == (state_key, action) or canonical_pair not in canonical_q_table:
+            canonical_q_table[canonical_pair] = value
+    return canonical_q_table
+
 
 class TicTacToe:
     """
     A class for the Tic Tac Toe game.
+
+    Each player's stones are stored as a 9-bit integer bitmask (bit 3 * x + y for cell (x, y)), so that
+    moves, win checks and draw checks are a few integer operations instead of NumPy array operations.
+    The NumPy view of the board is still available through the `board` property.
+
+    The number of stones of each player on each line is also kept up to date by make_move and withdraw_move, in
+    the line counters (see CELL_LINE_INCREMENTS), so that check_win is a single test instead of a scan of the
+    lines. Code that assigns the bitboards must rebuild the line counters with update_line_counters.
     """
 
     def __init__(self) -> None:
         """
-        Initializes the board as a 3x3 matrix of zeros.
+        Initializes an empty board.
         """
-        self.board = np.zeros((3, 3), dtype=int)
+        # bitboards[player] is the bitmask of the stones of player 1 or 2. Index 0 is unused.
+        self.bitboards = [0, 0, 0]
+        # line_counters[player] is the line counters of player 1 or 2. Index 0 is unused.
+        self.line_counters = [0, 0, 0]
         self.move_record = []
 
+    @property
+    def board(self) -> np.ndarray:
+        """
+        A 3x3 NumPy array representing the board (1 for 'X', 2 for 'O', 0 for empty).
+
+        The array is built from the bitboards on every access, so modifying it does not change the game.
+        Assign a new array to this property (or use set_board) instead.
+        """
+        return self.state_key_to_board(self.get_state_key())
+
+    @board.setter
+    def board(self, board: np.ndarray) -> None:
+        bitboards = [0, 0, 0]
+        for cell, value in enumerate(np.asarray(board).flatten()):
+            if value:
+                bitboards[int(value)] |= CELL_BITS[cell]
+        self.bitboards = bitboards
+        self.update_line_counters()
+
+    def update_line_counters(self) -> None:
+        """
+        Rebuilds the line counters from the bitboards.
+        """
+        self.line_counters = [
+            0,
+            LINE_COUNTERS_BY_BITBOARD[self.bitboards[1]],
+            LINE_COUNTERS_BY_BITBOARD[self.bitboards[2]],
+        ]
+
     def is_valid_move(self, x: int, y: int) -> bool:
         """
         Checks if the given move is valid or not.
@@ -31,7 +246,7 @@ class TicTacToe:
         Returns:
         bool: True if the move is valid, False otherwise.
         """
-        return self.board[x, y] == 0
+        return not (self.bitboards[1] | self.bitboards[2]) & CELL_BITS[3 * x + y]
 
     def make_move(self, x: int, y: int, player: int) -> bool:
         """
@@ -45,11 +260,14 @@ class TicTacToe:
         Returns:
         bool: True if the move is made, False otherwise.
         """
-        if self.is_valid_move(x, y):
-            self.board[x, y] = player
-            self.move_record.append((player, (x, y)))
-            return True
-        return False
+        cell = 3 * x + y
+        bit = CELL_BITS[cell]
+        if (self.bitboards[1] | self.bitboards[2]) & bit:
+            return False
+        self.bitboards[player] |= bit
+        self.line_counters[player] += CELL_LINE_INCREMENTS[cell]
+        self.move_record.append((player, (x, y)))
+        return True
 
     def withdraw_move(self, x: int, y: int) -> bool:
         """
@@ -62,11 +280,18 @@ class TicTacToe:
         Returns:
         bool: True if the move is withdrawn, False otherwise.
         """
-        if not self.is_valid_move(x, y):
-            self.board[x, y] = 0
-            self.move_record.pop()
-            return True
-        return False
+        cell = 3 * x + y
+        bit = CELL_BITS[cell]
+        if self.bitboards[1] & bit:
+            player = 1
+        elif self.bitboards[2] & bit:
+            player = 2
+        else:
+            return False
+        self.bitboards[player] ^= bit
+        self.line_counters[player] -= CELL_LINE_INCREMENTS[cell]
+        self.move_record.pop()
+        return True
 
     def check_win(self, player: int) -> bool:
         """
@@ -78,17 +303,8 @@ class TicTacToe:
         Returns:
         bool: True if the player has won, False otherwise.
         """
-        for row in range(3):
-            if np.all(self.board[row, :] == player):
-                return True
-        for col in range(3):
-            if np.all(self.board[:, col] == player):
-                return True
-        if np.all(np.diag(self.board) == player):
-            return True
-        if np.all(np.diag(np.fliplr(self.board)) == player):
-            return True
-        return False
+        line_counters = self.line_counters[player]
+        return line_counters & (line_counters >> 1) & LINE_COUNTERS_LOW_BITS != 0
 
     def check_draw(self) -> bool:
         """
@@ -97,13 +313,14 @@ class TicTacToe:
         Returns:
         bool: True if the game is drawn, False otherwise.
         """
-        return np.all(self.board != 0)
+        return self.bitboards[1] | self.bitboards[2] == FULL_BOARD_MASK
 
     def reset(self) -> None:
         """
         Resets the board to initial state.
         """
-        self.board.fill(0)
+        self.bitboards = [0, 0, 0]
+        self.line_counters = [0, 0, 0]
         self.move_record = []
 
     def get_state_key(self) -> str:
@@ -113,7 +330,12 @@ class TicTacToe:
         Returns:
         str: A string representing the current state of the board.
         """
-        return self.board_to_state_key(self.board)
+        _, bitboard1, bitboard2 = self.bitboards
+        return (
+            ROW_STATE_KEYS[(bitboard1 & 7) << 3 | bitboard2 & 7]
+            + ROW_STATE_KEYS[(bitboard1 >> 3 & 7) << 3 | bitboard2 >> 3 & 7]
+            + ROW_STATE_KEYS[(bitboard1 >> 6) << 3 | bitboard2 >> 6]
+        )
 
     def get_valid_actions(self) -> list:
         """
@@ -122,7 +344,39 @@ class TicTacToe:
         Returns:
         list: A list of tuples containing valid move coordinates.
         """
-        return [(x, y) for x in range(3) for y in range(3) if self.is_valid_move(x, y)]
+        return list(
+            VALID_ACTIONS_BY_OCCUPANCY[self.bitboards[1] | self.bitboards[2]]
+        )
+
+    def winning_moves(self, player: int) -> list:
+        """
+        Returns the moves that make the given player win at once, i.e. complete one of their lines, without
+        trying them on the board.
+
+        Parameters:
+        player (int): The player, can be 1 or 2.
+
+        Returns:
+        list: A list of tuples containing the move coordinates, in the order of get_valid_actions.
+        """
+        bitboards = self.bitboards
+        cells = WINNING_CELLS_BY_BITBOARD[bitboards[player]] & ~(bitboards[1] | bitboards[2])
+        if not cells:
+            return []
+        return list(VALID_ACTIONS_BY_OCCUPANCY[FULL_BOARD_MASK ^ cells])
+
+    def blocking_moves(self, player: int) -> list:
+        """
+        Returns the moves of the given player that block an immediate win of the opponent, i.e. the winning moves
+        of the opponent.
+
+        Parameters:
+        player (int): The player, can be 1 or 2.
+
+        Returns:
+        list: A list of tuples containing the move coordinates, in the order of get_valid_actions.
+        """
+        return self.winning_moves(3 - player)
 
     def get_board(self) -> np.ndarray:
         """
@@ -149,8 +403,12 @@ class TicTacToe:
         Parameters:
         board (str): A state_key string of length 9 representing the board.
         """
-        board_array = self.state_key_to_board(state_key)
-        self.board = board_array
+        bitboards = [0, 0, 0]
+        for cell, value in enumerate(state_key):
+            if value != "0":
+                bitboards[int(value)] |= CELL_BITS[cell]
+        self.bitboards = bitboards
+        self.update_line_counters()
 
     @staticmethod
     def state_key_to_board(state_key: str) -> np.ndarray:
@@ -182,6 +440,402 @@ class TicTacToe:
         return "".join(map(str, board.flatten()))
 
 
+class VecTicTacToe:
+    """
+    A class for N Tic Tac Toe games played in lockstep.
+
+    The boards are stored in one NumPy array of shape (N, 9), where the cell (x, y) of a board is the column
+    3 * x + y, so that moves, win checks and draw checks are applied to all the games in one vectorized pass.
+    Actions are flat cell indices.
+    """
+
+    def __init__(self, n_games: int) -> None:
+        """
+        Initializes N empty boards.
+
+        Parameters:
+        n_games (int): The number of games N.
+        """
+        self.n_games = n_games
+        self.boards = np.zeros((n_games, 9), dtype=np.int8)
+
+    def reset(self, mask: np.ndarray = None) -> None:
+        """
+        Resets boards to initial state.
+
+        Parameters:
+        mask (np.ndarray): A bool array of shape (N,), True for the boards to reset (default: None, all boards).
+        """
+        if mask is None:
+            self.boards.fill(0)
+        else:
+            self.boards[mask] = 0
+
+    def get_valid_mask(self) -> np.ndarray:
+        """
+        Returns a bool array of shape (N, 9), True for the empty cells.
+        """
+        return self.boards == 0
+
+    def get_random_valid_cells(self) -> np.ndarray:
+        """
+        Returns a random empty cell of each board, chosen with the global NumPy random generator.
+        """
+        return (np.random.random(self.boards.shape) * self.get_valid_mask()).argmax(
+            axis=1
+        )
+
+    def get_ranks(self, swap_players: bool = False) -> np.ndarray:
+        """
+        Returns the base-3 ranks of the boards, int(state_key, 3) for each board.
+
+        Parameters:
+        swap_players (bool): Swap 1 and 2 before ranking, to get the states seen by player 2 (default: False).
+
+        Returns:
+        np.ndarray: An int array of shape (N,).
+        """
+        boards = self.boards
+        if swap_players:
+            boards = np.where(boards == 0, 0, 3 - boards)
+        return boards @ RANK_POWERS
+
+    def check_wins(self, player: int) -> np.ndarray:
+        """
+        Checks which boards the given player has won.
+
+        Parameters:
+        player (int): The player who wins is to be checked, can be 1 or 2.
+
+        Returns:
+        np.ndarray: A bool array of shape (N,).
+        """
+        return (self.boards[:, WIN_LINES] == player).all(axis=2).any(axis=1)
+
+    def check_draws(self) -> np.ndarray:
+        """
+        Checks which boards are full.
+
+        Returns:
+        np.ndarray: A bool array of shape (N,).
+        """
+        return (self.boards != 0).all(axis=1)
+
+    def get_winning_cells(self, player: int) -> np.ndarray:
+        """
+        Returns, for each board, the first empty cell (in row-major order) that makes the given player win,
+        or -1 if there is none.
+
+        Parameters:
+        player (int): The player, can be 1 or 2.
+
+        Returns:
+        np.ndarray: An int array of shape (N,).
+        """
+        lines = self.boards[:, WIN_LINES]
+        threats = ((lines == player).sum(axis=2) == 2) & (lines == 0).any(axis=2)
+        empty_cells = WIN_LINES[np.arange(8), (lines == 0).argmax(axis=2)]
+
+        winning_mask = np.zeros((self.n_games, 9), dtype=bool)
+        games, line_indices = np.nonzero(threats)
+        winning_mask[games, empty_cells[games, line_indices]] = True
+        return np.where(winning_mask.any(axis=1), winning_mask.argmax(axis=1), -1)
+
+    def step(
+        self, cells: np.ndarray, player: int, active: np.ndarray = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Makes one move in each active game, checks the games for a win of the player or a draw, and resets the
+        games that are finished.
+
+        Parameters:
+        cells (np.ndarray): An int array of shape (N,) with the cell of the move in each game.
+        player (int): The player making the moves, can be 1 or 2.
+        active (np.ndarray): A bool array of shape (N,), True for the games that make a move
+                             (default: None, all games).
+
+        Returns:
+        Tuple[np.ndarray, np.ndarray]: Bool arrays of shape (N,), True for the games won by the player and for
+                                       the games that are drawn.
+        """
+        games = np.arange(self.n_games) if active is None else np.flatnonzero(active)
+        self.boards[games, cells[games]] = player
+
+        wins = np.zeros(self.n_games, dtype=bool)
+        draws = np.zeros(self.n_games, dtype=bool)
+        wins[games] = self.check_wins(player)[games]
+        draws[games] = self.check_draws()[games] & ~wins[games]
+        self.reset(wins | draws)
+        return wins, draws
+
+
+class DenseQTable:
+    """
+    A Q-table stored as a preallocated float64 array of shape (3**9, 9).
+
+    The row of a state is the base-3 rank of its state_key, int(state_key, 3), and the column of an action (x, y)
+    is the flat cell index 3 * x + y. It supports the dict operations that QLearningAgent uses on a Q-table, so it
+    can replace the dict behind get_q_value and set_q_value. A boolean array records which entries have been set,
+    so that the table can be exported back to the dict format.
+    """
+
+    def __init__(
+        self, values: np.ndarray = None, visited: np.ndarray = None
+    ) -> None:
+        """
+        Initializes an empty Q-table, or wraps existing arrays.
+
+        Parameters:
+        values (np.ndarray): A float64 array of shape (3**9, 9) with the Q-values (default: None).
+        visited (np.ndarray): A bool array of shape (3**9, 9), True for the entries that have been set
+                              (default: None).
+        """
+        if values is None:
+            values = np.full((N_STATES, 9), INIT_Q_VALUE, dtype=np.float64)
+        if visited is None:
+            visited = np.zeros((N_STATES, 9), dtype=bool)
+        self.values = values
+        self.visited = visited
+
+    @classmethod
+    def from_dict(
+        cls, q_table: Dict[Tuple[str, Tuple[int, int]], float]
+    ) -> "DenseQTable":
+        """
+        Builds a dense Q-table from a Q-table in the dict format.
+
+        Parameters:
+        q_table (Dict[Tuple[str, Tuple[int, int]], float]): A Q-table in the dict format.
+
+        Returns:
+        DenseQTable: The dense Q-table.
+        """
+        dense_q_table = cls()
+        for key, value in q_table.items():
+            dense_q_table[key] = value
+        return dense_q_table
+
+    def to_dict(self) -> Dict[Tuple[str, Tuple[int, int]], float]:
+        """
+        Exports the entries that have been set into the dict format.
+
+        Returns:
+        Dict[Tuple[str, Tuple[int, int]], float]: The Q-table in the dict format.
+        """
+        return dict(self.items())
+
+    def get(self, key: Tuple[str, Tuple[int, int]], default: float = None) -> float:
+        state_key, (x, y) = key
+        rank = int(state_key, 3)
+        cell = 3 * x + y
+        if self.visited.item(rank, cell):
+            return self.values.item(rank, cell)
+        return default
+
+    def __getitem__(self, key: Tuple[str, Tuple[int, int]]) -> float:
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: Tuple[str, Tuple[int, int]], value: float) -> None:
+        state_key, (x, y) = key
+        rank = int(state_key, 3)
+        cell = 3 * x + y
+        self.values[rank, cell] = value
+        self.visited[rank, cell] = True
+
+    def __contains__(self, key: Tuple[str, Tuple[int, int]]) -> bool:
+        return self.get(key) is not None
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self.visited))
+
+    def items(self):
+        ranks, cells = np.nonzero(self.visited)
+        for rank, cell, value in zip(
+            ranks.tolist(), cells.tolist(), self.values[ranks, cells].tolist()
+        ):
+            yield (np.base_repr(rank, 3).zfill(9), divmod(cell, 3)), value
+
+    def keys(self):
+        for key, _ in self.items():
+            yield key
+
+    def q_values(
+        self, state_key: str, actions: List[Tuple[int, int]]
+    ) -> List[float]:
+        """
+        Returns the Q-values of some actions in one state. Entries that have not been set hold INIT_Q_VALUE.
+
+        The row of the state is copied into a list first: for 9 values, indexing a list is much cheaper than
+        NumPy fancy indexing.
+
+        Parameters:
+        state_key (str): A string representing the state of the game.
+        actions (List[Tuple[int, int]]): A list of actions.
+
+        Returns:
+        List[float]: The Q-values of the actions, in the same order.
+        """
+        row = self.values[int(state_key, 3)].tolist()
+        return [row[3 * x + y] for x, y in actions]
+
+    def set_symmetrical(
+        self, state_key: str, action: Tuple[int, int], value: float
+    ) -> None:
+        """
+        Sets the Q-value of the 8 symmetrical state-action pairs of a state-action pair, with one fancy-index
+        assignment through SYMMETRY_RANKS and SYMMETRY_CELLS, as QLearningAgent.learn_batch does for a batch.
+
+        Parameters:
+        state_key (str): A string representing the state of the game.
+        action (Tuple[int, int]): A tuple representing the coordinates of the action.
+        value (float): The new Q-value of the symmetrical state-action pairs.
+        """
+        cell = 3 * action[0] + action[1]
+        if state_key[cell] != "0":
+            raise Exception(
+                f"The action {action} is not valid for the state key {state_key}."
+            )
+        ranks = SYMMETRY_RANKS[int(state_key, 3)]
+        cells = SYMMETRY_CELLS[:, cell]
+        self.values[ranks, cells] = value
+        self.visited[ranks, cells] = True
+
+    def best_actions(
+        self, state_key: str, valid_actions: List[Tuple[int, int]]
+    ) -> List[Tuple[int, int]]:
+        """
+        Returns the valid actions with the maximum Q-value in the row of the state.
+
+        Parameters:
+        state_key (str): A string representing the state of the game.
+        valid_actions (List[Tuple[int, int]]): A list of valid actions.
+
+        Returns:
+        List[Tuple[int, int]]: The best actions, in the order of valid_actions.
+        """
+        q_values = self.q_values(state_key, valid_actions)
+        max_q_value = max(q_values)
+        return [
+            action
+            for action, q_value in zip(valid_actions, q_values)
+            if q_value == max_q_value
+        ]
+
+
+def is_q_table_file(path: str) -> bool:
+    """
+    Checks if a file is in the binary Q-table file format (rather than a pickle).
+
+    Parameters:
+    path (str): Path to the file.
+
+    Returns:
+    bool: True if the file starts with the magic of the Q-table file format.
+    """
+    with open(path, "rb") as file:
+        return file.read(len(Q_TABLE_FILE_MAGIC)) == Q_TABLE_FILE_MAGIC
+
+
+def write_file_atomically(path: str, write: Callable[[BinaryIO], None]) -> None:
+    """
+    Writes a file under a temporary name next to it, then renames it over the file. The Q-table files and the
+    policies are memory-mapped by the web app, and truncating a mapped file in place makes the next read of the
+    mapping crash the process with SIGBUS, while a rename leaves the old file mapped until it is unmapped.
+
+    Parameters:
+    path (str): Path of the file.
+    write (Callable[[BinaryIO], None]): Writes the content into the open temporary file.
+    """
+    temporary_path = f"{path}.tmp"
+    try:
+        with open(temporary_path, "wb") as file:
+            write(file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary_path, path)
+    finally:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+
+
+def write_q_table_file(
+    path: str, q_table: DenseQTable, canonical: bool = False
+) -> None:
+    """
+    Writes a dense Q-table into the binary Q-table file format.
+
+    Parameters:
+    path (str): Path of the file.
+    q_table (DenseQTable): The Q-table to write.
+    canonical (bool): Whether the Q-table stores only canonical state-action pairs (default: False).
+    """
+    flags = Q_TABLE_FILE_CANONICAL_FLAG if canonical else 0
+
+    def write(file: BinaryIO) -> None:
+        file.write(
+            Q_TABLE_FILE_HEADER.pack(
+                Q_TABLE_FILE_MAGIC, Q_TABLE_FILE_VERSION, flags, N_STATES, 9
+            )
+        )
+        values_dtype = Q_TABLE_FILE_DTYPES[Q_TABLE_FILE_VERSION]
+        file.write(np.ascontiguousarray(q_table.values, dtype=values_dtype).tobytes())
+        file.write(np.ascontiguousarray(q_table.visited, dtype=np.uint8).tobytes())
+
+    # A file that is being served is replaced, never overwritten in place.
+    write_file_atomically(path, write)
+
+
+def read_q_table_file(path: str, mmap_mode: str = "c") -> Tuple[DenseQTable, bool]:
+    """
+    Memory-maps a file in the binary Q-table file format.
+
+    With the default copy-on-write mode, the pages are shared by all the processes that map the same file until
+    a process writes into them, and writes are never saved to the file.
+
+    Parameters:
+    path (str): Path of the file.
+    mmap_mode (str): The mode of np.memmap, 'r' for read-only or 'c' for copy-on-write (default: 'c').
+
+    Returns:
+    Tuple[DenseQTable, bool]: The Q-table and whether it stores only canonical state-action pairs.
+    """
+    with open(path, "rb") as file:
+        header = file.read(Q_TABLE_FILE_HEADER.size)
+    if len(header) < Q_TABLE_FILE_HEADER.size:
+        raise ValueError(f"{path} is not a Q-table file.")
+    magic, version, flags, n_states, n_actions = Q_TABLE_FILE_HEADER.unpack(header)
+    if magic != Q_TABLE_FILE_MAGIC:
+        raise ValueError(f"{path} is not a Q-table file.")
+    if version not in Q_TABLE_FILE_DTYPES or (n_states, n_actions) != (N_STATES, 9):
+        raise ValueError(
+            f"{path} has version {version} and shape {(n_states, n_actions)}, "
+            f"expected version {Q_TABLE_FILE_VERSION} and shape {(N_STATES, 9)}."
+        )
+
+    shape = (n_states, n_actions)
+    values = np.memmap(
+        path,
+        dtype=Q_TABLE_FILE_DTYPES[version],
+        mode=mmap_mode,
+        offset=Q_TABLE_FILE_HEADER.size,
+        shape=shape,
+    )
+    visited = np.memmap(
+        path,
+        dtype=np.bool_,
+        mode=mmap_mode,
+        offset=Q_TABLE_FILE_HEADER.size + values.nbytes,
+        shape=shape,
+    )
+    return (
+        DenseQTable(values, visited),
+        bool(flags & Q_TABLE_FILE_CANONICAL_FLAG),
+    )
+
+
 class QLearningAgent:
     """
     A class for a Q-learning agent that learns to play a game using the Q-learning algorithm.
@@ -193,6 +847,8 @@ class QLearningAgent:
         gamma: float = 1,
         epsilon: float = 0.1,
         pre_trained_q_table: str = "",
+        canonical_q_table: bool = False,
+        dense_q_table: bool = False,
     ) -> None:
         """
         Initializes the Q-learning agent.
@@ -201,16 +857,37 @@ class QLearningAgent:
         alpha (float): Learning rate (default: 0.1)
         gamma (float): Discount factor (default: 1)
         epsilon (float): Exploration rate (default: 0.1)
-        pre_trained_q_table (str): Path to a pre-trained Q-table (default: '')
+        pre_trained_q_table (str): Path to a pre-trained Q-table, either a pickled dict or a file in the binary
+                                   Q-table file format (default: ''). A binary Q-table file is memory-mapped
+                                   copy-on-write into a DenseQTable instead of being deserialized.
+        canonical_q_table (bool): Store only the canonical pair of each class of symmetrical state-action pairs
+                                  (default: False). A pre-trained Q-table in the full layout is converted on load.
+                                  A binary Q-table file with the canonical flag always uses this layout.
+        dense_q_table (bool): Store the Q-table in a DenseQTable instead of a dict (default: False).
 
         """
         self.alpha = alpha
         self.gamma = gamma
         self.epsilon = epsilon
-
-        if pre_trained_q_table:
+        self.canonical_q_table = canonical_q_table
+
+        if pre_trained_q_table and is_q_table_file(pre_trained_q_table):
+            self.q_table, is_canonical = read_q_table_file(pre_trained_q_table)
+            if is_canonical:
+                self.canonical_q_table = True
+            elif canonical_q_table:
+                self.q_table = DenseQTable.from_dict(
+                    canonicalize_q_table(self.q_table.to_dict())
+                )
+        elif pre_trained_q_table:
             with open(pre_trained_q_table, "rb") as file:
                 self.q_table = pickle.load(file)
+            if canonical_q_table:
+                self.q_table = canonicalize_q_table(self.q_table)
+            if dense_q_table:
+                self.q_table = DenseQTable.from_dict(self.q_table)
+        elif dense_q_table:
+            self.q_table = DenseQTable()
         else:
             self.q_table = {}
 
@@ -225,6 +902,10 @@ class QLearningAgent:
         Returns:
         float: The Q-value for the given state-action pair.
         """
+        if self.canonical_q_table:
+            return self.q_table.get(
+                canonical_state_action(state_key, action), INIT_Q_VALUE
+            )
         return self.q_table.get((state_key, action), INIT_Q_VALUE)
 
     def set_q_value(
@@ -238,7 +919,10 @@ class QLearningAgent:
         action (Tuple[int, int]): A tuple representing the coordinates of the action.
         value (float): The new Q-value for the given state-action pair.
         """
-        self.q_table[(state_key, action)] = value
+        if self.canonical_q_table:
+            self.q_table[canonical_state_action(state_key, action)] = value
+        else:
+            self.q_table[(state_key, action)] = value
 
     def get_symmetrical_state_action_pairs(
         self, state_key: str, action: Tuple[int, int]
@@ -257,6 +941,9 @@ class QLearningAgent:
         Our algorithm to drop duplicate seems expensive.
         So we choose not to drop duplicates, which should be more efficient.
 
+        The transformations are the fixed cell permutations in SYMMETRY_PERMUTATIONS, so each pair is a pure
+        index remap of the state_key and the action.
+
         Parameters:
         state_key (str): A string representing the current state of the board.
         action (Tuple[int, int]): a tuple representing the action to be taken.
@@ -265,84 +952,51 @@ class QLearningAgent:
         List[Tuple[str, Tuple[int, int]]]: A list of symmetrical state-action pair.
         """
 
-        # Initialize a temp game object
-        game = TicTacToe()
-        game.set_board_by_state_key(state_key)
-        valid_move = game.make_move(*action, 1)
-        if not valid_move:  # AI agent always use 1 'X'.
+        cell = 3 * action[0] + action[1]
+        if state_key[cell] != "0":
             raise Exception(
                 f"The action {action} is not valid for the state key {state_key}."
             )
 
-        # Convert the state_key to a 3x3 NumPy array
-        board = game.board
-
-        # Generate all possible symmetrical states and their transformations
-        symmetrical_states_for_next_state_key = {
-            ("identity", 1): board,
-            # [[0 1 2]
-            # [3 4 5]
-            # [6 7 8]]
-            ("rotate", 1): np.rot90(board),  # 90 degrees counter-clockwise rotation
-            # e.g.
-            # [[2 5 8]
-            # [1 4 7]
-            # [0 3 6]]
-            ("rotate", 2): np.rot90(board, 2),  # 180 degrees counter-clockwise rotation
-            ("rotate", 3): np.rot90(board, 3),  # 270 degrees counter-clockwise rotation
-            ("flip_lr", 1): np.fliplr(board),  # Left-right flip
-            ("flip_ud", 1): np.flipud(board),  # Up-down flip
-            ("flip_45", 1): np.fliplr(
-                np.rot90(board)
-            ),  # Flip about the 45-degree line (axillary diagonal axis of the matrix)
-            # e.g.
-            # [[8 5 2]
-            #  [7 4 1]
-            #  [6 3 0]]
-            ("flip_135", 1): np.fliplr(
-                np.rot90(board, 3)
-            )  # Flip about the 135-degree line (main diagonal axis of the matrix)
-            # e.g.
-            #  [[0 3 6]
-            #  [1 4 7]
-            #  [2 5 8]]
-        }
-
-        board = TicTacToe.state_key_to_board(state_key)
-
-        symmetrical_states_for_state_key = {
-            ("identity", 1): board,
-            ("rotate", 1): np.rot90(board),  # 90 degrees counter-clockwise rotation
-            ("rotate", 2): np.rot90(board, 2),  # 180 degrees counter-clockwise rotation
-            ("rotate", 3): np.rot90(board, 3),  # 270 degrees counter-clockwise rotation
-            ("flip_lr", 1): np.fliplr(board),  # Left-right flip
-            ("flip_ud", 1): np.flipud(board),  # Up-down flip
-            ("flip_45", 1): np.fliplr(
-                np.rot90(board)
-            ),  # Flip about the 45-degree line (axillary diagonal axis of the matrix)
-            ("flip_135", 1): np.fliplr(
-                np.rot90(board, 3)
-            ),  # Flip about the 135-degree line (main diagonal axis of the matrix)
-        }
-
-        symmetrical_state_actions = []
-        for transformation in symmetrical_states_for_state_key.keys():
-            this_step_board = symmetrical_states_for_state_key[transformation]
-            next_step_board = symmetrical_states_for_next_state_key[transformation]
-
-            move = next_step_board - this_step_board
-            row, col = np.nonzero(move)
-            symmetrical_action = (row[0], col[0])
-            symmetrical_state_actions.append(
-                (
-                    TicTacToe.board_to_state_key(
-                        symmetrical_states_for_state_key[transformation]
-                    ),
-                    symmetrical_action,
-                )
+        return [
+            ("".join(transform_state_key(state_key)), transformed_actions[cell])
+            for transform_state_key, transformed_actions in zip(
+                SYMMETRY_STATE_KEY_GETTERS, SYMMETRY_ACTIONS
             )
+        ]
+
+    def get_best_actions(
+        self, state_key: str, valid_actions: List[Tuple[int, int]]
+    ) -> List[Tuple[int, int]]:
+        """
+        Returns the valid actions with the maximum Q-value, i.e. the actions the agent chooses from when it does not
+        explore.
+
+        Parameters:
+        state_key (str): A string representing the state of the game.
+        valid_actions (List[Tuple[int, int]]): A list of valid actions.
+
+        Returns:
+        List[Tuple[int, int]]: The best actions, in the order of valid_actions.
+        """
+
+        # all the symmetric states is actually one state. We don't need to choose the max_q_value among the symmetric
+        # states, because they should share the same q_values.
+
+        if isinstance(self.q_table, DenseQTable) and not self.canonical_q_table:
+            return self.q_table.best_actions(state_key, valid_actions)
 
-        return symmetrical_state_actions
+        q_values = [self.get_q_value(state_key, action) for action in valid_actions]
+
+        max_q_value = -np.inf
+        best_actions = []
+        for action, q_value in zip(valid_actions, q_values):
+            if q_value > max_q_value:
+                max_q_value = q_value
+                best_actions = [action]
+            elif q_value == max_q_value:
+                best_actions.append(action)
+        return best_actions
 
     def choose_action(
         self,
@@ -366,20 +1020,7 @@ class QLearningAgent:
         if is_learning and random.random() < self.epsilon:
             return random.choice(valid_actions)
 
-        # all the symmetric states is actually one state. We don't need to choose the max_q_value among the symmetric
-        # states, because they should share the same q_values.
-
-        q_values = [self.get_q_value(state_key, action) for action in valid_actions]
-
-        max_q_value = -np.inf
-        best_actions = []
-        for action, q_value in zip(valid_actions, q_values):
-            if q_value > max_q_value:
-                max_q_value = q_value
-                best_actions = [action]
-            elif q_value == max_q_value:
-                best_actions.append(action)
-        return random.choice(best_actions)
+        return random.choice(self.get_best_actions(state_key, valid_actions))
 
     def learn(
         self,
@@ -412,24 +1053,484 @@ class QLearningAgent:
         # If state_key is the terminal state (win, lose, or draw), the next_valid_actions will be [],
         # so the next_max_q_value is 0 (by definition of the terminal states values). Then, We update the Q value by
         # Q(s, a) ← Q(s, a) + α[r - Q(s, a)]
-        next_max_q_value = (
-            max(
-                [
-                    self.get_q_value(next_state_key, next_action)
-                    for next_action in next_valid_actions
-                ]
+        dense = isinstance(self.q_table, DenseQTable) and not self.canonical_q_table
+        if next_valid_actions and dense:
+            next_max_q_value = max(
+                self.q_table.q_values(next_state_key, next_valid_actions)
+            )
+        else:
+            next_max_q_value = (
+                max(
+                    [
+                        self.get_q_value(next_state_key, next_action)
+                        for next_action in next_valid_actions
+                    ]
+                )
+                if next_valid_actions
+                else 0
             )
-            if next_valid_actions
-            else 0
-        )
 
         new_q_value = current_q_value + self.alpha * (
             reward + self.gamma * next_max_q_value - current_q_value
         )
 
+        # A canonical Q-table stores one entry for all the symmetrical state-action pairs.
+        if self.canonical_q_table:
+            self.set_q_value(state_key, action, new_q_value)
+            return
+
+        if dense:
+            self.q_table.set_symmetrical(state_key, action, new_q_value)
+            return
+
         symmetrical_states_and_actions = self.get_symmetrical_state_action_pairs(
             state_key, action
         )
 
         for sym_state_key, sym_action in symmetrical_states_and_actions:
             self.set_q_value(sym_state_key, sym_action, new_q_value)
+
+    def _check_batch_q_table(self) -> DenseQTable:
+        """
+        Returns the Q-table for the batched methods, which need a dense Q-table in the full layout.
+        """
+        if not isinstance(self.q_table, DenseQTable) or self.canonical_q_table:
+            raise ValueError(
+                "Batched action selection and learning need QLearningAgent(dense_q_table=True) "
+                "with canonical_q_table=False."
+            )
+        return self.q_table
+
+    def choose_actions(
+        self,
+        ranks: np.ndarray,
+        valid_mask: np.ndarray,
+        is_learning: bool = True,
+    ) -> np.ndarray:
+        """
+        Chooses an action in each of N states using the epsilon-greedy strategy, by a masked argmax over the rows
+        of the dense Q-table. Ties are broken uniformly at random. Uses the global NumPy random generator.
+
+        Parameters:
+        ranks (np.ndarray): An int array of shape (N,) with the base-3 ranks of the states.
+        valid_mask (np.ndarray): A bool array of shape (N, 9), True for the valid actions (cells).
+        is_learning (bool): A flag indicating whether the agent is in learning mode or not (default: True).
+                            If not, the agent will not explore.
+
+        Returns:
+        np.ndarray: An int array of shape (N,) with the chosen cells.
+        """
+        q_table = self._check_batch_q_table()
+
+        q_values = np.where(valid_mask, q_table.values[ranks], -np.inf)
+        candidates = q_values == q_values.max(axis=1, keepdims=True)
+        if is_learning:
+            explore = np.random.random(len(ranks)) < self.epsilon
+            candidates[explore] = valid_mask[explore]
+        return (np.random.random(candidates.shape) * candidates).argmax(axis=1)
+
+    def learn_batch(
+        self,
+        ranks: np.ndarray,
+        cells: np.ndarray,
+        rewards: np.ndarray,
+        next_ranks: np.ndarray,
+        next_valid_mask: np.ndarray,
+        terminal: np.ndarray,
+    ) -> None:
+        """
+        Updates the dense Q-table for N transitions at once using the Q-learning update rule, and writes the new
+        values to the 8 symmetrical state-action pairs of each transition.
+
+        All the updates of a batch read the Q-table before any of them is written. If a batch updates the same
+        state-action pair more than once, one of the updates wins.
+
+        Parameters:
+        ranks (np.ndarray): An int array of shape (N,) with the base-3 ranks of the states before the actions.
+        cells (np.ndarray): An int array of shape (N,) with the cells of the actions.
+        rewards (np.ndarray): A float array of shape (N,) with the rewards.
+        next_ranks (np.ndarray): An int array of shape (N,) with the ranks of the states after the opponent's move.
+        next_valid_mask (np.ndarray): A bool array of shape (N, 9), True for the valid actions in the next states.
+        terminal (np.ndarray): A bool array of shape (N,), True for the transitions into a terminal state.
+        """
+        q_table = self._check_batch_q_table()
+
+        current_q_values = q_table.values[ranks, cells]
+        next_max_q_values = np.where(
+            next_valid_mask, q_table.values[next_ranks], -np.inf
+        ).max(axis=1)
+        next_max_q_values = np.where(terminal, 0, next_max_q_values)
+
+        new_q_values = current_q_values + self.alpha * (
+            rewards + self.gamma * next_max_q_values - current_q_values
+        )
+
+        symmetrical_ranks = SYMMETRY_RANKS[ranks]
+        symmetrical_cells = SYMMETRY_CELLS[:, cells].T
+        q_table.values[symmetrical_ranks, symmetrical_cells] = new_q_values[:, None]
+        q_table.visited[symmetrical_ranks, symmetrical_cells] = True
+
+
+def reachable_state_keys(agent_moves_first: bool) -> List[str]:
+    """
+    Returns the state_keys of all the non-terminal states in which the agent (1 'X') is to move, that can be reached
+    from the empty board when the agent and the opponent (2 'O') take turns.
+
+    Parameters:
+    agent_moves_first (bool): Whether the agent makes the first move.
+
+    Returns:
+    List[str]: The state_keys, in depth-first order.
+    """
+    game = TicTacToe()
+    state_keys = {}
+
+    def visit(player: int) -> None:
+        if player == 1:
+            state_key = game.get_state_key()
+            if state_key in state_keys:
+                return
+            state_keys[state_key] = None
+        for action in game.get_valid_actions():
+            game.make_move(*action, player)
+            if not (game.check_win(player) or game.check_draw()):
+                visit(3 - player)
+            game.withdraw_move(*action)
+
+    visit(1 if agent_moves_first else 2)
+    return list(state_keys)
+
+
+class NegamaxAgent:
+    """
+    An agent that plays perfectly by solving the game with negamax search.
+
+    It has the same choose_action interface as QLearningAgent, so it can replace a QLearningAgent as a player,
+    and its value_table can be used as an oracle for learned Q-tables or as a Q-table that needs no training.
+    Like a QLearningAgent, it plays 1 'X' and is to move in the states it is given.
+    """
+
+    def __init__(self, epsilon: float = 0) -> None:
+        """
+        Initializes the solver with an empty transposition table.
+
+        Parameters:
+        epsilon (float): Exploration rate when choose_action is called with is_learning=True (default: 0)
+        """
+        self.epsilon = epsilon
+        # state_key -> score of the state for player 1, who is to move. It is kept across calls.
+        self.transposition_table: Dict[str, int] = {}
+
+    def get_action_scores(
+        self, state_key: str, valid_actions: List[Tuple[int, int]]
+    ) -> List[int]:
+        """
+        Returns the score of each action for player 1, who is to move.
+
+        The score of a win is 1 plus the number of empty cells left when the game ends, so that faster wins score
+        higher. The score of a loss is the negative of the score of the opponent's win, and a draw scores 0.
+
+        Parameters:
+        state_key (str): A string representing the state of the game.
+        valid_actions (List[Tuple[int, int]]): A list of valid actions.
+
+        Returns:
+        List[int]: The scores of the actions, in the order of valid_actions.
+        """
+        game = TicTacToe()
+        game.set_board_by_state_key(state_key)
+        scores = []
+        for action in valid_actions:
+            game.make_move(*action, 1)
+            if game.check_win(1):
+                scores.append(1 + game.get_state_key().count("0"))
+            elif game.check_draw():
+                scores.append(0)
+            else:
+                # Swap 1 and 2, so that the opponent is player 1 in the state it is to move in.
+                scores.append(
+                    -self.solve(game.get_state_key().translate(str.maketrans("12", "21")))
+                )
+            game.withdraw_move(*action)
+        return scores
+
+    def solve(self, state_key: str) -> int:
+        """
+        Returns the score of a non-terminal state for player 1, who is to move, assuming perfect play from both sides.
+
+        Parameters:
+        state_key (str): A string representing the state of the game.
+
+        Returns:
+        int: The score, positive for a win, 0 for a draw and negative for a loss. See get_action_scores.
+        """
+        score = self.transposition_table.get(state_key)
+        if score is None:
+            valid_actions = [
+                divmod(cell, 3) for cell, value in enumerate(state_key) if value == "0"
+            ]
+            score = max(self.get_action_scores(state_key, valid_actions))
+            self.transposition_table[state_key] = score
+        return score
+
+    def get_best_actions(
+        self, state_key: str, valid_actions: List[Tuple[int, int]]
+    ) -> List[Tuple[int, int]]:
+        """
+        Returns the valid actions with the maximum score.
+
+        Parameters:
+        state_key (str): A string representing the state of the game.
+        valid_actions (List[Tuple[int, int]]): A list of valid actions.
+
+        Returns:
+        List[Tuple[int, int]]: The best actions, in the order of valid_actions.
+        """
+        scores = self.get_action_scores(state_key, valid_actions)
+        max_score = max(scores)
+        return [
+            action for action, score in zip(valid_actions, scores) if score == max_score
+        ]
+
+    def choose_action(
+        self,
+        state_key: str,
+        valid_actions: List[Tuple[int, int]],
+        is_learning: bool = True,
+    ) -> Tuple[int, int]:
+        """
+        Chooses one of the best actions at random, or a random action with probability epsilon if is_learning.
+
+        Parameters:
+        state_key (str): A string representing the state of the game.
+        valid_actions (List[Tuple[int, int]]): A list of valid actions.
+        is_learning (bool): A flag indicating whether the agent may explore (default: True).
+
+        Returns:
+        Tuple[int, int]: The chosen action.
+        """
+        if is_learning and random.random() < self.epsilon:
+            return random.choice(valid_actions)
+        return random.choice(self.get_best_actions(state_key, valid_actions))
+
+    def value_table(
+        self, agent_moves_first: bool
+    ) -> Dict[Tuple[str, Tuple[int, int]], float]:
+        """
+        Returns the perfect-play value of every action in every reachable state of an agent: 1 if the agent can
+        force a win after the action, 0 if the best result is a draw and -1 if the opponent can force a win.
+
+        The table has the layout of a QLearningAgent Q-table, so a QLearningAgent using it plays perfectly.
+
+        Parameters:
+        agent_moves_first (bool): Whether the agent makes the first move.
+
+        Returns:
+        Dict[Tuple[str, Tuple[int, int]], float]: The value table.
+        """
+        table = {}
+        for state_key in reachable_state_keys(agent_moves_first):
+            valid_actions = [
+                divmod(cell, 3) for cell, value in enumerate(state_key) if value == "0"
+            ]
+            for action, score in zip(
+                valid_actions, self.get_action_scores(state_key, valid_actions)
+            ):
+                table[(state_key, action)] = float(np.sign(score))
+        return table
+
+    def score_agent(self, agent: QLearningAgent, agent_moves_first: bool) -> float:
+        """
+        Returns the fraction of the reachable states of an agent in which all its best actions are optimal, i.e. keep
+        the perfect-play value of the state.
+
+        Parameters:
+        agent (QLearningAgent): The agent to score.
+        agent_moves_first (bool): Whether the agent makes the first move.
+
+        Returns:
+        float: The fraction of the states, between 0 and 1.
+        """
+        state_keys = reachable_state_keys(agent_moves_first)
+        optimal_states = 0
+        for state_key in state_keys:
+            valid_actions = [
+                divmod(cell, 3) for cell, value in enumerate(state_key) if value == "0"
+            ]
+            values = dict(
+                zip(
+                    valid_actions,
+                    np.sign(self.get_action_scores(state_key, valid_actions)),
+                )
+            )
+            best_value = max(values.values())
+            if all(
+                values[action] == best_value
+                for action in agent.get_best_actions(state_key, valid_actions)
+            ):
+                optimal_states += 1
+        return optimal_states / len(state_keys)
+
+
+# ACTIONS_BY_MASK[mask] is the tuple of the actions whose cells are set in the 9-bit mask, in row-major order.
+ACTIONS_BY_MASK = tuple(
+    VALID_ACTIONS_BY_OCCUPANCY[FULL_BOARD_MASK ^ mask]
+    for mask in range(FULL_BOARD_MASK + 1)
+)
+
+
+class PolicyAgent:
+    """
+    An agent that serves a precomputed policy: for each reachable state, the set of best actions of a trained agent,
+    stored as a 9-bit mask in a uint16 array indexed by the base-3 rank of the state (0 for the states that are not
+    in the table). Choosing an action is one array lookup and random.choice among the best actions, so ties are
+    broken at random as by QLearningAgent.choose_action.
+
+    States that are not in the table, and exploration with is_learning=True, are delegated to a fallback agent.
+    """
+
+    def __init__(self, best_action_masks: np.ndarray, fallback=None) -> None:
+        """
+        Initializes the agent.
+
+        Parameters:
+        best_action_masks (np.ndarray): A uint16 array of shape (3**9,) with the mask of the best actions of each
+                                        state.
+        fallback: The agent used for the states that are not in the table, e.g. the agent the policy was exported
+                  from (default: None).
+        """
+        self.best_action_masks = best_action_masks
+        self.fallback = fallback
+
+    @classmethod
+    def from_agent(cls, agent, agent_moves_first: bool) -> "PolicyAgent":
+        """
+        Exports the best actions of an agent in all its reachable states.
+
+        Parameters:
+        agent: A QLearningAgent, or any agent with get_best_actions. It is also used as the fallback.
+        agent_moves_first (bool): Whether the agent makes the first move.
+
+        Returns:
+        PolicyAgent: The policy agent.
+        """
+        best_action_masks = np.zeros(N_STATES, dtype=np.uint16)
+        for state_key in reachable_state_keys(agent_moves_first):
+            valid_actions = [
+                divmod(cell, 3) for cell, value in enumerate(state_key) if value == "0"
+            ]
+            best_action_masks[int(state_key, 3)] = sum(
+                CELL_BITS[3 * x + y]
+                for x, y in agent.get_best_actions(state_key, valid_actions)
+            )
+        return cls(best_action_masks, fallback=agent)
+
+    def save(self, path: str) -> None:
+        """
+        Saves the policy as a .npy file. An existing file is replaced, never overwritten in place, since it may be
+        memory-mapped by a server.
+
+        Parameters:
+        path (str): Path of the file. '.npy' is appended if it does not end with it, as np.save does.
+        """
+        if not path.endswith(".npy"):
+            path += ".npy"
+        write_file_atomically(path, lambda file: np.save(file, self.best_action_masks))
+
+    @classmethod
+    def load(cls, path: str, fallback=None) -> "PolicyAgent":
+        """
+        Memory-maps a policy saved by save. No pickle is loaded.
+
+        Parameters:
+        path (str): Path of the file.
+        fallback: The agent used for the states that are not in the table (default: None).
+
+        Returns:
+        PolicyAgent: The policy agent.
+        """
+        return cls(np.load(path, mmap_mode="r", allow_pickle=False), fallback)
+
+    def get_best_actions(
+        self, state_key: str, valid_actions: List[Tuple[int, int]]
+    ) -> List[Tuple[int, int]]:
+        """
+        Returns the best actions of a state. valid_actions must be all the empty cells of the state, unless the state
+        is not in the table.
+
+        Parameters:
+        state_key (str): A string representing the state of the game.
+        valid_actions (List[Tuple[int, int]]): A list of valid actions.
+
+        Returns:
+        List[Tuple[int, int]]: The best actions, in row-major order.
+        """
+        mask = self.best_action_masks.item(int(state_key, 3))
+        if mask:
+            return list(ACTIONS_BY_MASK[mask])
+        if self.fallback is None:
+            raise KeyError(f"The state key {state_key} is not in the policy.")
+        return self.fallback.get_best_actions(state_key, valid_actions)
+
+    def choose_action(
+        self,
+        state_key: str,
+        valid_actions: List[Tuple[int, int]],
+        is_learning: bool = True,
+    ) -> Tuple[int, int]:
+        """
+        Chooses one of the best actions at random. With is_learning=True, the fallback agent chooses instead, so
+        that it can explore.
+
+        Parameters:
+        state_key (str): A string representing the state of the game.
+        valid_actions (List[Tuple[int, int]]): A list of valid actions.
+        is_learning (bool): A flag indicating whether the agent may explore (default: True).
+
+        Returns:
+        Tuple[int, int]: The chosen action.
+        """
+        if is_learning and self.fallback is not None:
+            return self.fallback.choose_action(state_key, valid_actions, is_learning)
+        mask = self.best_action_masks.item(int(state_key, 3))
+        if mask:
+            return random.choice(ACTIONS_BY_MASK[mask])
+        return random.choice(self.get_best_actions(state_key, valid_actions))
+
+    def choose_actions(
+        self,
+        ranks: np.ndarray,
+        valid_mask: np.ndarray,
+        is_learning: bool = True,
+    ) -> np.ndarray:
+        """
+        Chooses one of the best actions at random in each of N states, by one lookup of the masks of all the states.
+        The states that are not in the table, or all the states with is_learning=True, are delegated to
+        choose_actions of the fallback agent, e.g. a QLearningAgent with a dense Q-table. Uses the global NumPy
+        random generator.
+
+        Parameters:
+        ranks (np.ndarray): An int array of shape (N,) with the base-3 ranks of the states.
+        valid_mask (np.ndarray): A bool array of shape (N, 9), True for the valid actions (cells).
+        is_learning (bool): A flag indicating whether the agent may explore (default: True).
+
+        Returns:
+        np.ndarray: An int array of shape (N,) with the chosen cells.
+        """
+        if is_learning and self.fallback is not None:
+            return self.fallback.choose_actions(ranks, valid_mask, is_learning)
+
+        masks = self.best_action_masks[ranks].astype(np.int64)
+        candidates = (masks[:, None] >> np.arange(9)) & 1 == 1
+        cells = (np.random.random(candidates.shape) * candidates).argmax(axis=1)
+
+        missing = masks == 0
+        if missing.any():
+            if self.fallback is None:
+                raise KeyError(
+                    f"The state rank {ranks[missing][0]} is not in the policy."
+                )
+            cells[missing] = self.fallback.choose_actions(
+                ranks[missing], valid_mask[missing], is_learning
+            )
+        return cells
@@ -0,0 +1,206 @@
+import bisect
+import threading
+from typing import Callable, Dict, List, Tuple
+
+# The upper bounds, in seconds, of the buckets of a latency histogram. A move takes microseconds when it is served
+# from the cache and a request takes about a millisecond, so the buckets start at 1us.
+LATENCY_BUCKETS = (
+    0.000001,
+    0.0000025,
+    0.000005,
+    0.00001,
+    0.000025,
+    0.00005,
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+)
+
+# The content type of the Prometheus text exposition format.
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def format_labels(labelnames: Tuple[str, ...], labelvalues: Tuple[str, ...]) -> str:
+    """
+    Formats the labels of a sample in the Prometheus text exposition format, e.g. '{stage="parse"}'.
+    """
+    if not labelnames:
+        return ""
+    escaped_values = (
+        str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        for value in labelvalues
+    )
+    return (
+        "{"
+        + ",".join(f'{name}="{value}"' for name, value in zip(labelnames, escaped_values))
+        + "}"
+    )
+
+
+def format_value(value: float) -> str:
+    """
+    Formats the value of a sample, '+Inf' for infinity.
+    """
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """
+    A counter with labels, e.g. the number of games won by the AI. By convention, its name ends with '_total'.
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.values: Dict[Tuple[str, ...], float] = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *labelvalues: str, amount: float = 1) -> None:
+        """
+        Increments the counter of the given label values.
+        """
+        with self.lock:
+            self.values[labelvalues] = self.values.get(labelvalues, 0) + amount
+
+    def get(self, *labelvalues: str) -> float:
+        """
+        Returns the counter of the given label values.
+        """
+        return self.values.get(labelvalues, 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            values = sorted(self.values.items())
+        for labelvalues, value in values:
+            lines.append(
+                f"{self.name}{format_labels(self.labelnames, labelvalues)} {format_value(value)}"
+            )
+        return lines
+
+
+class Histogram:
+    """
+    A histogram with labels, e.g. the latency of each stage of a request. Each observation increments one bucket,
+    and the buckets are made cumulative when the histogram is rendered.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = LATENCY_BUCKETS,
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        # label values -> [the count of each bucket, the last one for +Inf, the sum]
+        self.values: Dict[Tuple[str, ...], list] = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        """
+        Records an observation for the given label values.
+        """
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            counts = self.values.get(labelvalues)
+            if counts is None:
+                counts = self.values[labelvalues] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[index] += 1
+            counts[-1] += value
+
+    def count(self, *labelvalues: str) -> int:
+        """
+        Returns the number of observations for the given label values.
+        """
+        counts = self.values.get(labelvalues)
+        return sum(counts[:-1]) if counts else 0
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            values = sorted((labelvalues, list(counts)) for labelvalues, counts in self.values.items())
+        labelnames = self.labelnames + ("le",)
+        for labelvalues, counts in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                labels = format_labels(labelnames, labelvalues + (format_value(bound),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = format_labels(self.labelnames, labelvalues)
+            lines.append(f"{self.name}_sum{labels} {format_value(counts[-1])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class CallbackMetric:
+    """
+    A metric without labels whose value is read from a function when it is rendered, e.g. the hits of a cache.
+    """
+
+    def __init__(
+        self, name: str, documentation: str, function: Callable[[], float], metric_type: str = "gauge"
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.function = function
+        self.metric_type = metric_type
+
+    def render(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.metric_type}",
+            f"{self.name} {format_value(self.function())}",
+        ]
+
+
+class Registry:
+    """
+    A set of metrics rendered together in the Prometheus text exposition format.
+    """
+
+    def __init__(self) -> None:
+        self.metrics = []
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(
+        self, name: str, documentation: str, function: Callable[[], float], metric_type: str = "gauge"
+    ) -> CallbackMetric:
+        return self.register(CallbackMetric(name, documentation, function, metric_type))
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """
+        Returns all the metrics in the Prometheus text exposition format.
+        """
+        return "".join(line + "\n" for metric in self.metrics for line in metric.render())
@@ -0,0 +1,380 @@
+import json
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from time import time
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from evaluation import verify_policy
+from game_and_agent import PolicyAgent, QLearningAgent, is_q_table_file, write_file_atomically
+
+
+@dataclass(frozen=True)
+class ModelSpec:
+    """
+    The files of a model: the Q-tables of the agents that move first and second, and optionally their policies
+    exported by export_policy.py. Without a policy, the policy is exported from the Q-table when the model is loaded.
+    """
+
+    q_table_first: str
+    q_table_second: str
+    policy_first: Optional[str] = None
+    policy_second: Optional[str] = None
+
+    def paths(self) -> Tuple[str, ...]:
+        return tuple(
+            path
+            for path in (self.q_table_first, self.q_table_second, self.policy_first, self.policy_second)
+            if path
+        )
+
+
+@dataclass(frozen=True, eq=False)
+class Model:
+    """
+    A loaded model. It is never modified: a reload creates a new Model, so a request that holds a Model uses the
+    same agents from start to end. Models are compared and hashed by identity, so they can key a cache.
+    """
+
+    name: str
+    spec: ModelSpec
+    # The agent that moves first (plays 'X' when the AI moves first) and the agent that moves second.
+    agent1: PolicyAgent
+    agent2: PolicyAgent
+    # 1 for the first load of the name, incremented by each reload.
+    version: int
+    loaded_at: float
+    # The modification time of each file of the spec when it was loaded.
+    mtimes: Dict[str, float] = field(default_factory=dict)
+
+    def info(self) -> dict:
+        return {
+            "name": self.name,
+            "version": self.version,
+            "loaded_at": self.loaded_at,
+            "files": list(self.spec.paths()),
+        }
+
+
+def file_mtimes(spec: ModelSpec) -> Dict[str, float]:
+    """
+    Returns the modification time of each file of a spec, or -1 for a missing file.
+    """
+    return {
+        path: os.stat(path).st_mtime if os.path.exists(path) else -1 for path in spec.paths()
+    }
+
+
+def load_policy_agent(
+    q_table_path: str, policy_path: Optional[str], agent_moves_first: bool, verify: bool = True
+) -> PolicyAgent:
+    """
+    Loads the agent of one role and checks that its policy never loses, with verify_policy.
+
+    Parameters:
+    q_table_path (str): Path to the Q-table, a binary Q-table file.
+    policy_path (Optional[str]): Path to the policy exported from the Q-table, or None to export it now.
+    agent_moves_first (bool): Whether the agent makes the first move.
+    verify (bool): Check the policy (default: True).
+
+    Returns:
+    PolicyAgent: The agent, with the Q-learning agent as its fallback.
+
+    Raises:
+    ValueError: If the Q-table is not a binary Q-table file, or if the policy can lose.
+    """
+    # Pickles are never loaded here: unpickling a file can run arbitrary code, and the paths can come from the
+    # admin routes of the web app.
+    if not is_q_table_file(q_table_path):
+        raise ValueError(f"{q_table_path} is not a binary Q-table file, convert it with convert_q_table.py.")
+    # The batched path of the web app needs a dense Q-table in the fallback agent.
+    fallback = QLearningAgent(pre_trained_q_table=q_table_path, dense_q_table=True)
+    if policy_path:
+        agent = PolicyAgent.load(policy_path, fallback=fallback)
+    else:
+        agent = PolicyAgent.from_agent(fallback, agent_moves_first)
+
+    if not verify:
+        return agent
+    result = verify_policy(agent, agent_moves_first, max_losing_lines=1)
+    if not result.never_loses:
+        role = "first" if agent_moves_first else "second"
+        raise ValueError(
+            f"The policy of the {role} mover agent of {q_table_path} can lose, e.g. {result.losing_lines[0]}."
+        )
+    return agent
+
+
+class ModelRegistry:
+    """
+    A set of named models that can be reloaded while they are served.
+
+    Readers take a model with get, which is a dict lookup without a lock. A load builds and validates the new model
+    first, then replaces the dict of models by a new one in a single assignment, so readers see either the old
+    or the new model, never a mix, and are never blocked. Loads are serialized by a lock.
+
+    The models live in the memory of one process. When several processes serve the same models, e.g. the workers
+    of a web server, they share a manifest: a JSON file with the spec, the version and the file modification times
+    of each model. load and remove write it, under a file lock, and sync, which the watcher calls, loads, reloads
+    and removes the models of a process to match it, with the same versions.
+    """
+
+    def __init__(
+        self, default_name: str = "default", verify: bool = True, manifest_path: Optional[str] = None
+    ) -> None:
+        """
+        Initializes an empty registry.
+
+        Parameters:
+        default_name (str): The name of the model served when a request does not name one (default: 'default').
+        verify (bool): Check that the policies of a model never lose before serving it (default: True).
+        manifest_path (Optional[str]): The manifest shared with the other processes that serve the models, or None
+                                       if this process is the only one (default: None).
+        """
+        self.default_name = default_name
+        self.verify = verify
+        self.manifest_path = manifest_path
+        self.models: Dict[str, Model] = {}
+        # The version of each model of the manifest that failed to load in sync, so that it is not retried.
+        self.failed_versions: Dict[str, int] = {}
+        self.load_lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="model-loader")
+        # Functions called with the name of a model after it is swapped in or removed.
+        self.swap_listeners: List[Callable[[str], None]] = []
+        self.watcher: Optional[threading.Thread] = None
+        self.stop_watching = threading.Event()
+
+    def get(self, name: Optional[str] = None) -> Model:
+        """
+        Returns the current model of a name.
+
+        Raises:
+        KeyError: If there is no model with this name.
+        """
+        return self.models[name or self.default_name]
+
+    @contextmanager
+    def manifest_lock(self) -> Iterator[Dict[str, dict]]:
+        """
+        Locks the manifest against the other processes, and yields its entries by model name, which the caller may
+        change and save with write_manifest. Without a manifest, it yields an empty dict and locks nothing.
+        """
+        if self.manifest_path is None:
+            yield {}
+            return
+        # fcntl only exists on Unix, where the web server runs several workers.
+        import fcntl
+
+        with open(f"{self.manifest_path}.lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield self.read_manifest()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def read_manifest(self) -> Dict[str, dict]:
+        """
+        Returns the entries of the manifest by model name, or an empty dict if there is none yet.
+        """
+        if self.manifest_path is None or not os.path.exists(self.manifest_path):
+            return {}
+        with open(self.manifest_path) as file:
+            return json.load(file)["models"]
+
+    def write_manifest(self, entries: Dict[str, dict]) -> None:
+        """
+        Replaces the manifest, if there is one, by a file with the given entries.
+        """
+        if self.manifest_path is None:
+            return
+        content = json.dumps({"models": entries}, indent=2).encode()
+        write_file_atomically(self.manifest_path, lambda file: file.write(content))
+
+    def build(self, name: str, spec: ModelSpec, version: int) -> Model:
+        """
+        Loads and checks the agents of a model, without swapping it in.
+        """
+        mtimes = file_mtimes(spec)
+        agent1 = load_policy_agent(spec.q_table_first, spec.policy_first, True, self.verify)
+        agent2 = load_policy_agent(spec.q_table_second, spec.policy_second, False, self.verify)
+        return Model(
+            name=name,
+            spec=spec,
+            agent1=agent1,
+            agent2=agent2,
+            version=version,
+            loaded_at=time(),
+            mtimes=mtimes,
+        )
+
+    def load(self, name: str, spec: Optional[ModelSpec] = None, files_changed: bool = False) -> Model:
+        """
+        Loads a model, checks it, swaps it in and records it in the manifest. If the load or the check fails, the
+        current model of the name is kept.
+
+        Parameters:
+        name (str): The name of the model.
+        spec (Optional[ModelSpec]): The files of the model (default: None, the files of the current model).
+        files_changed (bool): The reload is due to a change of the files, which another process may have already
+                              recorded in the manifest, in which case its version is taken (default: False).
+
+        Returns:
+        Model: The new model.
+
+        Raises:
+        KeyError: If there is no spec and no current model with this name.
+        ValueError: If a policy of the model can lose.
+        """
+        with self.load_lock, self.manifest_lock() as manifest:
+            previous = self.models.get(name)
+            entry = manifest.get(name)
+            if spec is None:
+                if previous is not None:
+                    spec = previous.spec
+                elif entry is not None:
+                    spec = ModelSpec(**entry["spec"])
+                else:
+                    raise KeyError(f"There is no model named {name}.")
+
+            recorded = (
+                files_changed
+                and entry is not None
+                and previous is not None
+                and entry["version"] > previous.version
+                and entry["mtimes"] == file_mtimes(spec)
+            )
+            if recorded:
+                version = entry["version"]
+            else:
+                version = max(previous.version if previous else 0, entry["version"] if entry else 0) + 1
+            model = self.build(name, spec, version)
+            self.models = {**self.models, name: model}
+            if not recorded:
+                manifest[name] = {"spec": asdict(spec), "version": version, "mtimes": model.mtimes}
+                self.write_manifest(manifest)
+
+        for listener in self.swap_listeners:
+            listener(name)
+        return model
+
+    def load_in_background(self, name: str, spec: Optional[ModelSpec] = None) -> Future:
+        """
+        Loads a model on the loader thread of the registry, see load.
+
+        Returns:
+        Future: The future of the new model.
+        """
+        return self.executor.submit(self.load, name, spec)
+
+    def remove(self, name: str) -> None:
+        """
+        Stops serving a model. The default model can not be removed.
+        """
+        if name == self.default_name:
+            raise ValueError("The default model can not be removed.")
+        with self.load_lock, self.manifest_lock() as manifest:
+            if name not in self.models and name not in manifest:
+                raise KeyError(f"There is no model named {name}.")
+            self.models = {key: model for key, model in self.models.items() if key != name}
+            if manifest.pop(name, None) is not None:
+                self.write_manifest(manifest)
+        for listener in self.swap_listeners:
+            listener(name)
+
+    def sync(self, on_error: Callable[[str, Exception], None] = None) -> List[str]:
+        """
+        Loads, reloads and removes models to match the manifest, with the versions it records. The default model is
+        never removed. A model that fails to load keeps its current version, and is not retried until the manifest
+        records a new version of it.
+
+        Parameters:
+        on_error (Callable[[str, Exception], None]): Called with the name of the model and the error when a load
+                                                    fails (default: None).
+
+        Returns:
+        List[str]: The names of the models that were swapped in or removed.
+        """
+        if self.manifest_path is None:
+            return []
+        changed = []
+        with self.load_lock:
+            manifest = self.read_manifest()
+            models = dict(self.models)
+            for name, entry in manifest.items():
+                current = models.get(name)
+                if current is not None and current.version == entry["version"]:
+                    continue
+                if self.failed_versions.get(name) == entry["version"]:
+                    continue
+                try:
+                    models[name] = self.build(name, ModelSpec(**entry["spec"]), entry["version"])
+                    changed.append(name)
+                except Exception as error:
+                    self.failed_versions[name] = entry["version"]
+                    if on_error is not None:
+                        on_error(name, error)
+            for name in list(models):
+                if name not in manifest and name != self.default_name:
+                    del models[name]
+                    changed.append(name)
+            self.models = models
+        for name in changed:
+            for listener in self.swap_listeners:
+                listener(name)
+        return changed
+
+    def changed_models(self) -> List[str]:
+        """
+        Returns the names of the models whose files have changed since they were loaded.
+        """
+        return [
+            name for name, model in self.models.items() if file_mtimes(model.spec) != model.mtimes
+        ]
+
+    def start_watching(self, interval: float, on_error: Callable[[str, Exception], None] = None) -> None:
+        """
+        Starts a thread that polls the files of the models every interval seconds and reloads the changed models.
+        A model whose reload fails is not retried until its files change again. With a manifest, each poll first
+        syncs the models with it, so that the loads and removals of the other processes are applied here.
+
+        Parameters:
+        interval (float): The polling interval in seconds.
+        on_error (Callable[[str, Exception], None]): Called with the name of the model and the error when a reload
+                                                    fails (default: None).
+        """
+        failed_mtimes: Dict[str, Dict[str, float]] = {}
+
+        def watch() -> None:
+            while not self.stop_watching.wait(interval):
+                try:
+                    self.sync(on_error)
+                except Exception as error:
+                    # e.g. a manifest cut short by a full disk. It is read again at the next poll.
+                    if on_error is not None:
+                        on_error(self.manifest_path, error)
+                for name in self.changed_models():
+                    mtimes = file_mtimes(self.models[name].spec)
+                    if failed_mtimes.get(name) == mtimes:
+                        continue
+                    try:
+                        self.load(name, files_changed=True)
+                        failed_mtimes.pop(name, None)
+                    except Exception as error:
+                        failed_mtimes[name] = mtimes
+                        if on_error is not None:
+                            on_error(name, error)
+
+        self.stop_watching.clear()
+        self.watcher = threading.Thread(target=watch, name="model-watcher", daemon=True)
+        self.watcher.start()
+
+    def stop(self) -> None:
+        """
+        Stops the file watcher, if it runs.
+        """
+        self.stop_watching.set()
+        if self.watcher is not None:
+            self.watcher.join()
+            self.watcher = None
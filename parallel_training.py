@@ -0,0 +1,234 @@
+import argparse
+import os
+import pickle
+import random
+from multiprocessing import Pool
+from time import perf_counter
+from typing import Dict, List, Tuple
+
+from game_and_agent import INIT_Q_VALUE, QLearningAgent, TicTacToe
+from training_agent_that_move_first import play_episode_agent_move_first, play_game_agent_move_first
+from training_agent_that_move_second import play_episode_agent_move_second, play_game_agent_move_second
+
+# The opponent of the second mover agent, loaded once in each worker process by init_worker.
+_opponent_agent = None
+
+
+def init_worker(opponent_q_table: str) -> None:
+    """
+    Load the opponent of the second mover agent in a worker process.
+
+    Parameters:
+    opponent_q_table (str): Path to the Q-table of the pre-trained first mover agent, or '' if not needed.
+    """
+    global _opponent_agent
+    if opponent_q_table:
+        # The opponent agent can not always take the optimal move, see training_agent_that_move_second.py.
+        _opponent_agent = QLearningAgent(
+            epsilon=0.5, pre_trained_q_table=opponent_q_table
+        )
+
+
+def train_worker(
+    task: Tuple[str, Dict, float, float, int, str]
+) -> Dict[Tuple[str, Tuple[int, int]], float]:
+    """
+    Play episodes in a worker process against a local copy of the master Q-table. The learning rate stays the same
+    during the episodes, and the worker prints nothing: the master decays the learning rate and reports the
+    progress.
+
+    Parameters:
+    task (Tuple[str, Dict, float, float, int, str]): The role of the agent ('first' or 'second'), the master Q-table,
+                                                     alpha, epsilon, the number of episodes and the seed of the
+                                                     random module.
+
+    Returns:
+    Dict[Tuple[str, Tuple[int, int]], float]: The change of each Q-value that the worker has changed.
+    """
+    role, q_table, alpha, epsilon, episodes, seed = task
+    random.seed(seed)
+
+    agent = QLearningAgent(alpha=alpha, epsilon=epsilon)
+    agent.q_table = dict(q_table)
+    game = TicTacToe()
+    for _ in range(episodes):
+        if role == "first":
+            play_episode_agent_move_first(agent, game)
+        else:
+            play_episode_agent_move_second(agent, _opponent_agent, game)
+
+    deltas = {}
+    for key, value in agent.q_table.items():
+        delta = value - q_table.get(key, INIT_Q_VALUE)
+        if delta != 0:
+            deltas[key] = delta
+    return deltas
+
+
+def merge_deltas(
+    q_table: Dict[Tuple[str, Tuple[int, int]], float],
+    worker_deltas: List[Dict[Tuple[str, Tuple[int, int]], float]],
+) -> None:
+    """
+    Merge the changes made by the workers into the master Q-table. Each Q-value changes by the average of the changes
+    of the workers that have changed it, so a state visited by a single worker is not diluted by the others.
+
+    Parameters:
+    q_table (Dict[Tuple[str, Tuple[int, int]], float]): The master Q-table, updated in place.
+    worker_deltas (List[Dict[Tuple[str, Tuple[int, int]], float]]): The changes returned by the workers.
+    """
+    sums = {}
+    counts = {}
+    for deltas in worker_deltas:
+        for key, delta in deltas.items():
+            sums[key] = sums.get(key, 0) + delta
+            counts[key] = counts.get(key, 0) + 1
+    for key, total in sums.items():
+        q_table[key] = q_table.get(key, INIT_Q_VALUE) + total / counts[key]
+
+
+def train_parallel(
+    agent: QLearningAgent,
+    role: str,
+    episodes: int,
+    workers: int = None,
+    sync_interval: int = 5000,
+    seeds: List[int] = None,
+    opponent_q_table: str = "q_table_ubuntu_agent_move_first.pkl",
+) -> None:
+    """
+    Train a Q-learning agent with a pool of worker processes.
+
+    In each round, every worker plays sync_interval episodes (fewer in the last round) with its own copy of the
+    agent's Q-table, and the changes are merged into the agent's Q-table by merge_deltas. The learning rate decays
+    by 0.99 every 10000 episodes played in total, as in the serial training loops.
+
+    Parameters:
+    agent (QLearningAgent): The agent to be trained, with a dict Q-table. It plays the role given by `role`.
+    role (str): 'first' to train a first mover agent with a random opponent, 'second' to train a second mover agent
+                with a pre-trained first mover opponent.
+    episodes (int): The total number of episodes to play.
+    workers (int): The number of worker processes (default: None, the number of CPUs).
+    sync_interval (int): The number of episodes a worker plays between two merges (default: 5000).
+    seeds (List[int]): The seed of each worker (default: None, 0 to workers - 1). The seed of a worker in a round is
+                       derived from its seed and the round index.
+    opponent_q_table (str): Path to the Q-table of the opponent of a second mover agent
+                            (default: 'q_table_ubuntu_agent_move_first.pkl').
+    """
+    workers = workers or os.cpu_count()
+    seeds = list(range(workers)) if seeds is None else seeds
+    if len(seeds) != workers:
+        raise ValueError(f"Expected {workers} seeds, got {len(seeds)}.")
+
+    played = 0
+    round_index = 0
+    start = perf_counter()
+    with Pool(
+        workers,
+        initializer=init_worker,
+        initargs=(opponent_q_table if role == "second" else "",),
+    ) as pool:
+        while played < episodes:
+            worker_episodes = min(sync_interval, -(-(episodes - played) // workers))
+            tasks = [
+                (
+                    role,
+                    agent.q_table,
+                    agent.alpha,
+                    agent.epsilon,
+                    worker_episodes,
+                    f"{seed}:{round_index}",
+                )
+                for seed in seeds
+            ]
+            merge_deltas(agent.q_table, pool.map(train_worker, tasks))
+
+            previous_played = played
+            played += worker_episodes * workers
+            round_index += 1
+            for _ in range(previous_played // 10000, played // 10000):
+                agent.alpha *= 0.99
+            print(
+                f"Trained {played} episodes in {round_index} rounds. LR is {agent.alpha}. "
+                f"Q-table size is {len(agent.q_table)}. Time used: {perf_counter() - start:.2f}"
+            )
+
+
+def serial_episodes_per_second(role: str, episodes: int, opponent_q_table: str) -> float:
+    """
+    Measure the throughput of the serial training loop for the given role.
+
+    Parameters:
+    role (str): 'first' or 'second'.
+    episodes (int): The number of episodes to play.
+    opponent_q_table (str): Path to the Q-table of the opponent of a second mover agent.
+
+    Returns:
+    float: The number of episodes played per second.
+    """
+    agent = QLearningAgent()
+    start = perf_counter()
+    if role == "first":
+        play_game_agent_move_first(agent, episodes=episodes)
+    else:
+        opponent = QLearningAgent(epsilon=0.5, pre_trained_q_table=opponent_q_table)
+        play_game_agent_move_second(agent, opponent, episodes=episodes)
+    return episodes / (perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Train an agent with a pool of worker processes."
+    )
+    parser.add_argument("role", choices=["first", "second"])
+    parser.add_argument("--episodes", type=int, default=1000000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--sync-interval", type=int, default=5000)
+    parser.add_argument(
+        "--seeds",
+        type=int,
+        nargs="+",
+        help="One seed per worker (default: 0 to workers - 1).",
+    )
+    parser.add_argument(
+        "--opponent-q-table", default="q_table_ubuntu_agent_move_first.pkl"
+    )
+    parser.add_argument(
+        "--output",
+        help="Path of the pickled Q-table (default: q_table_ubuntu_agent_move_<role>.pkl).",
+    )
+    parser.add_argument(
+        "--compare-serial",
+        type=int,
+        default=0,
+        metavar="EPISODES",
+        help="Also run the serial training loop for EPISODES episodes and report the speedup.",
+    )
+    args = parser.parse_args()
+
+    agent = QLearningAgent()
+    start = perf_counter()
+    train_parallel(
+        agent,
+        args.role,
+        args.episodes,
+        workers=args.workers,
+        sync_interval=args.sync_interval,
+        seeds=args.seeds,
+        opponent_q_table=args.opponent_q_table,
+    )
+    parallel_throughput = args.episodes / (perf_counter() - start)
+    print(f"Parallel: {parallel_throughput:.1f} episodes/sec with {args.workers} workers.")
+
+    if args.compare_serial:
+        serial_throughput = serial_episodes_per_second(
+            args.role, args.compare_serial, args.opponent_q_table
+        )
+        print(
+            f"Serial: {serial_throughput:.1f} episodes/sec. "
+            f"Speedup: {parallel_throughput / serial_throughput:.2f}x, "
+            f"efficiency: {parallel_throughput / serial_throughput / args.workers:.0%}."
+        )
+
+    with open(args.output or f"q_table_ubuntu_agent_move_{args.role}.pkl", "wb") as f:
+        pickle.dump(agent.q_table, f)
@@ -0,0 +1,43 @@
+import argparse
+import pickle
+
+from game_and_agent import NegamaxAgent, QLearningAgent
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Solve the game, dump the perfect-play value tables and score Q-tables against them."
+    )
+    parser.add_argument(
+        "--dump",
+        action="store_true",
+        help="Write the value tables of both roles to q_table_perfect_agent_move_<role>.pkl.",
+    )
+    parser.add_argument(
+        "--first-mover-q-table", default="q_table_ubuntu_agent_move_first.pkl"
+    )
+    parser.add_argument(
+        "--second-mover-q-table", default="q_table_ubuntu_agent_move_second.pkl"
+    )
+    args = parser.parse_args()
+
+    solver = NegamaxAgent()
+    for role, q_table_path in (
+        ("first", args.first_mover_q_table),
+        ("second", args.second_mover_q_table),
+    ):
+        agent_moves_first = role == "first"
+        if args.dump:
+            value_table = solver.value_table(agent_moves_first)
+            with open(f"q_table_perfect_agent_move_{role}.pkl", "wb") as f:
+                pickle.dump(value_table, f)
+            print(
+                f"Wrote {len(value_table)} entries to q_table_perfect_agent_move_{role}.pkl."
+            )
+
+        score = solver.score_agent(
+            QLearningAgent(pre_trained_q_table=q_table_path), agent_moves_first
+        )
+        print(
+            f"The best actions of {q_table_path} are optimal in {score:.2%} of the reachable states."
+        )
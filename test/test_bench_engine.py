@@ -0,0 +1,28 @@
+import random
+
+from benchmarks.bench_engine import NumpyTicTacToe, episodes_per_second
+from game_and_agent import TicTacToe
+
+
+class TestBenchEngine:
+    def test_numpy_engine_finds_the_same_winning_and_blocking_moves(self):
+        rng = random.Random(0)
+        for _ in range(200):
+            game, numpy_game = TicTacToe(), NumpyTicTacToe()
+            for _ in range(rng.randrange(8)):
+                action = rng.choice(game.get_valid_actions())
+                player = rng.choice([1, 2])
+                game.make_move(*action, player)
+                numpy_game.make_move(*action, player)
+                if game.check_win(player):
+                    break
+            if game.check_win(1) or game.check_win(2):
+                continue
+            for player in (1, 2):
+                assert numpy_game.winning_moves(player) == game.winning_moves(player)
+                assert numpy_game.blocking_moves(player) == game.blocking_moves(player)
+            assert numpy_game.move_record == game.move_record
+
+    def test_both_engines_train(self):
+        assert episodes_per_second(NumpyTicTacToe, 20, 0) > 0
+        assert episodes_per_second(TicTacToe, 20, 0) > 0
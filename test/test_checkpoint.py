@@ -0,0 +1,99 @@
+import os
+import pickle
+import random
+
+import pytest
+
+from checkpoint import DELTA_LOG_FILE, SNAPSHOT_FILE, Checkpointer
+from game_and_agent import QLearningAgent
+from training_agent_that_move_first import play_game_agent_move_first
+from training_agent_that_move_second import play_game_agent_move_second
+
+
+def train(role, directory, episodes, resume=False, snapshot_every=3):
+    agent = QLearningAgent()
+    checkpointer = Checkpointer(directory, interval=100, snapshot_every=snapshot_every)
+    if role == "first":
+        play_game_agent_move_first(
+            agent, episodes=episodes, checkpointer=checkpointer, resume=resume
+        )
+    else:
+        opponent = QLearningAgent(
+            epsilon=0.5, pre_trained_q_table="q_table_ubuntu_agent_move_first.pkl"
+        )
+        play_game_agent_move_second(
+            agent, opponent, episodes=episodes, checkpointer=checkpointer, resume=resume
+        )
+    return agent
+
+
+class TestCheckpointer:
+    def test_save_and_restore(self, tmp_path):
+        agent = QLearningAgent(alpha=0.5)
+        agent.q_table = {("000000000", (0, 0)): 0.25}
+        checkpointer = Checkpointer(str(tmp_path), snapshot_every=2)
+        random.seed(1)
+        checkpointer.save(agent, 100, 0.5)
+        agent.q_table[("000000000", (1, 1))] = -0.5
+        agent.alpha = 0.25
+        checkpointer.save(agent, 200, 0.75)
+        random_state = random.getstate()
+
+        with open(tmp_path / DELTA_LOG_FILE, "rb") as file:
+            assert pickle.load(file)["changes"] == {("000000000", (1, 1)): -0.5}
+
+        random.seed(2)
+        restored_agent = QLearningAgent()
+        assert Checkpointer(str(tmp_path)).restore(restored_agent) == (200, 0.75)
+        assert restored_agent.q_table == agent.q_table
+        assert restored_agent.alpha == 0.25
+        assert random.getstate() == random_state
+
+    def test_snapshot_empties_the_delta_log(self, tmp_path):
+        agent = QLearningAgent()
+        checkpointer = Checkpointer(str(tmp_path), snapshot_every=2)
+        for episode in range(1, 4):
+            agent.q_table[("000000000", (0, episode - 1))] = episode
+            checkpointer.save(agent, episode, 0)
+
+        # The third checkpoint is a snapshot.
+        assert os.path.getsize(tmp_path / DELTA_LOG_FILE) == 0
+        with open(tmp_path / SNAPSHOT_FILE, "rb") as file:
+            assert pickle.load(file)["episode"] == 3
+
+    def test_restore_drops_a_truncated_record(self, tmp_path):
+        agent = QLearningAgent()
+        checkpointer = Checkpointer(str(tmp_path), snapshot_every=10)
+        agent.q_table[("000000000", (0, 0))] = 1.0
+        checkpointer.save(agent, 1, 0)
+        agent.q_table[("000000000", (0, 1))] = 2.0
+        checkpointer.save(agent, 2, 0)
+        size = os.path.getsize(tmp_path / DELTA_LOG_FILE)
+        agent.q_table[("000000000", (0, 2))] = 3.0
+        checkpointer.save(agent, 3, 0)
+        with open(tmp_path / DELTA_LOG_FILE, "r+b") as file:
+            file.truncate(os.path.getsize(tmp_path / DELTA_LOG_FILE) - 5)
+
+        restored_agent = QLearningAgent()
+        assert Checkpointer(str(tmp_path)).restore(restored_agent)[0] == 2
+        assert ("000000000", (0, 2)) not in restored_agent.q_table
+        assert os.path.getsize(tmp_path / DELTA_LOG_FILE) == size
+
+    def test_restore_without_checkpoint(self, tmp_path):
+        assert Checkpointer(str(tmp_path)).restore(QLearningAgent()) is None
+
+    @pytest.mark.parametrize("role", ["first", "second"])
+    def test_resume_is_bit_for_bit(self, role, tmp_path):
+        random.seed(0)
+        uninterrupted = train(role, str(tmp_path / "uninterrupted"), 1000)
+        random_state = random.getstate()
+
+        # A run stopped at episode 600, where it took its last checkpoint, from a snapshot and delta records.
+        random.seed(0)
+        train(role, str(tmp_path / "interrupted"), 600)
+        random.seed(123)
+        resumed = train(role, str(tmp_path / "interrupted"), 1000, resume=True)
+
+        assert resumed.q_table == uninterrupted.q_table
+        assert resumed.alpha == uninterrupted.alpha
+        assert random.getstate() == random_state
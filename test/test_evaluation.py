@@ -0,0 +1,80 @@
+import evaluation
+from evaluation import (
+    EvaluationReport,
+    evaluate,
+    evaluate_shard,
+    play_evaluation_game,
+    verify_policy,
+)
+from game_and_agent import QLearningAgent, TicTacToe
+
+
+class TestEvaluation:
+    def test_untrained_agent_loses_and_game_is_recorded(self):
+        game = TicTacToe()
+        agent = QLearningAgent()
+        opponent = QLearningAgent()
+
+        rewards = [
+            play_evaluation_game(game, agent, opponent, agent_moves_first=True)
+            for _ in range(50)
+        ]
+
+        assert set(rewards) <= {-1, 0, 1} and -1 in rewards
+        assert game.move_record[0][0] == 1
+
+    def test_recorded_losing_games_end_in_a_win_of_the_opponent(self, monkeypatch):
+        monkeypatch.setattr(evaluation, "_agent", QLearningAgent(), raising=False)
+        monkeypatch.setattr(evaluation, "_opponent", QLearningAgent(), raising=False)
+
+        report = evaluate_shard((50, True, True, 0))
+
+        assert report.losses == len(report.losing_games) > 0
+        for move_record in report.losing_games:
+            game = TicTacToe()
+            for player, action in move_record:
+                assert game.make_move(*action, player)
+            assert move_record[-1][0] == 2 and game.check_win(2)
+
+    def test_report_add(self):
+        report = EvaluationReport(wins=1, draws=2)
+        report.add(EvaluationReport(draws=1, losses=1, losing_games=[[(1, (0, 0))]]))
+
+        assert (report.games, report.wins, report.draws, report.losses) == (5, 1, 3, 1)
+        assert report.losing_games == [[(1, (0, 0))]]
+
+    def test_pre_trained_first_mover_agent_never_loses(self):
+        report = evaluate(
+            "q_table_ubuntu_agent_move_first.qtab",
+            "q_table_ubuntu_agent_move_second.qtab",
+            agent_moves_first=True,
+            games=2000,
+            workers=2,
+            shard_size=500,
+            verbose=False,
+        )
+
+        assert report.games == 2000 and report.losses == 0
+
+    def test_verify_pre_trained_agents(self):
+        first_mover = QLearningAgent(
+            pre_trained_q_table="q_table_ubuntu_agent_move_first.qtab"
+        )
+        second_mover = QLearningAgent(
+            pre_trained_q_table="q_table_ubuntu_agent_move_second.qtab"
+        )
+
+        assert verify_policy(first_mover, agent_moves_first=True).never_loses
+        assert verify_policy(second_mover, agent_moves_first=False).never_loses
+
+    def test_verify_untrained_agent_returns_losing_lines(self):
+        result = verify_policy(
+            QLearningAgent(), agent_moves_first=False, max_losing_lines=10
+        )
+
+        assert not result.never_loses and len(result.losing_lines) == 10
+        for move_record in result.losing_lines:
+            game = TicTacToe()
+            for player, action in move_record:
+                assert game.make_move(*action, player)
+            assert move_record[0][0] == 2 and game.check_win(2)
@@ -0,0 +1,42 @@
+from metrics import Registry
+
+
+class TestMetrics:
+    def test_counter(self):
+        registry = Registry()
+        counter = registry.counter("games_total", "Number of games.", ("outcome",))
+        counter.inc("draw")
+        counter.inc("draw")
+        counter.inc('say "hi"', amount=3)
+
+        assert counter.get("draw") == 2
+        assert registry.render().splitlines() == [
+            "# HELP games_total Number of games.",
+            "# TYPE games_total counter",
+            "games_total{outcome=\"draw\"} 2",
+            'games_total{outcome="say \\"hi\\""} 3',
+        ]
+
+    def test_histogram(self):
+        registry = Registry()
+        histogram = registry.histogram(
+            "latency_seconds", "Latency.", ("stage",), buckets=(0.1, 1.0)
+        )
+        for value in (0.05, 0.1, 0.5, 2.0):
+            histogram.observe(value, "parse")
+
+        assert histogram.count("parse") == 4
+        assert registry.render().splitlines()[2:] == [
+            'latency_seconds_bucket{stage="parse",le="0.1"} 2',
+            'latency_seconds_bucket{stage="parse",le="1.0"} 3',
+            'latency_seconds_bucket{stage="parse",le="+Inf"} 4',
+            'latency_seconds_sum{stage="parse"} 2.65',
+            'latency_seconds_count{stage="parse"} 4',
+        ]
+
+    def test_callback(self):
+        registry = Registry()
+        values = [1, 5]
+        registry.callback("cache_size", "Size of the cache.", lambda: values[-1])
+
+        assert registry.render().splitlines()[-1] == "cache_size 5"
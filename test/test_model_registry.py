@@ -0,0 +1,145 @@
+import os
+import pickle
+import shutil
+import time
+
+import pytest
+
+from game_and_agent import DenseQTable, write_q_table_file
+from model_registry import ModelRegistry, ModelSpec
+
+
+def copy_spec(tmp_path, policies: bool = True) -> ModelSpec:
+    """
+    Copies the files of the shipped model to tmp_path and returns their spec.
+    """
+    paths = {}
+    for role in ["first", "second"]:
+        paths[f"q_table_{role}"] = str(tmp_path / f"q_table_{role}.qtab")
+        shutil.copy(f"q_table_ubuntu_agent_move_{role}.qtab", paths[f"q_table_{role}"])
+        if policies:
+            paths[f"policy_{role}"] = str(tmp_path / f"policy_{role}.npy")
+            shutil.copy(f"policy_agent_move_{role}.npy", paths[f"policy_{role}"])
+    return ModelSpec(**paths)
+
+
+def losing_spec(tmp_path) -> ModelSpec:
+    """
+    Returns the spec of a model whose Q-tables are empty, so that its policies pick any valid action.
+    """
+    path = str(tmp_path / "empty.qtab")
+    write_q_table_file(path, DenseQTable())
+    return ModelSpec(q_table_first=path, q_table_second=path)
+
+
+class TestModelRegistry:
+    def test_load_and_reload(self, tmp_path):
+        registry = ModelRegistry()
+        swapped = []
+        registry.swap_listeners.append(swapped.append)
+
+        model = registry.load("default", copy_spec(tmp_path, policies=False))
+        assert registry.get() is model and model.version == 1
+        assert model.agent1.get_best_actions("000000000", [(1, 1)])
+
+        reloaded = registry.load_in_background("default").result()
+        assert registry.get() is reloaded and reloaded.version == 2
+        assert reloaded.spec == model.spec
+        assert swapped == ["default", "default"]
+
+        with pytest.raises(KeyError):
+            registry.load("unknown")
+
+    def test_losing_model_is_not_swapped_in(self, tmp_path):
+        registry = ModelRegistry()
+        model = registry.load("default", copy_spec(tmp_path))
+
+        with pytest.raises(ValueError, match="can lose"):
+            registry.load("default", losing_spec(tmp_path))
+        assert registry.get() is model
+
+        registry.verify = False
+        assert registry.load("default", losing_spec(tmp_path)).version == 2
+
+    def test_pickles_are_refused(self, tmp_path):
+        path = str(tmp_path / "q_table.pkl")
+        with open(path, "wb") as file:
+            pickle.dump({}, file)
+
+        with pytest.raises(ValueError, match="not a binary Q-table file"):
+            ModelRegistry().load("default", ModelSpec(q_table_first=path, q_table_second=path))
+
+    def test_named_models(self, tmp_path):
+        registry = ModelRegistry()
+        registry.load("default", copy_spec(tmp_path))
+        registry.load("b", copy_spec(tmp_path, policies=False))
+
+        assert registry.get("b").name == "b"
+        registry.remove("b")
+        with pytest.raises(KeyError):
+            registry.get("b")
+        with pytest.raises(ValueError):
+            registry.remove("default")
+
+    def test_watcher(self, tmp_path):
+        registry = ModelRegistry()
+        spec = copy_spec(tmp_path)
+        registry.load("default", spec)
+        errors = []
+        registry.start_watching(0.01, on_error=lambda name, error: errors.append(name))
+        try:
+            assert registry.changed_models() == []
+            mtime = os.stat(spec.q_table_first).st_mtime
+            os.utime(spec.q_table_first, (mtime + 10, mtime + 10))
+            deadline = time.time() + 5
+            while registry.get().version == 1 and time.time() < deadline:
+                time.sleep(0.01)
+            assert registry.get().version == 2
+
+            # A broken file is reported once, and the current model keeps serving. The file is replaced, as a
+            # deployment must do, since the current one is memory-mapped.
+            with open(spec.policy_second + ".tmp", "wb") as file:
+                file.write(b"not a policy")
+            os.replace(spec.policy_second + ".tmp", spec.policy_second)
+            deadline = time.time() + 5
+            while not errors and time.time() < deadline:
+                time.sleep(0.01)
+            time.sleep(0.05)
+            assert errors == ["default"]
+            assert registry.get().version == 2
+        finally:
+            registry.stop()
+
+    def test_manifest_shared_by_processes(self, tmp_path):
+        manifest_path = str(tmp_path / "models.json")
+        worker = ModelRegistry(manifest_path=manifest_path)
+        other_worker = ModelRegistry(manifest_path=manifest_path)
+        spec = copy_spec(tmp_path)
+
+        worker.load("default", spec)
+        worker.load("b", copy_spec(tmp_path, policies=False))
+        assert set(other_worker.sync()) == {"default", "b"}
+        assert other_worker.get("b").spec == worker.get("b").spec
+        assert other_worker.sync() == []
+
+        # An explicit reload gets a new version everywhere.
+        worker.load_in_background("b").result()
+        other_worker.sync()
+        assert worker.get("b").version == other_worker.get("b").version == 2
+
+        # A change of the files is reloaded by the watcher of each process, but gets a single new version.
+        mtime = os.stat(spec.q_table_first).st_mtime
+        os.utime(spec.q_table_first, (mtime + 10, mtime + 10))
+        worker.load("default", files_changed=True)
+        other_worker.load("default", files_changed=True)
+        assert worker.get().version == other_worker.get().version == 2
+
+        worker.remove("b")
+        assert other_worker.sync() == ["b"]
+        with pytest.raises(KeyError):
+            other_worker.get("b")
+
+        # A new process starts with the models of the manifest.
+        new_worker = ModelRegistry(manifest_path=manifest_path)
+        new_worker.sync()
+        assert list(new_worker.models) == ["default"] and new_worker.get().version == 2
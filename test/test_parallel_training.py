@@ -0,0 +1,39 @@
+from game_and_agent import QLearningAgent
+from parallel_training import merge_deltas, train_parallel, train_worker
+from training_agent_that_move_first import play_episode_agent_move_first
+
+
+class TestParallelTraining:
+    def test_merge_deltas(self):
+        q_table = {("000000000", (0, 0)): 0.5}
+        worker_deltas = [
+            {("000000000", (0, 0)): 0.2, ("000000000", (1, 1)): -0.1},
+            {("000000000", (0, 0)): 0.4},
+        ]
+
+        merge_deltas(q_table, worker_deltas)
+
+        assert q_table == {
+            ("000000000", (0, 0)): 0.8,
+            ("000000000", (1, 1)): -0.1,
+        }
+
+    def test_train_parallel(self):
+        agent = QLearningAgent()
+        train_parallel(agent, "first", episodes=400, workers=2, sync_interval=100)
+
+        assert agent.q_table
+        assert all(-1 <= value <= 1 for value in agent.q_table.values())
+
+    def test_worker_keeps_the_learning_rate_and_prints_nothing(self, capsys, monkeypatch):
+        alphas = set()
+
+        def play_episode(agent, game):
+            alphas.add(agent.alpha)
+            return play_episode_agent_move_first(agent, game)
+
+        monkeypatch.setattr("parallel_training.play_episode_agent_move_first", play_episode)
+        deltas = train_worker(("first", {}, 0.1, 0.1, 10001, "0"))
+
+        assert deltas and alphas == {0.1}
+        assert capsys.readouterr().out == ""
@@ -1,5 +1,20 @@
-from game_and_agent import QLearningAgent, TicTacToe
+from game_and_agent import (
+    DenseQTable,
+    NegamaxAgent,
+    PolicyAgent,
+    QLearningAgent,
+    TicTacToe,
+    VecTicTacToe,
+    WIN_MASKS,
+    canonicalize_q_table,
+    is_q_table_file,
+    reachable_state_keys,
+    write_q_table_file,
+)
+import os
+
 import numpy as np
+import pytest
 
 state_key = "200000000"
 action = (0, 1)
@@ -25,6 +40,144 @@ class TestQLearningAgent:
              ('002100000', (2, 1))
         }
 
+    def test_get_symmetrical_state_action_pairs_of_symmetric_state(self):
+        agent = QLearningAgent()
+        result = agent.get_symmetrical_state_action_pairs("000020000", (0, 1))
+
+        assert len(result) == 8 and set(result) == {
+            ("000020000", (0, 1)),
+            ("000020000", (1, 0)),
+            ("000020000", (2, 1)),
+            ("000020000", (1, 2)),
+        }
+
+    def test_get_symmetrical_state_action_pairs_invalid_action(self):
+        agent = QLearningAgent()
+        with pytest.raises(Exception):
+            agent.get_symmetrical_state_action_pairs("010000200", (0, 1))
+
+    def test_canonical_q_table_learn(self):
+        agent = QLearningAgent(canonical_q_table=True)
+        agent.learn("000020000", (0, 1), -1, "000020000", [])
+
+        assert len(agent.q_table) == 1
+        assert agent.get_q_value("000020000", (2, 1)) == agent.get_q_value(
+            "000020000", (0, 1)
+        ) == -0.1
+        assert agent.get_q_value("000020000", (0, 0)) == 0
+
+    def test_canonicalize_q_table(self):
+        agent = QLearningAgent()
+        agent.learn("010000200", (1, 2), 1, "010001200", [])
+        canonical_agent = QLearningAgent(canonical_q_table=True)
+        canonical_agent.q_table = canonicalize_q_table(agent.q_table)
+
+        assert len(agent.q_table) == 8 and len(canonical_agent.q_table) == 1
+        assert all(
+            canonical_agent.get_q_value(state_key, action) == value
+            for (state_key, action), value in agent.q_table.items()
+        )
+
+    def test_dense_q_table(self):
+        agent = QLearningAgent(dense_q_table=True)
+        agent.learn("000020000", (0, 0), -0.5, "000020000", [])
+
+        assert len(agent.q_table) == 4
+        assert agent.get_q_value("000020000", (2, 2)) == pytest.approx(-0.05)
+        assert agent.get_q_value("000020000", (0, 1)) == 0
+        assert agent.choose_action(
+            "000020000", [(0, 0), (0, 1)], is_learning=False
+        ) == (0, 1)
+
+        q_table = agent.q_table.to_dict()
+        assert DenseQTable.from_dict(q_table).to_dict() == q_table
+        assert ("000020000", (0, 2)) in q_table
+
+    def test_dense_learn_matches_dict_learn(self):
+        agent = QLearningAgent()
+        dense_agent = QLearningAgent(dense_q_table=True)
+        for learning_agent in (agent, dense_agent):
+            learning_agent.learn("010000200", (1, 2), -0.1, "010001220", [(0, 0), (0, 2)])
+            learning_agent.learn("010001220", (0, 0), 1, "110001220", [])
+
+        assert dense_agent.q_table.to_dict() == pytest.approx(agent.q_table)
+        with pytest.raises(Exception):
+            dense_agent.learn("010000200", (0, 1), 1, "010000200", [])
+
+    def test_learn_batch_matches_learn(self):
+        agent = QLearningAgent(dense_q_table=True)
+        agent.learn("010000200", (1, 2), -0.1, "010001220", [(0, 0), (0, 2)])
+        batch_agent = QLearningAgent(dense_q_table=True)
+        batch_agent.learn_batch(
+            np.array([int("010000200", 3)]),
+            np.array([5]),
+            np.array([-0.1]),
+            np.array([int("010001220", 3)]),
+            TicTacToe.state_key_to_board("010001220").reshape((1, 9)) == 0,
+            np.array([False]),
+        )
+
+        assert batch_agent.q_table.to_dict() == agent.q_table.to_dict()
+
+    def test_q_table_file_round_trip(self, tmp_path):
+        agent = QLearningAgent(dense_q_table=True)
+        agent.learn("010000200", (1, 2), 1, "010001200", [])
+        path = str(tmp_path / "q_table.qtab")
+        write_q_table_file(path, agent.q_table)
+
+        loaded_agent = QLearningAgent(pre_trained_q_table=path)
+
+        assert is_q_table_file(path) and not loaded_agent.canonical_q_table
+        assert loaded_agent.q_table.to_dict() == agent.q_table.to_dict()
+
+    @pytest.mark.parametrize("role", ["first", "second"])
+    def test_shipped_q_table_files_keep_the_best_actions(self, role):
+        pickled_agent = QLearningAgent(pre_trained_q_table=f"q_table_ubuntu_agent_move_{role}.pkl")
+        agent = QLearningAgent(pre_trained_q_table=f"q_table_ubuntu_agent_move_{role}.qtab")
+
+        game = TicTacToe()
+        for state_key in reachable_state_keys(agent_moves_first=role == "first"):
+            game.set_board_by_state_key(state_key)
+            valid_actions = game.get_valid_actions()
+            assert agent.get_best_actions(state_key, valid_actions) == pickled_agent.get_best_actions(
+                state_key, valid_actions
+            ), state_key
+
+    def test_overwrite_memory_mapped_files(self, tmp_path):
+        """
+        Writing a Q-table file or a policy over one that is memory-mapped replaces it, so the mapping keeps the
+        old content instead of crashing the process when the file is truncated.
+        """
+        agent = QLearningAgent(dense_q_table=True)
+        agent.learn("010000200", (1, 2), 1, "010001200", [])
+        path = str(tmp_path / "q_table.qtab")
+        write_q_table_file(path, agent.q_table)
+        served_agent = QLearningAgent(pre_trained_q_table=path)
+        policy_path = str(tmp_path / "policy.npy")
+        PolicyAgent.from_agent(agent, True).save(policy_path)
+        served_policy = PolicyAgent.load(policy_path)
+        masks = np.array(served_policy.best_action_masks)
+
+        write_q_table_file(path, DenseQTable())
+        PolicyAgent(np.zeros_like(masks)).save(policy_path)
+
+        assert served_agent.get_q_value("010000200", (1, 2)) == agent.get_q_value("010000200", (1, 2))
+        assert (served_policy.best_action_masks == masks).all()
+        assert QLearningAgent(pre_trained_q_table=path).q_table.to_dict() == {}
+        assert not PolicyAgent.load(policy_path).best_action_masks.any()
+        assert sorted(os.listdir(tmp_path)) == ["policy.npy", "q_table.qtab"]
+
+    def test_canonical_q_table_file(self, tmp_path):
+        agent = QLearningAgent(canonical_q_table=True, dense_q_table=True)
+        agent.learn("010000200", (1, 2), 1, "010001200", [])
+        path = str(tmp_path / "q_table.qtab")
+        write_q_table_file(path, agent.q_table, canonical=True)
+
+        loaded_agent = QLearningAgent(pre_trained_q_table=path)
+
+        assert loaded_agent.canonical_q_table and len(loaded_agent.q_table) == 1
+        assert loaded_agent.get_q_value("000100002", (0, 1)) == pytest.approx(0.1)
+
 class TestGame:
     def test_move_record(self):
         state_key = "212000000"
@@ -88,3 +241,201 @@ class TestGame:
         result = TicTacToe.state_key_to_board(state_key)
 
         assert (result == np.array([[2, 0, 0], [0, 0, 0], [0, 0, 0]])).all()
+
+    def test_check_win_and_draw(self):
+        game = TicTacToe()
+        game.set_board_by_state_key("110220000")
+        assert not game.check_win(1) and not game.check_win(2)
+
+        game.make_move(1, 2, 2)
+        assert game.check_win(2) and not game.check_win(1)
+
+        game.withdraw_move(1, 2)
+        assert not game.check_win(2)
+
+        game.set_board_by_state_key("121121210")
+        assert not game.check_draw()
+        game.make_move(2, 2, 2)
+        assert game.check_draw() and not game.check_win(1) and not game.check_win(2)
+        assert game.get_valid_actions() == []
+
+    def test_winning_and_blocking_moves(self):
+        game = TicTacToe()
+        game.set_board_by_state_key("110220000")
+        assert game.winning_moves(1) == [(0, 2)]
+        assert game.winning_moves(2) == [(1, 2)]
+        assert game.blocking_moves(1) == [(1, 2)]
+
+        # A line blocked by the opponent is not a threat, and two threats are in the order of get_valid_actions.
+        game.set_board_by_state_key("102010200")
+        assert game.winning_moves(1) == [(2, 2)]
+        assert game.winning_moves(2) == []
+        game.set_board_by_state_key("110100002")
+        assert game.winning_moves(1) == [(0, 2), (2, 0)]
+        assert game.blocking_moves(2) == [(0, 2), (2, 0)]
+
+    def test_winning_moves_match_trying_every_move(self):
+        game = TicTacToe()
+        for state_key in reachable_state_keys(True) + reachable_state_keys(False):
+            game.set_board_by_state_key(state_key)
+            for player in (1, 2):
+                expected = []
+                for action in game.get_valid_actions():
+                    game.make_move(*action, player)
+                    if game.check_win(player):
+                        expected.append(action)
+                    game.withdraw_move(*action)
+                assert game.winning_moves(player) == expected
+
+    def test_line_counters(self):
+        """
+        The incremental line counters agree with a scan of the lines after every move and withdrawal of random
+        games, and after set_board_by_state_key.
+        """
+        rng = np.random.default_rng(0)
+        game = TicTacToe()
+        for _ in range(200):
+            game.reset()
+            for ply in range(9):
+                x, y = game.get_valid_actions()[rng.integers(9 - ply)]
+                game.make_move(x, y, ply % 2 + 1)
+                if rng.random() < 0.3:
+                    game.withdraw_move(x, y)
+                    game.make_move(x, y, ply % 2 + 1)
+                for player in (1, 2):
+                    assert game.check_win(player) == any(
+                        game.bitboards[player] & mask == mask for mask in WIN_MASKS
+                    )
+                scanned = TicTacToe()
+                scanned.set_board_by_state_key(game.get_state_key())
+                assert scanned.line_counters == game.line_counters
+
+    def test_board_round_trip(self):
+        state_key = "120021102"
+        game = TicTacToe()
+        game.set_board(TicTacToe.state_key_to_board(state_key))
+
+        assert (
+            game.get_state_key() == state_key
+            and TicTacToe.board_to_state_key(game.board) == state_key
+            and game.get_valid_actions() == [(0, 2), (1, 0), (2, 1)]
+        )
+
+
+class TestVecTicTacToe:
+    def test_step(self):
+        games = VecTicTacToe(3)
+        for i, state_key in enumerate(["110220000", "121121210", "000000000"]):
+            games.boards[i] = TicTacToe.state_key_to_board(state_key).flatten()
+
+        wins, draws = games.step(np.array([2, 8, 4]), 1, np.array([True, False, True]))
+
+        assert wins.tolist() == [True, False, False]
+        assert draws.tolist() == [False, False, False]
+        assert games.get_ranks().tolist() == [0, int("121121210", 3), int("000010000", 3)]
+
+        wins, draws = games.step(np.array([0, 8, 0]), 2, np.array([False, True, False]))
+        assert draws.tolist() == [False, True, False] and not wins.any()
+        assert games.get_ranks()[1] == 0
+
+    def test_get_winning_cells(self):
+        games = VecTicTacToe(3)
+        for i, state_key in enumerate(["110220000", "102000102", "120000000"]):
+            games.boards[i] = TicTacToe.state_key_to_board(state_key).flatten()
+
+        assert games.get_winning_cells(1).tolist() == [2, 3, -1]
+        assert games.get_winning_cells(2).tolist() == [5, 5, -1]
+
+
+class TestNegamaxAgent:
+    def test_solve(self):
+        agent = NegamaxAgent()
+
+        assert agent.solve("000000000") == 0
+        # 1 to move wins at once, and 2 threatens to win at (1, 2).
+        assert agent.get_best_actions(
+            "110220000", [(0, 2), (1, 2), (2, 0), (2, 1), (2, 2)]
+        ) == [(0, 2)]
+        assert agent.solve("110220000") == 1 + 4
+
+    def test_value_table(self):
+        agent = NegamaxAgent()
+        value_table = agent.value_table(agent_moves_first=False)
+
+        assert {state_key for state_key, _ in value_table} == set(
+            reachable_state_keys(agent_moves_first=False)
+        )
+        assert value_table[("000020000", (0, 1))] == -1
+        assert value_table[("000020000", (0, 0))] == 0
+
+        q_learning_agent = QLearningAgent()
+        q_learning_agent.q_table = value_table
+        assert agent.score_agent(q_learning_agent, agent_moves_first=False) == 1
+
+
+class TestPolicyAgent:
+    def test_from_agent(self, tmp_path):
+        agent = QLearningAgent(
+            pre_trained_q_table="q_table_ubuntu_agent_move_second.qtab"
+        )
+        path = str(tmp_path / "policy.npy")
+        PolicyAgent.from_agent(agent, agent_moves_first=False).save(path)
+        policy_agent = PolicyAgent.load(path, fallback=agent)
+
+        for state_key in reachable_state_keys(agent_moves_first=False):
+            valid_actions = [
+                divmod(cell, 3) for cell, value in enumerate(state_key) if value == "0"
+            ]
+            best_actions = agent.get_best_actions(state_key, valid_actions)
+            assert policy_agent.get_best_actions(state_key, valid_actions) == best_actions
+            assert policy_agent.choose_action(state_key, valid_actions, False) in best_actions
+
+    def test_fallback(self):
+        agent = QLearningAgent()
+        agent.set_q_value("100000000", (1, 1), 1)
+        policy_agent = PolicyAgent(np.zeros(3**9, dtype=np.uint16), fallback=agent)
+
+        assert policy_agent.choose_action("100000000", [(1, 1), (2, 2)], False) == (1, 1)
+        with pytest.raises(KeyError):
+            PolicyAgent(np.zeros(3**9, dtype=np.uint16)).get_best_actions(
+                "100000000", [(1, 1)]
+            )
+
+    @pytest.mark.parametrize("role", ["first", "second"])
+    def test_shipped_policies_match_the_pickled_q_tables(self, role):
+        agent = QLearningAgent(pre_trained_q_table=f"q_table_ubuntu_agent_move_{role}.pkl")
+        masks = PolicyAgent.load(f"policy_agent_move_{role}.npy").best_action_masks
+
+        for state_key in reachable_state_keys(agent_moves_first=role == "first"):
+            valid_actions = [
+                divmod(cell, 3) for cell, value in enumerate(state_key) if value == "0"
+            ]
+            best_cells = {3 * x + y for x, y in agent.get_best_actions(state_key, valid_actions)}
+            mask = int(masks[int(state_key, 3)])
+            assert {cell for cell in range(9) if mask >> cell & 1} == best_cells, state_key
+
+    def test_choose_actions(self):
+        agent = QLearningAgent(
+            pre_trained_q_table="q_table_ubuntu_agent_move_first.pkl"
+        )
+        # The batched fallback needs a dense Q-table.
+        fallback = QLearningAgent(
+            pre_trained_q_table="q_table_ubuntu_agent_move_first.pkl", dense_q_table=True
+        )
+        policy_agent = PolicyAgent.load("policy_agent_move_first.npy", fallback=fallback)
+        state_keys = reachable_state_keys(agent_moves_first=True) + ["200000000"]
+        ranks = np.array([int(state_key, 3) for state_key in state_keys])
+        valid_mask = np.array(
+            [[value == "0" for value in state_key] for state_key in state_keys]
+        )
+
+        cells = policy_agent.choose_actions(ranks, valid_mask, is_learning=False)
+        for state_key, cell in zip(state_keys, cells):
+            valid_actions = [
+                divmod(cell, 3) for cell, value in enumerate(state_key) if value == "0"
+            ]
+            assert divmod(int(cell), 3) in agent.get_best_actions(state_key, valid_actions)
+        with pytest.raises(KeyError):
+            PolicyAgent(np.zeros(3**9, dtype=np.uint16)).choose_actions(
+                ranks[:1], valid_mask[:1], is_learning=False
+            )
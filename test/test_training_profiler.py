@@ -0,0 +1,81 @@
+import random
+import signal
+
+import pytest
+
+from game_and_agent import QLearningAgent
+from training_agent_that_move_first import play_game_agent_move_first
+from training_agent_that_move_second import play_game_agent_move_second
+from training_profiler import PhaseTimer, SamplingProfiler
+
+
+class TestPhaseTimer:
+    def test_lap(self):
+        timer = PhaseTimer()
+        timer.lap("a")
+        timer.lap("b")
+        timer.lap("a")
+        timer.end_episode(5)
+        timer.end_episode(7)
+
+        assert set(timer.phase_seconds) == {"a", "b"}
+        assert all(seconds >= 0 for seconds in timer.phase_seconds.values())
+        assert (timer.episodes, timer.plies) == (2, 12)
+
+    def test_report(self):
+        timer = PhaseTimer()
+        timer.lap("learn")
+        timer.end_episode(9)
+        first_report = timer.report(100)
+        timer.end_episode(9)
+        second_report = timer.report(150)
+
+        assert "episodes/s" in first_report and "plies/s" in first_report
+        assert "Q-table size 100." in first_report
+        assert "Q-table size 150 (+50)." in second_report
+        assert "learn 100.0%" in second_report
+
+    @pytest.mark.parametrize("role", ["first", "second"])
+    def test_training_is_unchanged(self, role, capsys):
+        """
+        Timing the phases must not change the training.
+        """
+        q_tables = []
+        timer = PhaseTimer()
+        for phase_timer in (None, timer):
+            random.seed(0)
+            agent = QLearningAgent()
+            if role == "first":
+                play_game_agent_move_first(agent, episodes=300, timer=phase_timer)
+            else:
+                opponent = QLearningAgent(
+                    epsilon=0.5, pre_trained_q_table="q_table_ubuntu_agent_move_first.pkl"
+                )
+                play_game_agent_move_second(agent, opponent, episodes=300, timer=phase_timer)
+            q_tables.append(agent.q_table)
+
+        assert q_tables[0] == q_tables[1]
+        assert timer.episodes == 300
+        assert 5 * 300 <= timer.plies <= 9 * 300
+        assert {"choose_action", "learn", "win_threat_scan", "check_win/check_draw"} <= set(
+            timer.phase_seconds
+        )
+        assert "Q-table size" in capsys.readouterr().out
+
+
+@pytest.mark.skipif(not hasattr(signal, "SIGPROF"), reason="SIGPROF is not available")
+class TestSamplingProfiler:
+    def test_write_folded_stacks(self, tmp_path):
+        random.seed(0)
+        with SamplingProfiler(interval=0.001) as profiler:
+            play_game_agent_move_first(QLearningAgent(), episodes=2000)
+        path = tmp_path / "training.folded"
+        profiler.write(str(path))
+
+        lines = path.read_text().splitlines()
+        assert lines
+        for line in lines:
+            stack, count = line.rsplit(" ", 1)
+            assert int(count) > 0
+        assert any("play_game_agent_move_first" in line for line in lines)
+        assert signal.getsignal(signal.SIGPROF) is not profiler.sample
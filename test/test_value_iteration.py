@@ -0,0 +1,33 @@
+import pytest
+
+from evaluation import verify_policy
+from game_and_agent import QLearningAgent, TicTacToe
+from value_iteration import (
+    build_transitions,
+    random_opponent,
+    value_iteration,
+)
+
+
+class TestValueIteration:
+    def test_random_opponent_takes_winning_move(self):
+        game = TicTacToe()
+        game.set_board_by_state_key("110220100")
+
+        assert random_opponent(game) == [((1, 2), 1.0)]
+
+    def test_value_iteration_first_mover(self):
+        transitions = build_transitions(True, random_opponent)
+        q_table = value_iteration(transitions, method="sync")
+
+        assert q_table == pytest.approx(
+            value_iteration(transitions, method="prioritized")
+        )
+        # The agent wins at once at (0, 2).
+        assert q_table[("110220000", (0, 2))] == 1
+        # The opponent wins at once at (1, 2) after any other move.
+        assert q_table[("110220000", (2, 2))] == -1
+
+        agent = QLearningAgent()
+        agent.q_table = q_table
+        assert verify_policy(agent, agent_moves_first=True).never_loses
@@ -0,0 +1,433 @@
+import random
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi.testclient import TestClient
+
+import tictactoe_webapp
+from game_and_agent import DenseQTable, TicTacToe, write_q_table_file
+from model_registry import ModelRegistry, ModelSpec
+from tictactoe_webapp import app, models, play_move, state_key_to_cells
+
+
+def random_request(rng: random.Random) -> dict:
+    """
+    Returns a /make_move request for a random position in which the human is to move.
+    """
+    player_who_move_first = rng.choice(["X", "O"])
+    game = TicTacToe()
+    player = 1 if player_who_move_first == "X" else 2
+    while True:
+        game.make_move(*rng.choice(game.get_valid_actions()), player)
+        if game.check_win(player) or game.check_draw():
+            game.reset()
+            player = 1 if player_who_move_first == "X" else 2
+            continue
+        player = 3 - player
+        if player == 2 and rng.random() < 0.5:
+            break
+    x, y = rng.choice(game.get_valid_actions())
+    return {
+        "state": {
+            "board": state_key_to_cells(game.get_state_key()),
+            "player_who_move_first": player_who_move_first,
+            "message": "",
+        },
+        "x": x,
+        "y": y,
+    }
+
+
+def check_response(request: dict, response: dict) -> None:
+    """
+    Checks that a /make_move response is the human's move followed by one of the best moves of the AI.
+    """
+    state = request["state"]
+    game = TicTacToe()
+    game.set_board_by_state_key(
+        "".join({"": "0", "X": "1", "O": "2"}[cell] for row in state["board"] for cell in row)
+    )
+    game.make_move(request["x"], request["y"], 2)
+    assert response["player_who_move_first"] == state["player_who_move_first"]
+
+    if game.check_win(2) or game.check_draw():
+        assert response["board"] == state_key_to_cells(game.get_state_key())
+        assert response["message"] == ("You win!" if game.check_win(2) else "It is a draw!")
+        return
+
+    model = models.get()
+    agent = model.agent1 if state["player_who_move_first"] == "X" else model.agent2
+    best_actions = agent.get_best_actions(game.get_state_key(), game.get_valid_actions())
+    ai_moves = [
+        (x, y)
+        for x in range(3)
+        for y in range(3)
+        if response["board"][x][y] == "X" and game.is_valid_move(x, y)
+    ]
+    assert len(ai_moves) == 1 and ai_moves[0] in best_actions
+    game.make_move(*ai_moves[0], 1)
+    assert response["board"] == state_key_to_cells(game.get_state_key())
+    expected_message = ""
+    if game.check_win(1):
+        expected_message = "AI wins!"
+    if game.check_draw():
+        expected_message = "It is a draw!"
+    assert response["message"] == expected_message
+
+
+class TestWebApp:
+    def test_invalid_moves(self):
+        board = [["X", "", ""], ["", "", ""], ["", "", ""]]
+
+        assert play_move(board, "X", 0, 0) == (board, "Invalid Move!")
+        assert play_move(board, "X", 3, 0) == (board, "Invalid Move!")
+        assert play_move([["Z", "", ""]] * 3, "X", 1, 1)[1] == "Invalid Move!"
+
+    def test_play_move_does_not_modify_its_arguments(self):
+        board = [["X", "", ""], ["", "", ""], ["", "", ""]]
+        new_board, message = play_move(board, "X", 1, 1)
+
+        assert board == [["X", "", ""], ["", "", ""], ["", "", ""]]
+        assert new_board[1][1] == "O" and message == ""
+
+    def test_concurrent_requests(self):
+        rng = random.Random(0)
+        requests = [random_request(rng) for _ in range(400)]
+        client = TestClient(app)
+
+        with ThreadPoolExecutor(max_workers=32) as executor:
+            responses = list(
+                executor.map(
+                    lambda request: client.post("/make_move", json=request), requests
+                )
+            )
+
+        for request, response in zip(requests, responses):
+            assert response.status_code == 200
+            check_response(request, response.json())
+
+    def test_concurrent_play_move(self):
+        rng = random.Random(1)
+        requests = [random_request(rng) for _ in range(2000)]
+
+        def call(request: dict) -> dict:
+            state = request["state"]
+            board, message = play_move(
+                state["board"], state["player_who_move_first"], request["x"], request["y"]
+            )
+            return {
+                "board": board,
+                "player_who_move_first": state["player_who_move_first"],
+                "message": message,
+            }
+
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            responses = list(executor.map(call, requests))
+
+        for request, response in zip(requests, responses):
+            check_response(request, response)
+
+    def test_batch(self):
+        rng = random.Random(2)
+        requests = [random_request(rng) for _ in range(1000)]
+        invalid_move = random_request(rng)
+        invalid_move["x"] = 3
+        items = requests[:500] + [{"x": 1, "y": 1}, 7, invalid_move] + requests[500:]
+
+        response = TestClient(app).post("/make_moves", json=items)
+
+        assert response.status_code == 200
+        results = response.json()
+        assert len(results) == len(items)
+        assert results[500]["state"] is None and "state" in results[500]["error"]
+        assert results[501]["state"] is None and results[501]["error"]
+        assert results[502]["error"] is None
+        assert results[502]["state"]["message"] == "Invalid Move!"
+        assert results[502]["state"]["board"] == invalid_move["state"]["board"]
+        for request, result in zip(requests, results[:500] + results[503:]):
+            assert result["error"] is None
+            check_response(request, result["state"])
+
+    def test_terminal_boards(self):
+        boards_and_moves = [
+            # The AI has already won.
+            ([["X", "X", "X"], ["O", "O", ""], ["", "", ""]], (2, 0)),
+            # The human has already won, or wins with the move.
+            ([["O", "O", "O"], ["X", "X", ""], ["X", "", ""]], (1, 2)),
+            ([["O", "O", ""], ["X", "X", ""], ["X", "", ""]], (0, 2)),
+            # The move fills the board.
+            ([["X", "O", "X"], ["X", "O", "O"], ["O", "X", ""]], (2, 2)),
+        ]
+        items = [
+            {"state": {"board": board, "player_who_move_first": "X", "message": ""}, "x": x, "y": y}
+            for board, (x, y) in boards_and_moves
+        ]
+        client = TestClient(app)
+
+        results = client.post("/make_moves", json=items).json()
+
+        for item, result in zip(items, results):
+            state = client.post("/make_move", json=item).json()
+            assert result == {"state": state, "error": None}
+        assert [result["state"]["message"] for result in results] == [
+            "AI wins!",
+            "You win!",
+            "You win!",
+            "It is a draw!",
+        ]
+        assert results[0]["state"]["board"] == [["X", "X", "X"], ["O", "O", ""], ["O", "", ""]]
+
+    def test_batch_size_limit(self):
+        rng = random.Random(4)
+        items = [random_request(rng)] * (tictactoe_webapp.MAX_BATCH_SIZE + 1)
+
+        response = TestClient(app).post("/make_moves", json=items)
+
+        assert response.status_code == 413
+
+    def test_websocket(self):
+        rng = random.Random(3)
+        client = TestClient(app)
+        with client.websocket_connect("/ws") as websocket:
+            websocket.send_json({"x": 0, "y": 0})
+            assert websocket.receive_json()["message"] == "Invalid Move!"
+
+            for player_who_move_first in ["X", "O"] * 10:
+                websocket.send_json({"new_game": player_who_move_first})
+                state = websocket.receive_json()
+                cells = [cell for row in state["board"] for cell in row]
+                assert state["message"] == ""
+                assert cells.count("X") == (player_who_move_first == "X")
+                assert cells.count("O") == 0
+
+                while state["message"] == "":
+                    occupied = [
+                        (x, y) for x in range(3) for y in range(3) if state["board"][x][y]
+                    ]
+                    if occupied:
+                        websocket.send_json({"x": occupied[0][0], "y": occupied[0][1]})
+                        assert websocket.receive_json() == {**state, "message": "Invalid Move!"}
+
+                    x, y = rng.choice(
+                        [(x, y) for x in range(3) for y in range(3) if not state["board"][x][y]]
+                    )
+                    request = {"state": state, "x": x, "y": y}
+                    websocket.send_json({"x": x, "y": y})
+                    state = websocket.receive_json()
+                    check_response(request, state)
+                    assert state["message"] != "You win!"
+
+                websocket.send_json({"x": 0, "y": 0})
+                assert websocket.receive_json()["message"] == "Invalid Move!"
+
+    def test_websocket_sessions_are_independent(self):
+        client = TestClient(app)
+        with client.websocket_connect("/ws") as first, client.websocket_connect("/ws") as second:
+            first.send_json({"new_game": "O"})
+            second.send_json({"new_game": "O"})
+            first.receive_json()
+            second.receive_json()
+
+            first.send_json({"x": 1, "y": 1})
+            assert first.receive_json()["board"][1][1] == "O"
+            second.send_json({"x": 0, "y": 0})
+            board = second.receive_json()["board"]
+            assert board[0][0] == "O" and board[1][1] != "O"
+            second.send_json("not a move")
+            assert second.receive_json()["message"] == "Invalid Move!"
+
+    def test_compact_format(self):
+        rng = random.Random(4)
+        client = TestClient(app)
+        for _ in range(200):
+            request = random_request(rng)
+            state = request["state"]
+            state_key = "".join(
+                {"": "0", "X": "1", "O": "2"}[cell] for row in state["board"] for cell in row
+            )
+            response = client.post(
+                "/make_move_compact",
+                json={
+                    "state_key": state_key,
+                    "player_who_move_first": state["player_who_move_first"],
+                    "x": request["x"],
+                    "y": request["y"],
+                },
+            ).json()
+            check_response(
+                request,
+                {
+                    "board": state_key_to_cells(response["state_key"]),
+                    "player_who_move_first": response["player_who_move_first"],
+                    "message": response["message"],
+                },
+            )
+
+    def test_compact_format_without_move(self):
+        client = TestClient(app)
+        response = client.post(
+            "/make_move_compact", json={"state_key": "000000000", "player_who_move_first": "X"}
+        ).json()
+
+        assert response["state_key"].count("1") == 1
+        assert response["state_key"].count("0") == 8
+        assert response["message"] == ""
+
+    def test_compact_format_invalid_moves(self):
+        client = TestClient(app)
+        for item in [
+            {"state_key": "00000000", "x": 0, "y": 0},
+            {"state_key": "000030000", "x": 0, "y": 0},
+            {"state_key": "100000000", "x": 0, "y": 0},
+            {"state_key": "100000000", "x": 0, "y": 3},
+            {"state_key": "100000000", "x": 1},
+            {"state_key": "111220000"},
+        ]:
+            response = client.post(
+                "/make_move_compact", json={**item, "player_who_move_first": "X"}
+            ).json()
+            assert response == {
+                "state_key": item["state_key"],
+                "player_who_move_first": "X",
+                "message": "Invalid Move!",
+            }
+
+    def test_move_cache(self):
+        board = [["X", "", ""], ["", "", ""], ["", "", ""]]
+        tictactoe_webapp.resolve_agent_turn.cache_clear()
+
+        random.seed(0)
+        outcomes = set()
+        for _ in range(50):
+            new_board, message = play_move(board, "X", 1, 1)
+            outcomes.add(str(new_board))
+        info = TestClient(app).get("/move_cache").json()
+        assert info["misses"] == 1 and info["hits"] == 49 and info["currsize"] == 1
+
+        # Random tie-breaking happens after the cache, over all the best actions.
+        game = TicTacToe()
+        game.set_board_by_state_key("100020000")
+        best_actions = models.get().agent1.get_best_actions("100020000", game.get_valid_actions())
+        assert len(outcomes) == len(best_actions)
+
+        models.load(models.default_name)
+        assert tictactoe_webapp.resolve_agent_turn.cache_info().currsize == 0
+
+    def test_metrics(self):
+        board = [["X", "", ""], ["", "", ""], ["", "", ""]]
+        with TestClient(app) as client:
+            outcomes = tictactoe_webapp.OUTCOMES
+            invalid_moves = outcomes.get("default", "invalid_move")
+            parses = tictactoe_webapp.STAGE_LATENCY.count("parse")
+            lookups = tictactoe_webapp.MOVE_CACHE_LOOKUPS
+            hits, misses = lookups.get("hit"), lookups.get("miss")
+            cache_hits = tictactoe_webapp.STAGE_LATENCY.count("cache_hit")
+            choose_actions = tictactoe_webapp.STAGE_LATENCY.count("choose_action")
+            tictactoe_webapp.resolve_agent_turn.cache_clear()
+
+            client.post(
+                "/make_move",
+                json={"state": {"board": board, "player_who_move_first": "X", "message": ""}, "x": 0, "y": 0},
+            )
+            for _ in range(2):
+                client.post(
+                    "/make_move",
+                    json={"state": {"board": board, "player_who_move_first": "X", "message": ""}, "x": 1, "y": 1},
+                )
+            response = client.get("/metrics")
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+        assert outcomes.get("default", "invalid_move") == invalid_moves + 1
+        assert tictactoe_webapp.STAGE_LATENCY.count("parse") == parses + 3
+        # The second move is served from the cache, and both are in the stage metrics.
+        assert (lookups.get("hit"), lookups.get("miss")) == (hits + 1, misses + 1)
+        assert tictactoe_webapp.STAGE_LATENCY.count("cache_hit") == cache_hits + 1
+        assert tictactoe_webapp.STAGE_LATENCY.count("choose_action") == choose_actions + 1
+        for line in [
+            "# TYPE tictactoe_stage_duration_seconds histogram",
+            'tictactoe_stage_duration_seconds_count{stage="board_conversion"}',
+            'tictactoe_request_duration_seconds_count{path="/make_move"}',
+            'tictactoe_outcomes_total{model="default",outcome="invalid_move"}',
+            "tictactoe_move_cache_hits_total",
+            'tictactoe_move_cache_lookups_total{result="hit"}',
+            'tictactoe_stage_duration_seconds_count{stage="cache_hit"}',
+        ]:
+            assert line in response.text
+
+    def test_models(self, tmp_path, monkeypatch):
+        for role in ["first", "second"]:
+            shutil.copy(f"q_table_ubuntu_agent_move_{role}.qtab", tmp_path / f"q_table_{role}.qtab")
+        write_q_table_file(str(tmp_path / "empty.qtab"), DenseQTable())
+        monkeypatch.setattr(tictactoe_webapp, "MODELS_DIR", str(tmp_path))
+        board = [["X", "", ""], ["", "", ""], ["", "", ""]]
+        body = {"state": {"board": board, "player_who_move_first": "X", "message": ""}, "x": 1, "y": 1}
+        spec = {"q_table_first": "q_table_first.qtab", "q_table_second": "q_table_second.qtab"}
+        client = TestClient(app)
+
+        # Without a configured token, the admin routes are disabled.
+        monkeypatch.setattr(tictactoe_webapp, "ADMIN_TOKEN", None)
+        assert client.get("/admin/models").status_code == 403
+        assert client.post("/admin/models/b", json=spec).status_code == 403
+
+        monkeypatch.setattr(tictactoe_webapp, "ADMIN_TOKEN", "secret")
+        assert client.post("/admin/models/b", json=spec).status_code == 403
+        assert (
+            client.post("/admin/models/b", json=spec, headers={"X-Admin-Token": "wrong"}).status_code
+            == 403
+        )
+        client.headers["X-Admin-Token"] = "secret"
+
+        # Only the .qtab and .npy files of the models directory can be loaded.
+        for q_table in ["../q_table_first.qtab", "/etc/passwd", "q_table_ubuntu_agent_move_first.pkl"]:
+            response = client.post(
+                "/admin/models/b", json={**spec, "q_table_first": q_table}
+            )
+            assert response.status_code == 422 and "models directory" in response.json()["detail"]
+        response = client.post("/admin/models/b", json={**spec, "q_table_first": "missing.qtab"})
+        assert response.status_code == 422 and response.json()["detail"] == "Could not load the model b."
+
+        response = client.post("/admin/models/b", json=spec)
+        assert response.status_code == 200 and response.json()["version"] == 1
+        try:
+            assert client.post("/make_move?model=b", json=body).headers["X-Model"] == "b:1"
+            assert client.post("/make_move", json=body).headers["X-Model"].startswith("default:")
+            assert client.post("/make_move?model=c", json=body).status_code == 404
+
+            # A model that can lose is rejected, and the current one keeps serving.
+            response = client.post(
+                "/admin/models/b",
+                json={"q_table_first": "empty.qtab", "q_table_second": "empty.qtab"},
+            )
+            assert response.status_code == 422 and "can lose" in response.json()["detail"]
+            assert client.post("/admin/models/b").json()["version"] == 2
+            assert [model["name"] for model in client.get("/admin/models").json()] == ["default", "b"]
+            assert client.post("/admin/models/c").status_code == 404
+        finally:
+            assert client.delete("/admin/models/b").json() == {"models": ["default"]}
+        assert client.delete("/admin/models/default").status_code == 422
+        assert client.delete("/admin/models/b").status_code == 404
+
+    def test_models_loaded_by_another_worker(self, tmp_path, monkeypatch):
+        for role in ["first", "second"]:
+            shutil.copy(f"q_table_ubuntu_agent_move_{role}.qtab", tmp_path / f"q_table_{role}.qtab")
+        manifest_path = str(tmp_path / "models.json")
+        monkeypatch.setattr(models, "manifest_path", manifest_path)
+        other_worker = ModelRegistry(manifest_path=manifest_path)
+        board = [["X", "", ""], ["", "", ""], ["", "", ""]]
+        body = {"state": {"board": board, "player_who_move_first": "X", "message": ""}, "x": 1, "y": 1}
+        client = TestClient(app)
+
+        other_worker.load(
+            "b",
+            ModelSpec(
+                q_table_first=str(tmp_path / "q_table_first.qtab"),
+                q_table_second=str(tmp_path / "q_table_second.qtab"),
+            ),
+        )
+        try:
+            assert client.post("/make_move?model=b", json=body).headers["X-Model"] == "b:1"
+        finally:
+            other_worker.remove("b")
+            models.sync()
+        assert "b" not in models.models
@@ -1,29 +1,277 @@
-from typing import List
+import asyncio
+import hmac
+import json
+import logging
+import os
+import queue
+import random
+import threading
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from logging.handlers import QueueHandler, QueueListener
+from time import perf_counter
+from typing import Any, List, Optional, Tuple
 
 import numpy as np
 import uvicorn
-from fastapi import FastAPI, Request, HTTPException
+from fastapi import (
+    Body,
+    Depends,
+    FastAPI,
+    Header,
+    Request,
+    HTTPException,
+    WebSocket,
+    WebSocketDisconnect,
+)
 from fastapi.templating import Jinja2Templates
-from pydantic import BaseModel
-from starlette.responses import HTMLResponse
-from game_and_agent import TicTacToe, QLearningAgent
+from pydantic import BaseModel, ValidationError
+from starlette.responses import HTMLResponse, Response
+from game_and_agent import TicTacToe, VecTicTacToe
+from metrics import CONTENT_TYPE, Registry
+from model_registry import Model, ModelRegistry, ModelSpec
 
-# Create FastAPI app and Jinja2 templates
-app = FastAPI(title="Tic Tac Toe")
-templates = Jinja2Templates(directory="templates")
+# The fraction of the moves that are logged. The log records are written by a background thread.
+LOG_SAMPLE_RATE = float(os.environ.get("TICTACTOE_LOG_SAMPLE_RATE", "0.01"))
+logger = logging.getLogger("tictactoe_webapp")
+# A random generator of its own, so that sampling does not change the random choices of the AI.
+log_sampler = random.Random()
 
-# Initialize Tic Tac Toe game and QLearning agents
-game = TicTacToe()
-agent1 = QLearningAgent(
-    pre_trained_q_table="q_table_ubuntu_agent_move_first.pkl",
+# The metrics served on /metrics.
+registry = Registry()
+REQUEST_LATENCY = registry.histogram(
+    "tictactoe_request_duration_seconds",
+    "Latency of the HTTP requests and of the WebSocket messages.",
+    ("path",),
+)
+STAGE_LATENCY = registry.histogram(
+    "tictactoe_stage_duration_seconds",
+    "Latency of each stage of a move. The AI's turn is either a cache_hit, or a win_check and a choose_action.",
+    ("stage",),
 )
-agent2 = QLearningAgent(
-    pre_trained_q_table="q_table_ubuntu_agent_move_second.pkl",
+MOVE_CACHE_LOOKUPS = registry.counter(
+    "tictactoe_move_cache_lookups_total",
+    "Number of AI turns looked up in the move cache, by result (hit or miss).",
+    ("result",),
 )
+OUTCOMES = registry.counter(
+    "tictactoe_outcomes_total", "Number of moves by model and outcome.", ("model", "outcome")
+)
+# The outcome label of each message.
+OUTCOME_LABELS = {
+    "": "in_progress",
+    "You win!": "human_wins",
+    "AI wins!": "ai_wins",
+    "It is a draw!": "draw",
+    "Invalid Move!": "invalid_move",
+}
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Writes the sampled request logs from a background thread while the app runs, so that requests only put the
+    records on a queue, and watches the files of the models.
+    """
+    log_queue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    listener = QueueListener(log_queue, logging.StreamHandler())
+    logger.addHandler(queue_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    listener.start()
+    if WATCH_INTERVAL > 0:
+        models.start_watching(
+            WATCH_INTERVAL,
+            on_error=lambda name, error: logger.error("Could not reload the model %s: %s", name, error),
+        )
+    try:
+        yield
+    finally:
+        models.stop()
+        listener.stop()
+        logger.removeHandler(queue_handler)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware that records the latency of each HTTP request, by route, and the time the request started,
+    from which the handlers compute their parse stage.
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = scope["start_time"] = perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            REQUEST_LATENCY.observe(
+                perf_counter() - start, getattr(scope.get("route"), "path", "other")
+            )
+
+
+# Create FastAPI app and Jinja2 templates
+app = FastAPI(title="Tic Tac Toe", lifespan=lifespan)
+app.add_middleware(MetricsMiddleware)
+templates = Jinja2Templates(directory="templates")
 
 player_agent = 1
 player_human = 2
 
+# The value of a cell of the board of a GameState, and of the corresponding character of a state_key.
+CELL_TO_STATE_KEY = {"": "0", "X": "1", "O": "2"}
+STATE_KEY_TO_CELL = {value: cell for cell, value in CELL_TO_STATE_KEY.items()}
+# The cells of a GameState board indexed by the values of a VecTicTacToe board.
+BOARD_VALUE_TO_CELL = ("", "X", "O")
+BOARD_CELL_TO_VALUE = {cell: value for value, cell in enumerate(BOARD_VALUE_TO_CELL)}
+
+# The largest number of items accepted by /make_moves. A batch costs about 60 microseconds per item, so this bounds
+# a request to about 0.3 seconds of a worker thread.
+MAX_BATCH_SIZE = 5000
+# The largest number of AI turns kept by the cache of resolve_agent_turn. The two agents of a model have fewer
+# reachable states than this, so in practice the cache only evicts the states of malformed boards.
+MOVE_CACHE_SIZE = 16384
+
+
+# The models served by the app, by name. The model named "default" serves the requests that do not name one.
+# The Q-tables are memory-mapped from the binary Q-table files, so that loading them costs almost nothing and
+# all the workers share the same read-only pages. Regenerate them from the pkl files with convert_q_table.py.
+# The moves are served from the policies exported by export_policy.py (the best actions of each reachable state),
+# and the Q-learning agents only answer the states that are not in the policies.
+# The agents are only read when serving, so they can be shared by concurrent requests.
+DEFAULT_MODEL_SPEC = ModelSpec(
+    q_table_first="q_table_ubuntu_agent_move_first.qtab",
+    q_table_second="q_table_ubuntu_agent_move_second.qtab",
+    policy_first="policy_agent_move_first.npy",
+    policy_second="policy_agent_move_second.npy",
+)
+# The interval in seconds at which the files of the models are checked for changes, 0 to disable the watcher.
+WATCH_INTERVAL = float(os.environ.get("TICTACTOE_WATCH_INTERVAL", "5"))
+# The admin routes require this token in the X-Admin-Token header. Without it, they are disabled.
+ADMIN_TOKEN = os.environ.get("TICTACTOE_ADMIN_TOKEN")
+# The directory of the files that the admin routes can load. The paths of a spec are relative to it.
+MODELS_DIR = os.path.realpath(
+    os.environ.get("TICTACTOE_MODELS_DIR", os.path.dirname(os.path.abspath(__file__)))
+)
+# The manifest of the models shared by the workers of the server, so that the admin routes reach all of them. It
+# is required with several workers, and not needed with one.
+MODELS_MANIFEST = os.environ.get("TICTACTOE_MODELS_MANIFEST")
+
+
+@lru_cache(maxsize=MOVE_CACHE_SIZE)
+def resolve_agent_turn(
+    state_key: str, player_who_move_first: str, model: Model
+) -> Tuple[Tuple[str, str], ...]:
+    """
+    Computes the deterministic part of the AI's turn: the outcome of each of its best actions. The result only
+    depends on the state_key (the board after the human's move, whatever the board and the move it came from) and
+    the model, so it is cached. The caller breaks the tie between the outcomes at random.
+
+    Args:
+        state_key: The board before the AI's move.
+        player_who_move_first: "X" if the AI moved first, "O" otherwise.
+        model: The model that plays the AI.
+
+    Returns:
+        The state_key after the AI's move and the message for the human ("AI wins!", "It is a draw!" or ""), for
+        each of the AI's best actions. If the game is already over, the only outcome is the state_key itself, with
+        "You win!", "AI wins!" or "It is a draw!".
+    """
+    agent_turn_lookup.computed = True
+    start = perf_counter()
+    game = TicTacToe()
+    game.set_board_by_state_key(state_key)
+    if game.check_win(player_human):
+        terminal_message = "You win!"
+    elif game.check_win(player_agent):
+        terminal_message = "AI wins!"
+    elif game.check_draw():
+        terminal_message = "It is a draw!"
+    else:
+        terminal_message = None
+    STAGE_LATENCY.observe(perf_counter() - start, "win_check")
+    if terminal_message is not None:
+        return ((state_key, terminal_message),)
+
+    start = perf_counter()
+    agent = model.agent1 if player_who_move_first == "X" else model.agent2
+    outcomes = []
+    # If you want the AI to lose sometimes, choose_action(..., is_learning=True) can be used instead.
+    # Otherwise, AI will not lose.
+    for action in agent.get_best_actions(state_key, game.get_valid_actions()):
+        game.make_move(*action, player_agent)
+        message = ""
+        if game.check_win(player_agent):
+            message = "AI wins!"
+        if game.check_draw():
+            message = "It is a draw!"
+        outcomes.append((game.get_state_key(), message))
+        game.withdraw_move(*action)
+    STAGE_LATENCY.observe(perf_counter() - start, "choose_action")
+    return tuple(outcomes)
+
+
+# Set by resolve_agent_turn in the thread that calls it, so that lookup_agent_turn can tell a miss from a hit.
+agent_turn_lookup = threading.local()
+
+
+def lookup_agent_turn(
+    state_key: str, player_who_move_first: str, model: Model
+) -> Tuple[Tuple[str, str], ...]:
+    """
+    Returns resolve_agent_turn(state_key, player_who_move_first, model), and records whether it was served from
+    the cache. resolve_agent_turn observes the win_check and choose_action stages when it runs, and a hit is
+    observed as the cache_hit stage, so that every AI turn is in the stage metrics.
+
+    Args:
+        state_key: The board before the AI's move.
+        player_who_move_first: "X" if the AI moved first, "O" otherwise.
+        model: The model that plays the AI.
+
+    Returns:
+        The outcome of each of the AI's best actions, see resolve_agent_turn.
+    """
+    agent_turn_lookup.computed = False
+    start = perf_counter()
+    outcomes = resolve_agent_turn(state_key, player_who_move_first, model)
+    if agent_turn_lookup.computed:
+        MOVE_CACHE_LOOKUPS.inc("miss")
+    else:
+        STAGE_LATENCY.observe(perf_counter() - start, "cache_hit")
+        MOVE_CACHE_LOOKUPS.inc("hit")
+    return outcomes
+
+
+models = ModelRegistry(manifest_path=MODELS_MANIFEST)
+# A new model gets new cache keys, but the entries of the previous one would stay until they are evicted.
+models.swap_listeners.append(lambda name: resolve_agent_turn.cache_clear())
+# A worker started after the others, or after a restart, serves the models of the manifest.
+models.sync(on_error=lambda name, error: logger.error("Could not load the model %s: %s", name, error))
+if models.default_name not in models.models:
+    models.load(models.default_name, DEFAULT_MODEL_SPEC)
+registry.callback(
+    "tictactoe_move_cache_hits_total",
+    "Number of AI turns served from the cache since a model was last loaded.",
+    lambda: resolve_agent_turn.cache_info().hits,
+    "counter",
+)
+registry.callback(
+    "tictactoe_move_cache_misses_total",
+    "Number of AI turns computed since a model was last loaded.",
+    lambda: resolve_agent_turn.cache_info().misses,
+    "counter",
+)
+registry.callback(
+    "tictactoe_move_cache_size",
+    "Number of AI turns in the cache.",
+    lambda: resolve_agent_turn.cache_info().currsize,
+)
+
 
 class GameState(BaseModel):
     """
@@ -45,6 +293,50 @@ class Item(BaseModel):
     y: int
 
 
+class CompactItem(BaseModel):
+    """
+    Item model of the compact wire format: the board as a state_key and an optional move.
+    """
+
+    # 9 characters in row-major order, "0" for an empty cell, "1" for the AI 'X' and "2" for the human 'O',
+    # as returned by TicTacToe.get_state_key.
+    state_key: str
+    player_who_move_first: str  # could be "X" or "O", "X" means AI.
+    # The human's move. Without a move, the AI moves in the given state.
+    x: Optional[int] = None
+    y: Optional[int] = None
+
+
+class CompactGameState(BaseModel):
+    """
+    Game state model of the compact wire format.
+    """
+
+    state_key: str
+    player_who_move_first: str
+    message: str
+
+
+class ModelSpecItem(BaseModel):
+    """
+    Model of the files of a model, see model_registry.ModelSpec.
+    """
+
+    q_table_first: str
+    q_table_second: str
+    policy_first: Optional[str] = None
+    policy_second: Optional[str] = None
+
+
+class BatchResult(BaseModel):
+    """
+    Result model of one item of a batch: the game state after the moves, or the error if the item is malformed.
+    """
+
+    state: Optional[GameState] = None
+    error: Optional[str] = None
+
+
 @app.get("/", response_class=HTMLResponse)
 def home(request: Request):
     """
@@ -59,64 +351,562 @@ def home(request: Request):
     return templates.TemplateResponse("tictactoe.html", {"request": request})
 
 
+def play_move(
+    board: List[List[str]],
+    player_who_move_first: str,
+    x: int,
+    y: int,
+    model: Optional[Model] = None,
+) -> Tuple[List[List[str]], str]:
+    """
+    Plays the human's move and the AI's response on a board.
+
+    It is a pure function: it reads only its arguments and the shared read-only agents, and it returns a new board,
+    so it can be called from many threads or worker processes at once.
+
+    Args:
+        board: The 3x3 board before the human's move, with cells "X" (AI), "O" (human) or "".
+        player_who_move_first: "X" if the AI moved first, "O" otherwise.
+        x: Row index of the human's move.
+        y: Column index of the human's move.
+        model: The model that plays the AI (default: None, the default model).
+
+    Returns:
+        The board after the human's move and the AI's response, and the message for the human
+        ("Invalid Move!", "You win!", "AI wins!", "It is a draw!" or "").
+    """
+    if not is_valid_move(board, x, y):
+        return board, "Invalid Move!"
+
+    start = perf_counter()
+    state_key = "".join(CELL_TO_STATE_KEY[cell] for row in board for cell in row)
+    board_conversion_time = perf_counter() - start
+
+    state_key, message = play_move_by_state_key(state_key, player_who_move_first, x, y, model)
+
+    start = perf_counter()
+    board = state_key_to_cells(state_key)
+    STAGE_LATENCY.observe(board_conversion_time + perf_counter() - start, "board_conversion")
+    return board, message
+
+
+def play_move_on_game(
+    game: TicTacToe,
+    player_who_move_first: str,
+    x: int,
+    y: int,
+    model: Optional[Model] = None,
+) -> str:
+    """
+    Plays the human's valid move and the AI's response on a game, in place.
+
+    Args:
+        game: The game before the human's move.
+        player_who_move_first: "X" if the AI moved first, "O" otherwise.
+        x: Row index of the human's move, which must be an empty cell.
+        y: Column index of the human's move.
+        model: The model that plays the AI (default: None, the default model).
+
+    Returns:
+        The message for the human ("You win!", "AI wins!", "It is a draw!" or "").
+    """
+    game.make_move(x, y, player_human)
+    state_key, message = random.choice(
+        lookup_agent_turn(game.get_state_key(), player_who_move_first, model or models.get())
+    )
+    game.set_board_by_state_key(state_key)
+    return message
+
+
+def play_move_by_state_key(
+    state_key: str,
+    player_who_move_first: str,
+    x: Optional[int] = None,
+    y: Optional[int] = None,
+    model: Optional[Model] = None,
+) -> Tuple[str, str]:
+    """
+    Plays the human's move, if any, and the AI's response on a board given as a state_key.
+
+    Args:
+        state_key: The board before the human's move, as returned by TicTacToe.get_state_key.
+        player_who_move_first: "X" if the AI moved first, "O" otherwise.
+        x: Row index of the human's move, or None to let the AI move in the given state.
+        y: Column index of the human's move, or None to let the AI move in the given state.
+        model: The model that plays the AI (default: None, the default model).
+
+    Returns:
+        The state_key after the moves, and the message for the human
+        ("Invalid Move!", "You win!", "AI wins!", "It is a draw!" or "").
+    """
+    if len(state_key) != 9 or not set(state_key) <= set("012") or (x is None) != (y is None):
+        return state_key, "Invalid Move!"
+
+    model = model or models.get()
+    if x is None:
+        outcomes = lookup_agent_turn(state_key, player_who_move_first, model)
+        if outcomes[0][0] == state_key:
+            # The game is already over.
+            return state_key, "Invalid Move!"
+        return random.choice(outcomes)
+
+    if x not in range(3) or y not in range(3):
+        return state_key, "Invalid Move!"
+    cell = 3 * x + y
+    if state_key[cell] != "0":
+        return state_key, "Invalid Move!"
+    return random.choice(
+        lookup_agent_turn(
+            state_key[:cell] + "2" + state_key[cell + 1 :], player_who_move_first, model
+        )
+    )
+
+
+def is_valid_move(board: List[List[str]], x: int, y: int) -> bool:
+    """
+    Checks that the board is a 3x3 board of valid cells and that (x, y) is one of its empty cells.
+    """
+    return (
+        len(board) == 3
+        and all(len(row) == 3 for row in board)
+        and all(cell in CELL_TO_STATE_KEY for row in board for cell in row)
+        and x in range(3)
+        and y in range(3)
+        and board[x][y] == ""
+    )
+
+
+def play_moves(raw_items: List[Any], model: Optional[Model] = None) -> List[BatchResult]:
+    """
+    Plays many human moves and the AI's responses at once.
+
+    The items are validated one by one, so a malformed item or an invalid move only gives an error or an
+    "Invalid Move!" message for that item. The valid items are played on one VecTicTacToe: the human moves, the
+    win and draw checks and the choice of the AI (PolicyAgent.choose_actions, one lookup per agent) are each a
+    single vectorized pass over the whole batch.
+
+    Args:
+        raw_items: The items, each in the format of the body of /make_move.
+        model: The model that plays the AI (default: None, the default model).
+
+    Returns:
+        The result of each item, in order. The states are the same as /make_move would return.
+    """
+    results: List[Optional[BatchResult]] = [None] * len(raw_items)
+    items = []
+    for index, raw_item in enumerate(raw_items):
+        try:
+            if not isinstance(raw_item, dict):
+                raise TypeError("An item must be a JSON object.")
+            item = Item(**raw_item)
+        except (TypeError, ValidationError) as error:
+            results[index] = BatchResult(error=str(error))
+            continue
+        if is_valid_move(item.state.board, item.x, item.y):
+            items.append((index, item))
+        else:
+            item.state.message = "Invalid Move!"
+            results[index] = BatchResult(state=item.state)
+
+    games = VecTicTacToe(len(items))
+    if items:
+        games.boards[:] = [
+            [BOARD_CELL_TO_VALUE[cell] for row in item.state.board for cell in row]
+            for _, item in items
+        ]
+    game_indices = np.arange(len(items))
+    games.boards[game_indices, [3 * item.x + item.y for _, item in items]] = player_human
+
+    # The game can be over after the human's move, with the same checks in the same order as in
+    # resolve_agent_turn: the human wins, the AI has already won, or the board is full. The AI does not move then.
+    human_wins = games.check_wins(player_human)
+    agent_has_won = games.check_wins(player_agent) & ~human_wins
+    human_draws = games.check_draws() & ~(human_wins | agent_has_won)
+    active = ~(human_wins | agent_has_won | human_draws)
+
+    # If you want the AI to lose sometimes, is_learning can be set to True.
+    # Otherwise, AI will not lose.
+    agent_moves_first = np.array(
+        [item.state.player_who_move_first == "X" for _, item in items], dtype=bool
+    )
+    ranks = games.get_ranks()
+    valid_mask = games.get_valid_mask()
+    model = model or models.get()
+    for agent, selected in (
+        (model.agent1, agent_moves_first),
+        (model.agent2, ~agent_moves_first),
+    ):
+        selected = np.flatnonzero(active & selected)
+        if len(selected):
+            agent_cells = agent.choose_actions(
+                ranks[selected], valid_mask[selected], is_learning=False
+            )
+            games.boards[selected, agent_cells] = player_agent
+
+    # As in play_move, a full board is reported as a draw even if the AI's last move wins.
+    agent_wins = active & games.check_wins(player_agent)
+    agent_draws = active & games.check_draws()
+
+    for game_index, (index, item) in enumerate(items):
+        board = games.boards[game_index].tolist()
+        item.state.board = [
+            [BOARD_VALUE_TO_CELL[value] for value in board[row : row + 3]]
+            for row in range(0, 9, 3)
+        ]
+        if human_wins[game_index]:
+            item.state.message = "You win!"
+        elif agent_has_won[game_index]:
+            item.state.message = "AI wins!"
+        elif human_draws[game_index] or agent_draws[game_index]:
+            item.state.message = "It is a draw!"
+        elif agent_wins[game_index]:
+            item.state.message = "AI wins!"
+        else:
+            item.state.message = ""
+        results[index] = BatchResult(state=item.state)
+    return results
+
+
+def state_key_to_cells(state_key: str) -> List[List[str]]:
+    """
+    Converts a state_key into the 3x3 board of a GameState.
+    """
+    return [
+        [STATE_KEY_TO_CELL[value] for value in state_key[row : row + 3]]
+        for row in range(0, 9, 3)
+    ]
+
+
+def record_parse_time(request: Request) -> None:
+    """
+    Records the time from the start of a request to its handler, mostly reading and validating the body, as the
+    parse stage.
+    """
+    start = request.scope.get("start_time")
+    if start is not None:
+        STAGE_LATENCY.observe(perf_counter() - start, "parse")
+
+
+def get_model(model: Optional[str] = None) -> Model:
+    """
+    Dependency that returns the model named by the 'model' query parameter, or the default model. A model that
+    another worker has just loaded is taken from the manifest without waiting for the watcher.
+    """
+    try:
+        return models.get(model)
+    except KeyError:
+        pass
+    models.sync()
+    try:
+        return models.get(model)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"There is no model named {model}.")
+
+
+def set_model_header(response: Response, model: Model) -> None:
+    """
+    Tells the client which model, and which version of it, answered, for A/B comparisons.
+    """
+    response.headers["X-Model"] = f"{model.name}:{model.version}"
+
+
+def check_admin_token(x_admin_token: Optional[str] = Header(None)) -> None:
+    """
+    Dependency of the admin routes that checks the X-Admin-Token header against TICTACTOE_ADMIN_TOKEN. The admin
+    routes are refused when no token is configured.
+    """
+    if not ADMIN_TOKEN:
+        raise HTTPException(
+            status_code=403, detail="The admin routes are disabled, set TICTACTOE_ADMIN_TOKEN to enable them."
+        )
+    if x_admin_token is None or not hmac.compare_digest(x_admin_token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Invalid admin token.")
+
+
+def resolve_model_path(path: str, extension: str) -> str:
+    """
+    Resolves a path of a model spec sent to the admin routes under MODELS_DIR.
+
+    Args:
+        path: The path, relative to MODELS_DIR.
+        extension: The required extension, '.qtab' for a Q-table or '.npy' for a policy.
+
+    Returns:
+        The resolved path.
+
+    Raises:
+        HTTPException: 422 if the path is outside MODELS_DIR or does not have the extension.
+    """
+    resolved = os.path.realpath(os.path.join(MODELS_DIR, path))
+    if os.path.commonpath([resolved, MODELS_DIR]) != MODELS_DIR or not resolved.endswith(extension):
+        raise HTTPException(
+            status_code=422, detail=f"{path} is not a {extension} file in the models directory."
+        )
+    return resolved
+
+
+@app.get("/metrics")
+async def metrics() -> Response:
+    """
+    Route to serve the metrics in the Prometheus text exposition format.
+
+    Returns:
+        The metrics.
+    """
+    return Response(registry.render(), media_type=CONTENT_TYPE)
+
+
 @app.post("/make_move")
-async def make_move(item: Item) -> GameState:
+async def make_move(
+    item: Item, request: Request, response: Response, model: Model = Depends(get_model)
+) -> GameState:
     """
     Route to handle the player's move and the AI's response.
 
     Args:
         item: An item object containing the game state and the player's move.
+        request: The incoming request.
+        response: The response, to which the X-Model header is added.
+        model: The model named by the 'model' query parameter, or the default model.
 
     Returns:
         The updated game state after the player's move and the AI's response.
     """
-    print(item)
+    record_parse_time(request)
     state = item.state
-    state.message = ""
+    if log_sampler.random() < LOG_SAMPLE_RATE:
+        logger.info("make_move %s", item)
+    state.board, state.message = play_move(
+        state.board, state.player_who_move_first, item.x, item.y, model
+    )
+    OUTCOMES.inc(model.name, OUTCOME_LABELS[state.message])
+    set_model_header(response, model)
+    return state
 
-    x = item.x
-    y = item.y
-    if x not in range(3) or y not in range(3) or state.board[x][y] != "":
-        state.message = "Invalid Move!"
-        return state
 
-    if state.player_who_move_first == "X":
-        agent = agent1
-    else:
-        agent = agent2
-    state.board[x][y] = "O"
-    board = np.array(state.board)
-    board = np.where(board == "X", "1", board)
-    board = np.where(board == "O", "2", board)
-    board = np.where(board == "", "0", board)
-    board = board.astype(int)
+@app.post("/make_move_compact")
+async def make_move_compact(
+    item: CompactItem, request: Request, response: Response, model: Model = Depends(get_model)
+) -> CompactGameState:
+    """
+    Route to handle the player's move and the AI's response in the compact wire format.
 
-    game.set_board(board)
+    Args:
+        item: An item object containing the state_key, the player who moved first and the player's move, if any.
+        request: The incoming request.
+        response: The response, to which the X-Model header is added.
+        model: The model named by the 'model' query parameter, or the default model.
 
-    if game.check_win(player_human):
-        state.message = "You win!"
-        return state
-    if game.check_draw():
-        state.message = "It is a draw!"
-        return state
+    Returns:
+        The updated game state after the player's move and the AI's response.
+    """
+    record_parse_time(request)
+    if log_sampler.random() < LOG_SAMPLE_RATE:
+        logger.info("make_move_compact %s", item)
+    state_key, message = play_move_by_state_key(
+        item.state_key, item.player_who_move_first, item.x, item.y, model
+    )
+    OUTCOMES.inc(model.name, OUTCOME_LABELS[message])
+    set_model_header(response, model)
+    return CompactGameState(
+        state_key=state_key,
+        player_who_move_first=item.player_who_move_first,
+        message=message,
+    )
 
-    agent_state_key: str = game.get_state_key()
 
-    # If you want the AI to lose sometimes, is_learning can be set to True.
-    # Otherwise, AI will not lose.
-    x, y = agent.choose_action(
-        agent_state_key, game.get_valid_actions(), is_learning=False
-    )
+@app.get("/move_cache")
+async def move_cache() -> dict:
+    """
+    Route to report the hits and misses of the cache of the AI's turns.
+
+    Returns:
+        The hits, the misses, the maximum size and the current size of the cache.
+    """
+    return resolve_agent_turn.cache_info()._asdict()
 
-    state.board[x][y] = "X"
-    game.make_move(x, y, player_agent)
 
-    if game.check_win(player_agent):
-        state.message = "AI wins!"
-    if game.check_draw():
-        state.message = "It is a draw!"
+@app.post("/make_moves")
+def make_moves(
+    response: Response, items: List[Any] = Body(...), model: Model = Depends(get_model)
+) -> List[BatchResult]:
+    """
+    Route to play a batch of moves, for bots and replay tools.
 
-    return state
+    Playing a batch is CPU-bound, so this route is a plain function, which FastAPI runs in its thread pool, to keep
+    the event loop serving the other requests.
+
+    Args:
+        response: The response, to which the X-Model header is added.
+        items: The items, each in the format of the body of /make_move.
+        model: The model named by the 'model' query parameter, or the default model.
+
+    Returns:
+        The result of each item, in order: the updated game state, or the error of a malformed item.
+    """
+    if len(items) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=413, detail=f"A batch can not have more than {MAX_BATCH_SIZE} items."
+        )
+    results = play_moves(items, model)
+    for result in results:
+        OUTCOMES.inc(
+            model.name,
+            "malformed" if result.state is None else OUTCOME_LABELS[result.state.message],
+        )
+    set_model_header(response, model)
+    if log_sampler.random() < LOG_SAMPLE_RATE:
+        logger.info("make_moves with %d items", len(items))
+    return results
+
+
+@app.websocket("/ws")
+async def play_over_websocket(websocket: WebSocket, model: Optional[str] = None) -> None:
+    """
+    Route to play a session of games over one WebSocket connection.
+
+    The board of the session is kept by the server, so the client only sends its moves. The client sends
+    {"new_game": "X"} (the AI moves first) or {"new_game": "O"} to start a game, and {"x": x, "y": y} to move.
+    The server answers each message with the game state, in the format of the response of /make_move. A move
+    before a new game, after the end of a game or on an occupied cell gets the "Invalid Move!" message.
+
+    The session lives in the local variables of this coroutine, so it is freed when the client disconnects.
+    Each move is played by the current version of the model, so a reloaded model serves the open sessions too.
+
+    Args:
+        websocket: The WebSocket connection.
+        model: The name of the model that plays the AI (default: None, the default model).
+    """
+    model_name = model or models.default_name
+    if model_name not in models.models:
+        await asyncio.to_thread(models.sync)
+    if model_name not in models.models:
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+    game = TicTacToe()
+    player_who_move_first = "X"
+    in_game = False
+    try:
+        while True:
+            text = await websocket.receive_text()
+            start = perf_counter()
+            try:
+                data = json.loads(text)
+            except json.JSONDecodeError:
+                data = None
+            STAGE_LATENCY.observe(perf_counter() - start, "parse")
+            if not isinstance(data, dict):
+                data = {}
+
+            if data.get("new_game") in ("X", "O"):
+                game.reset()
+                player_who_move_first = data["new_game"]
+                if player_who_move_first == "X":
+                    game.make_move(*random.choice(game.get_valid_actions()), player_agent)
+                in_game = True
+                message = ""
+            elif (
+                in_game
+                and type(data.get("x")) is int
+                and type(data.get("y")) is int
+                and data["x"] in range(3)
+                and data["y"] in range(3)
+                and game.is_valid_move(data["x"], data["y"])
+            ):
+                # A model removed during the session is replaced by the default model.
+                served_model = models.models.get(model_name) or models.get()
+                message = play_move_on_game(
+                    game, player_who_move_first, data["x"], data["y"], served_model
+                )
+                in_game = message == ""
+                OUTCOMES.inc(served_model.name, OUTCOME_LABELS[message])
+            else:
+                message = "Invalid Move!"
+                OUTCOMES.inc(model_name, OUTCOME_LABELS[message])
+            if log_sampler.random() < LOG_SAMPLE_RATE:
+                logger.info("websocket %s -> %s", text, message)
+
+            board_start = perf_counter()
+            board = state_key_to_cells(game.get_state_key())
+            STAGE_LATENCY.observe(perf_counter() - board_start, "board_conversion")
+            await websocket.send_json(
+                {
+                    "board": board,
+                    "player_who_move_first": player_who_move_first,
+                    "message": message,
+                }
+            )
+            REQUEST_LATENCY.observe(perf_counter() - start, "/ws")
+    except WebSocketDisconnect:
+        pass
+
+
+@app.get("/admin/models", dependencies=[Depends(check_admin_token)])
+async def list_models() -> List[dict]:
+    """
+    Route to list the models being served.
+
+    Returns:
+        The name, the version, the load time and the files of each model.
+    """
+    return [model.info() for model in models.models.values()]
+
+
+@app.post("/admin/models/{name}", dependencies=[Depends(check_admin_token)])
+async def load_model(name: str, spec: Optional[ModelSpecItem] = None) -> dict:
+    """
+    Route to load a model, or to reload it from its files if no spec is given. The model is loaded and checked on
+    the loader thread of the registry while the current models keep serving, then swapped in. If it fails, the
+    current model of the name is kept.
+
+    Args:
+        name: The name of the model.
+        spec: The files of the model, binary Q-table files (.qtab) and policies (.npy) under MODELS_DIR
+              (default: None, the files of the current model).
+
+    Returns:
+        The name, the version, the load time and the files of the new model.
+    """
+    if spec is not None:
+        spec = ModelSpec(
+            q_table_first=resolve_model_path(spec.q_table_first, ".qtab"),
+            q_table_second=resolve_model_path(spec.q_table_second, ".qtab"),
+            policy_first=spec.policy_first and resolve_model_path(spec.policy_first, ".npy"),
+            policy_second=spec.policy_second and resolve_model_path(spec.policy_second, ".npy"),
+        )
+    try:
+        model = await asyncio.wrap_future(models.load_in_background(name, spec))
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"There is no model named {name}.")
+    except ValueError as error:
+        # The model is invalid, e.g. its policy can lose. The current model is kept.
+        raise HTTPException(status_code=422, detail=f"Could not load the model {name}: {error}")
+    except Exception as error:
+        # Other errors, e.g. a missing file, are only logged, so that the routes do not tell which files exist.
+        logger.error("Could not load the model %s: %s", name, error)
+        raise HTTPException(status_code=422, detail=f"Could not load the model {name}.")
+    return model.info()
+
+
+@app.delete("/admin/models/{name}", dependencies=[Depends(check_admin_token)])
+async def remove_model(name: str) -> dict:
+    """
+    Route to stop serving a model. The default model can not be removed.
+
+    Args:
+        name: The name of the model.
+
+    Returns:
+        The names of the remaining models.
+    """
+    try:
+        models.remove(name)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"There is no model named {name}.")
+    except ValueError as error:
+        raise HTTPException(status_code=422, detail=str(error))
+    return {"models": list(models.models)}
 
 
 if __name__ == "__main__":
@@ -1,12 +1,145 @@
+import argparse
 import random
 from time import perf_counter
 import pickle
 
-from game_and_agent import QLearningAgent, TicTacToe
+import numpy as np
+
+from checkpoint import Checkpointer
+from game_and_agent import QLearningAgent, TicTacToe, VecTicTacToe
+from training_profiler import PhaseTimer, SamplingProfiler
+
+
+def play_episode_agent_move_second(
+    agent: QLearningAgent, agent1: QLearningAgent, game: TicTacToe, timer: PhaseTimer = None
+) -> float:
+    """
+    Play one game of the Q-learning agent against a pre-trained AI opponent, and update the agent after each of its
+    moves.
+
+    It neither decays the learning rate nor reports the progress, which play_game_agent_move_second does every
+    10000 episodes, so that the workers of parallel_training.py can play their episodes with it.
+
+    Parameters:
+    agent (QLearningAgent): A Q-learning agent object who move second. The agent to be trained.
+    agent1 (QLearningAgent): A Q-learning agent object who move first. A pre-trained agent.
+    game (TicTacToe): The game to play on. It is reset first.
+    timer (PhaseTimer): Time the phases of the episode (default: None).
+
+    Returns:
+    float: The reward of the last move of the agent: 1 for a win, 0 for a draw and -1 for a loss.
+    """
+    # Reset the game board for a new game
+
+    game.reset()
+
+    # Set the first player (1 for 'X' and 2 for 'O'), 'X' is agent, 'O' is opponent
+    player1 = 1
+    player2 = 2
+
+    # The opponent will move first in the game.
+    # Get the valid actions for the current state for player2
+    player2_valid_actions = game.get_valid_actions()
+
+    # Choose an action for player2
+    player2_random_actions = random.choice(player2_valid_actions)
+
+    # Make the chosen move on the game board
+    game.make_move(*player2_random_actions, player2)
+    if timer is not None:
+        timer.lap("reset")
+
+    # Continue playing until a player wins or the game is a draw
+    while not (
+        game.check_win(player1) or game.check_win(player2) or game.check_draw()
+    ):
+        if timer is not None:
+            timer.lap("check_win/check_draw")
+
+        # Get the current state key
+        state_key = game.get_state_key()
+
+        valid_actions = game.get_valid_actions()
+        if timer is not None:
+            timer.lap("state")
+
+        # Choose an action based on the agent's exploration/exploitation strategy
+        # if episode<=EP:
+        action = agent.choose_action(state_key, valid_actions)
+        # else:
+        #     action = agent.choose_action(state_key, valid_actions, is_learning=False)
+
+        # Make the chosen move on the game board
+        game.make_move(*action, player1)
+        if timer is not None:
+            timer.lap("choose_action")
+
+        # Calculate the reward for the move. No need to check draw after the agent's move
+        # because the 9th move is always made by opponent, if the opponent move first
+        reward = -0.1
+        if game.check_win(player1):
+            reward = 1  # Winning the game
+        else:
+            # if the opponent can win in the next move, we will choose this to accelerate the learning process.
+
+            winning_moves = game.winning_moves(player2)
+            if winning_moves:
+                game.make_move(*winning_moves[0], player2)
+            if timer is not None:
+                timer.lap("win_threat_scan")
+            if not winning_moves:
+                # ai opponent.
+                agent1_state_key = game.get_state_key().translate(
+                    str.maketrans("12", "21")
+                )
+
+                agent1_action = agent1.choose_action(
+                    agent1_state_key, game.get_valid_actions()
+                )
+                game.make_move(*agent1_action, player2)
+                if timer is not None:
+                    timer.lap("opponent")
+
+            # Calculate the reward for the move
+
+            if game.check_win(player2):
+                reward = -1
+            elif game.check_draw():
+                reward = 0
+        if timer is not None:
+            timer.lap("check_win/check_draw")
+
+        # Get the new state key after making the move
+        next_state_key = game.get_state_key()
+
+        # Get the valid actions for the next state
+        # If we are in the terminal state, the next_valid_actions will be [], so the next_max_q_value is 0.
+        # We update the Q value by Q(s, a) ← Q(s, a) + α[r - Q(s, a)]
+        next_valid_actions = (
+            game.get_valid_actions() if reward not in [-1, 0, 1] else []
+        )
+        if timer is not None:
+            timer.lap("state")
+
+        # Update the Q-table using the Q-learning update rule
+
+        agent.learn(state_key, action, reward, next_state_key, next_valid_actions)
+        if timer is not None:
+            timer.lap("learn")
+
+    if timer is not None:
+        timer.lap("check_win/check_draw")
+        timer.end_episode(len(game.move_record))
+    return reward
 
 
 def play_game_agent_move_second(
-    agent: QLearningAgent, agent1: QLearningAgent, episodes: int = 10000
+    agent: QLearningAgent,
+    agent1: QLearningAgent,
+    episodes: int = 10000,
+    timer: PhaseTimer = None,
+    checkpointer: Checkpointer = None,
+    resume: bool = False,
 ) -> None:
     """
     Play multiple games to train the Q-learning agent with a pre-trained AI opponent.
@@ -15,15 +148,37 @@ def play_game_agent_move_second(
     agent (QLearningAgent): A Q-learning agent object who move second.The agent to be trained.
     agent1 (QLearningAgent): A Q-learning agent object who move first. A pre-trained agent.
     episodes (int): The number of episodes to play (default: 10000).
+    timer (PhaseTimer): Time the phases of the loop and report the throughput with the progress (default: None).
+    checkpointer (Checkpointer): Take a checkpoint every checkpointer.interval episodes and at the end
+                                 (default: None).
+    resume (bool): Continue from the last checkpoint of the checkpointer, if there is one (default: False).
     """
 
     average_reward = 0
     game = TicTacToe()
 
+    first_episode = 0
+    if resume:
+        restored = checkpointer.restore(agent)
+        if restored is not None:
+            first_episode, average_reward = restored
+            print(f"Resumed from the checkpoint of episode {first_episode}.")
+
     # Play multiple games to train the Q-learning agent
 
     start = perf_counter()
-    for episode in range(episodes):
+    if timer is not None:
+        timer.start()
+    for episode in range(first_episode, episodes):
+        if (
+            checkpointer is not None
+            and episode > first_episode
+            and episode % checkpointer.interval == 0
+        ):
+            checkpointer.save(agent, episode, average_reward)
+            if timer is not None:
+                timer.lap("checkpoint")
+
         if episode > 0 and episode % 10000 == 0:
             agent.alpha *= 0.99
 
@@ -31,100 +186,164 @@ def play_game_agent_move_second(
             print(
                 f"Trained {episode} episodes. LR is {agent.alpha}. AR is {average_reward}. Time used: {perf_counter() - start:.2f}"
             )
+            if timer is not None:
+                print(timer.report(len(agent.q_table)))
+                timer.lap("report")
 
-        # Reset the game board for a new game
+        reward = play_episode_agent_move_second(agent, agent1, game, timer)
+        # average_reward is an exponential moving average of the reward when the game is in terminal states.
+        average_reward = 0.9999 * average_reward + 0.0001 * reward
 
-        game.reset()
+    if checkpointer is not None and first_episode < episodes:
+        checkpointer.save(agent, episodes, average_reward)
+    if timer is not None:
+        print(timer.report(len(agent.q_table)))
 
-        # Set the first player (1 for 'X' and 2 for 'O'), 'X' is agent, 'O' is opponent
-        player1 = 1
-        player2 = 2
 
-        # The opponent will move first in the game.
-        # Get the valid actions for the current state for player2
-        player2_valid_actions = game.get_valid_actions()
+def play_game_agent_move_second_vectorized(
+    agent: QLearningAgent,
+    agent1: QLearningAgent,
+    episodes: int = 10000,
+    n_games: int = 1024,
+) -> None:
+    """
+    Play multiple games in lockstep on a VecTicTacToe to train the Q-learning agent with a pre-trained AI opponent.
 
-        # Choose an action for player2
-        player2_random_actions = random.choice(player2_valid_actions)
+    It follows play_game_agent_move_second, but each step makes one agent move and one opponent move in each of
+    n_games games, selects the actions and updates the Q-table for all of them at once, and starts a new game in
+    place of each finished one. Both agents must use a dense Q-table.
 
-        # Make the chosen move on the game board
-        game.make_move(*player2_random_actions, player2)
+    Parameters:
+    agent (QLearningAgent): A Q-learning agent object who move second.The agent to be trained.
+    agent1 (QLearningAgent): A Q-learning agent object who move first. A pre-trained agent.
+    episodes (int): The number of episodes to play (default: 10000).
+    n_games (int): The number of games played in lockstep (default: 1024).
+    """
 
-        # Continue playing until a player wins or the game is a draw
-        while not (
-            game.check_win(player1) or game.check_win(player2) or game.check_draw()
-        ):
-            # Get the current state key
-            state_key = game.get_state_key()
-
-            valid_actions = game.get_valid_actions()
-
-            # Choose an action based on the agent's exploration/exploitation strategy
-            # if episode<=EP:
-            action = agent.choose_action(state_key, valid_actions)
-            # else:
-            #     action = agent.choose_action(state_key, valid_actions, is_learning=False)
-
-            # Make the chosen move on the game board
-            game.make_move(*action, player1)
-
-            # Calculate the reward for the move. No need to check draw after the agent's move
-            # because the 9th move is always made by opponent, if the opponent move first
-            reward = -0.1
-            if game.check_win(player1):
-                reward = 1  # Winning the game
-            else:
-                # if the opponent can win in the next move, we will choose this to accelerate the learning process.
-
-                use_check_win_move = False
-                valid_actions = game.get_valid_actions()
-                for i in valid_actions:
-                    game.make_move(*i, player2)
-                    if game.check_win(player2):
-                        use_check_win_move = True
-                        break
-                    else:
-                        game.withdraw_move(*i)
-                if not use_check_win_move:
-                    # ai opponent.
-                    agent1_state_key = game.get_state_key().translate(
-                        str.maketrans("12", "21")
-                    )
-
-                    agent1_action = agent1.choose_action(
-                        agent1_state_key, game.get_valid_actions()
-                    )
-                    game.make_move(*agent1_action, player2)
-
-                # Calculate the reward for the move
-
-                if game.check_win(player2):
-                    reward = -1
-                elif game.check_draw():
-                    reward = 0
-
-            # Get the new state key after making the move
-            next_state_key = game.get_state_key()
-
-            # Get the valid actions for the next state
-            # If we are in the terminal state, the next_valid_actions will be [], so the next_max_q_value is 0.
-            # We update the Q value by Q(s, a) ← Q(s, a) + α[r - Q(s, a)]
-            next_valid_actions = (
-                game.get_valid_actions() if reward not in [-1, 0, 1] else []
-            )
+    average_reward = 0
+    games = VecTicTacToe(n_games)
 
-            # average_reward is an exponential moving average of the reward when the game is in terminal states.
-            if reward in [-1, 0, 1]:
-                average_reward = 0.9999 * average_reward + 0.0001 * reward
+    # Set the first player (1 for 'X' and 2 for 'O'), 'X' is agent, 'O' is opponent
+    player1 = 1
+    player2 = 2
 
-            # Update the Q-table using the Q-learning update rule
+    # The opponent will move first in every game, at random.
+    games.step(games.get_random_valid_cells(), player2)
 
-            agent.learn(state_key, action, reward, next_state_key, next_valid_actions)
+    finished_episodes = 0
+    start = perf_counter()
+    while finished_episodes < episodes:
+        ranks = games.get_ranks()
+        valid_mask = games.get_valid_mask()
+
+        # Choose an action in each game based on the agent's exploration/exploitation strategy
+        cells = agent.choose_actions(ranks, valid_mask)
+        wins, draws = games.step(cells, player1)
+
+        rewards = np.full(n_games, -0.1)
+        rewards[wins] = 1  # Winning the game
+        rewards[draws] = 0
+
+        # if the opponent can win in the next move, it takes it to accelerate the learning process.
+        # Otherwise the ai opponent chooses its move in the state seen by itself (1 and 2 swapped).
+        active = ~(wins | draws)
+        opponent_cells = games.get_winning_cells(player2)
+        agent1_cells = agent1.choose_actions(
+            games.get_ranks(swap_players=True), games.get_valid_mask()
+        )
+        opponent_cells = np.where(opponent_cells >= 0, opponent_cells, agent1_cells)
+        opponent_wins, opponent_draws = games.step(opponent_cells, player2, active)
+        rewards[opponent_wins] = -1
+        rewards[opponent_draws] = 0
+
+        terminal = wins | draws | opponent_wins | opponent_draws
+        agent.learn_batch(
+            ranks,
+            cells,
+            rewards,
+            games.get_ranks(),
+            games.get_valid_mask(),
+            terminal,
+        )
+
+        # The opponent makes the first move of the new games.
+        games.step(games.get_random_valid_cells(), player2, terminal)
+
+        for reward in rewards[terminal]:
+            average_reward = 0.9999 * average_reward + 0.0001 * reward
+
+        previous_finished_episodes = finished_episodes
+        finished_episodes += int(np.count_nonzero(terminal))
+        for _ in range(previous_finished_episodes // 10000, finished_episodes // 10000):
+            agent.alpha *= 0.99
+            print(
+                f"Trained {finished_episodes} episodes. LR is {agent.alpha}. AR is {average_reward}. Time used: {perf_counter() - start:.2f}"
+            )
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Train the second mover agent by playing with a pre-trained first mover agent."
+    )
+    parser.add_argument(
+        "--vectorized",
+        action="store_true",
+        help="Play many games in lockstep with batched action selection and Q updates.",
+    )
+    parser.add_argument(
+        "--n-games",
+        type=int,
+        default=1024,
+        help="The number of games played in lockstep with --vectorized (default: 1024).",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Time the phases of the serial loop and report the episodes/s, plies/s and Q-table growth.",
+    )
+    parser.add_argument(
+        "--sample-profile",
+        metavar="PATH",
+        help="Sample the stack every 10ms of CPU time and write the folded stacks to PATH, for a flame graph.",
+    )
+    parser.add_argument(
+        "--checkpoint-dir",
+        metavar="DIR",
+        help="Take checkpoints of the serial training in DIR, from which it can be resumed with --resume.",
+    )
+    parser.add_argument(
+        "--checkpoint-interval",
+        type=int,
+        default=10000,
+        help="The number of episodes between checkpoints (default: 10000).",
+    )
+    parser.add_argument(
+        "--snapshot-every",
+        type=int,
+        default=10,
+        help="Write a full snapshot every this many checkpoints, and only the changed Q-values in between "
+        "(default: 10).",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue the training from the last checkpoint in --checkpoint-dir, if there is one.",
+    )
+    args = parser.parse_args()
+    if args.profile and args.vectorized:
+        parser.error("--profile times the serial loop, it can not be used with --vectorized.")
+    if args.checkpoint_dir and args.vectorized:
+        parser.error("--checkpoint-dir checkpoints the serial loop, it can not be used with --vectorized.")
+    if args.resume and not args.checkpoint_dir:
+        parser.error("--resume needs --checkpoint-dir.")
+    checkpointer = (
+        Checkpointer(args.checkpoint_dir, args.checkpoint_interval, args.snapshot_every)
+        if args.checkpoint_dir
+        else None
+    )
+
     # The agent to be trained
-    agent = QLearningAgent()
+    agent = QLearningAgent(dense_q_table=args.vectorized)
 
     # agent1 is the AI opponent. agent1 will always move first. q_table_ubuntu_agent_move_first.pkl is a pre-trained
     # q_table for the first mover agent. The opponent agent can not always take
@@ -133,11 +352,32 @@ if __name__ == "__main__":
     agent1 = QLearningAgent(
         epsilon=0.5,
         pre_trained_q_table="q_table_ubuntu_agent_move_first.pkl",
+        dense_q_table=args.vectorized,
     )
 
     # Train the agent by playing the game
     EP = 1000000
-    play_game_agent_move_second(agent, agent1, episodes=EP)
+    profiler = SamplingProfiler() if args.sample_profile else None
+    if profiler is not None:
+        profiler.start()
+    if args.vectorized:
+        play_game_agent_move_second_vectorized(
+            agent, agent1, episodes=EP, n_games=args.n_games
+        )
+        q_table = agent.q_table.to_dict()
+    else:
+        play_game_agent_move_second(
+            agent,
+            agent1,
+            episodes=EP,
+            timer=PhaseTimer() if args.profile else None,
+            checkpointer=checkpointer,
+            resume=args.resume,
+        )
+        q_table = agent.q_table
+    if profiler is not None:
+        profiler.stop()
+        profiler.write(args.sample_profile)
 
     with open("q_table_ubuntu_agent_move_second.pkl", "wb") as f:
-        pickle.dump(agent.q_table, f)
+        pickle.dump(q_table, f)
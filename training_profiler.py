@@ -0,0 +1,136 @@
+import os
+import signal
+from time import perf_counter
+from typing import Dict, Optional
+
+
+class PhaseTimer:
+    """
+    Cumulative timers for the phases of a training loop, and the throughput of the loop.
+
+    The loop calls lap(phase) at the end of each phase, which adds the time since the previous lap to the phase, so
+    a ply costs one perf_counter call per phase. The training functions take an optional PhaseTimer and skip the
+    laps when there is none.
+    """
+
+    def __init__(self) -> None:
+        self.phase_seconds: Dict[str, float] = {}
+        self.episodes = 0
+        self.plies = 0
+        self.start()
+
+    def start(self) -> None:
+        """
+        Restarts the clock of the current phase and of the throughput, without clearing the timers.
+        """
+        self.last = perf_counter()
+        self.report_time = self.last
+        self.report_episodes = self.episodes
+        self.report_plies = self.plies
+        self.report_q_table_size: Optional[int] = None
+
+    def lap(self, phase: str) -> None:
+        """
+        Adds the time since the previous lap to a phase.
+        """
+        now = perf_counter()
+        self.phase_seconds[phase] = self.phase_seconds.get(phase, 0.0) + now - self.last
+        self.last = now
+
+    def end_episode(self, plies: int) -> None:
+        """
+        Counts a finished episode and its plies, not counting the moves that were withdrawn.
+        """
+        self.episodes += 1
+        self.plies += plies
+
+    def report(self, q_table_size: int) -> str:
+        """
+        Returns the throughput since the previous report, the size of the Q-table and its growth since the previous
+        report, and the share of each phase in the total time.
+
+        Parameters:
+        q_table_size (int): The number of entries of the Q-table.
+
+        Returns:
+        str: The report, on one line.
+        """
+        now = perf_counter()
+        elapsed = max(now - self.report_time, 1e-9)
+        growth = (
+            f" (+{q_table_size - self.report_q_table_size})"
+            if self.report_q_table_size is not None
+            else ""
+        )
+        total = sum(self.phase_seconds.values()) or 1
+        phases = ", ".join(
+            f"{phase} {seconds / total:.1%}"
+            for phase, seconds in sorted(self.phase_seconds.items(), key=lambda item: -item[1])
+        )
+        line = (
+            f"{(self.episodes - self.report_episodes) / elapsed:.0f} episodes/s, "
+            f"{(self.plies - self.report_plies) / elapsed:.0f} plies/s, "
+            f"Q-table size {q_table_size}{growth}. Time by phase: {phases}."
+        )
+        self.report_time = now
+        self.report_episodes = self.episodes
+        self.report_plies = self.plies
+        self.report_q_table_size = q_table_size
+        return line
+
+
+class SamplingProfiler:
+    """
+    A statistical profiler that samples the Python stack of the main thread every interval seconds of CPU time, with
+    the SIGPROF timer, and writes the samples as folded stacks: one line per distinct stack, with the frames from
+    the outermost to the innermost separated by semicolons, followed by the number of samples. The file can be
+    rendered by flamegraph.pl or loaded in speedscope.
+
+    It only works on the platforms that have SIGPROF, i.e. not on Windows. Use it as a context manager.
+    """
+
+    def __init__(self, interval: float = 0.01) -> None:
+        """
+        Parameters:
+        interval (float): The sampling interval in seconds of CPU time (default: 0.01). The kernel may round it up
+                          to its clock tick.
+        """
+        if not hasattr(signal, "SIGPROF"):
+            raise RuntimeError("The sampling profiler needs SIGPROF, which this platform does not have.")
+        self.interval = interval
+        self.stacks: Dict[str, int] = {}
+        self.previous_handler = None
+
+    def sample(self, signum, frame) -> None:
+        frames = []
+        while frame is not None:
+            code = frame.f_code
+            frames.append(
+                f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+            )
+            frame = frame.f_back
+        stack = ";".join(reversed(frames))
+        self.stacks[stack] = self.stacks.get(stack, 0) + 1
+
+    def start(self) -> None:
+        self.previous_handler = signal.signal(signal.SIGPROF, self.sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self) -> None:
+        signal.setitimer(signal.ITIMER_PROF, 0)
+        signal.signal(signal.SIGPROF, self.previous_handler or signal.SIG_DFL)
+
+    def write(self, path: str) -> None:
+        """
+        Writes the samples as folded stacks, the most frequent stack first.
+        """
+        with open(path, "w") as file:
+            for stack, count in sorted(self.stacks.items(), key=lambda item: -item[1]):
+                file.write(f"{stack} {count}\n")
+
+    def __enter__(self) -> "SamplingProfiler":
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
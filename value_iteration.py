@@ -0,0 +1,247 @@
+import argparse
+import heapq
+import pickle
+from time import perf_counter
+from typing import Callable, Dict, List, Optional, Tuple
+
+from game_and_agent import NegamaxAgent, QLearningAgent, TicTacToe, reachable_state_keys
+
+# An opponent model maps a game in which the opponent (2 'O') is to move to the probability of each of its actions.
+OpponentModel = Callable[[TicTacToe], List[Tuple[Tuple[int, int], float]]]
+
+# A transition of a state-action pair: (probability, reward, next state_key or None if the game is over).
+Transition = Tuple[float, float, Optional[str]]
+
+
+def first_winning_action(game: TicTacToe) -> Optional[Tuple[int, int]]:
+    """
+    Returns the first valid action that makes the opponent (2 'O') win, as taken by the opponent of the training
+    scripts, or None.
+    """
+    winning_moves = game.winning_moves(2)
+    return winning_moves[0] if winning_moves else None
+
+
+def random_opponent(game: TicTacToe) -> List[Tuple[Tuple[int, int], float]]:
+    """
+    The opponent of training_agent_that_move_first.py: it wins if it can, otherwise it moves at random.
+    """
+    winning_action = first_winning_action(game)
+    if winning_action is not None:
+        return [(winning_action, 1.0)]
+    valid_actions = game.get_valid_actions()
+    return [(action, 1 / len(valid_actions)) for action in valid_actions]
+
+
+def agent_opponent(agent, epsilon: float) -> OpponentModel:
+    """
+    Returns the model of an AI opponent as in training_agent_that_move_second.py: it wins if it can, otherwise it
+    takes a random action with probability epsilon and one of its best actions at random with probability
+    1 - epsilon, in the state seen by itself (1 and 2 swapped).
+
+    Parameters:
+    agent: The opponent agent, a QLearningAgent or a NegamaxAgent.
+    epsilon (float): The exploration rate of the opponent.
+
+    Returns:
+    OpponentModel: The opponent model.
+    """
+
+    def model(game: TicTacToe) -> List[Tuple[Tuple[int, int], float]]:
+        winning_action = first_winning_action(game)
+        if winning_action is not None:
+            return [(winning_action, 1.0)]
+        valid_actions = game.get_valid_actions()
+        best_actions = agent.get_best_actions(
+            game.get_state_key().translate(str.maketrans("12", "21")), valid_actions
+        )
+        return [
+            (
+                action,
+                epsilon / len(valid_actions)
+                + (1 - epsilon) * (action in best_actions) / len(best_actions),
+            )
+            for action in valid_actions
+        ]
+
+    return model
+
+
+def build_transitions(
+    agent_moves_first: bool, opponent: OpponentModel
+) -> Dict[Tuple[str, Tuple[int, int]], List[Transition]]:
+    """
+    Enumerates every reachable state of the agent and the outcomes of each of its actions, with the reward scheme of
+    the training scripts: 1 for a win, 0 for a draw, -1 for a loss and -0.1 for a step that does not end the game.
+
+    Parameters:
+    agent_moves_first (bool): Whether the agent makes the first move.
+    opponent (OpponentModel): The model of the opponent.
+
+    Returns:
+    Dict[Tuple[str, Tuple[int, int]], List[Transition]]: The transitions of each state-action pair.
+    """
+    transitions = {}
+    game = TicTacToe()
+    for state_key in reachable_state_keys(agent_moves_first):
+        game.set_board_by_state_key(state_key)
+        for action in game.get_valid_actions():
+            game.make_move(*action, 1)
+            if game.check_win(1):
+                outcomes = [(1.0, 1, None)]
+            elif game.check_draw():
+                outcomes = [(1.0, 0, None)]
+            else:
+                outcomes = []
+                for opponent_action, probability in opponent(game):
+                    if probability == 0:
+                        continue
+                    game.make_move(*opponent_action, 2)
+                    if game.check_win(2):
+                        outcomes.append((probability, -1, None))
+                    elif game.check_draw():
+                        outcomes.append((probability, 0, None))
+                    else:
+                        outcomes.append((probability, -0.1, game.get_state_key()))
+                    game.withdraw_move(*opponent_action)
+            game.withdraw_move(*action)
+            transitions[(state_key, action)] = outcomes
+    return transitions
+
+
+def value_iteration(
+    transitions: Dict[Tuple[str, Tuple[int, int]], List[Transition]],
+    gamma: float = 1,
+    method: str = "sync",
+    tolerance: float = 1e-9,
+) -> Dict[Tuple[str, Tuple[int, int]], float]:
+    """
+    Computes the Q-values of all the state-action pairs by value iteration.
+
+    'sync' updates all the Q-values from the state values of the previous sweep until no Q-value changes by more than
+    the tolerance. 'prioritized' (prioritized sweeping) always updates the state whose Q-values have the largest
+    Bellman residual, and requeues its predecessors when its value changes.
+
+    Parameters:
+    transitions (Dict[Tuple[str, Tuple[int, int]], List[Transition]]): The output of build_transitions.
+    gamma (float): Discount factor (default: 1)
+    method (str): 'sync' or 'prioritized' (default: 'sync').
+    tolerance (float): The convergence tolerance (default: 1e-9).
+
+    Returns:
+    Dict[Tuple[str, Tuple[int, int]], float]: The Q-table, in the layout of a QLearningAgent Q-table.
+    """
+    actions: Dict[str, List[Tuple[int, int]]] = {}
+    for state_key, action in transitions:
+        actions.setdefault(state_key, []).append(action)
+
+    q_table = {key: 0.0 for key in transitions}
+    state_values = {state_key: 0.0 for state_key in actions}
+
+    def backup(key: Tuple[str, Tuple[int, int]]) -> float:
+        return sum(
+            probability
+            * (reward + (gamma * state_values[next_state_key] if next_state_key else 0))
+            for probability, reward, next_state_key in transitions[key]
+        )
+
+    if method == "sync":
+        while True:
+            new_q_table = {key: backup(key) for key in transitions}
+            change = max(abs(new_q_table[key] - q_table[key]) for key in transitions)
+            q_table = new_q_table
+            for state_key, state_actions in actions.items():
+                state_values[state_key] = max(
+                    q_table[(state_key, action)] for action in state_actions
+                )
+            if change <= tolerance:
+                return q_table
+
+    if method != "prioritized":
+        raise ValueError(f"Unknown value iteration method {method}.")
+
+    predecessors: Dict[str, set] = {}
+    for (state_key, _), outcomes in transitions.items():
+        for _, _, next_state_key in outcomes:
+            if next_state_key:
+                predecessors.setdefault(next_state_key, set()).add(state_key)
+
+    def residual(state_key: str) -> float:
+        return max(
+            abs(backup((state_key, action)) - q_table[(state_key, action)])
+            for action in actions[state_key]
+        )
+
+    queue = [(-residual(state_key), state_key) for state_key in actions]
+    heapq.heapify(queue)
+    while queue:
+        _, state_key = heapq.heappop(queue)
+        for action in actions[state_key]:
+            q_table[(state_key, action)] = backup((state_key, action))
+        new_value = max(q_table[(state_key, action)] for action in actions[state_key])
+        changed = abs(new_value - state_values[state_key]) > tolerance
+        state_values[state_key] = new_value
+        if changed:
+            for predecessor in predecessors.get(state_key, ()):
+                predecessor_residual = residual(predecessor)
+                if predecessor_residual > tolerance:
+                    heapq.heappush(queue, (-predecessor_residual, predecessor))
+    return q_table
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Train an agent by value iteration over all the reachable states."
+    )
+    parser.add_argument("role", choices=["first", "second"])
+    parser.add_argument("--method", choices=["sync", "prioritized"], default="sync")
+    parser.add_argument(
+        "--opponent",
+        choices=["random", "agent", "perfect"],
+        help="The opponent model (default: random for the first role, agent for the second role).",
+    )
+    parser.add_argument(
+        "--opponent-q-table",
+        help="Q-table of the opponent with --opponent agent (default: the table of the other role, "
+        "q_table_ubuntu_agent_move_<other role>.pkl).",
+    )
+    parser.add_argument(
+        "--opponent-epsilon",
+        type=float,
+        help="Exploration rate of the opponent with --opponent agent or perfect (default: 0.5 for agent, 0 for "
+        "perfect, which would otherwise play a random move half of the time).",
+    )
+    parser.add_argument("--gamma", type=float, default=1)
+    parser.add_argument(
+        "--output",
+        help="Path of the pickled Q-table (default: q_table_ubuntu_agent_move_<role>.pkl).",
+    )
+    args = parser.parse_args()
+
+    opponent_name = args.opponent or ("random" if args.role == "first" else "agent")
+    other_role = "second" if args.role == "first" else "first"
+    if opponent_name == "random":
+        opponent_model = random_opponent
+    elif opponent_name == "agent":
+        opponent_model = agent_opponent(
+            QLearningAgent(
+                pre_trained_q_table=args.opponent_q_table
+                or f"q_table_ubuntu_agent_move_{other_role}.pkl"
+            ),
+            0.5 if args.opponent_epsilon is None else args.opponent_epsilon,
+        )
+    else:
+        opponent_model = agent_opponent(NegamaxAgent(), args.opponent_epsilon or 0)
+
+    start = perf_counter()
+    q_table = value_iteration(
+        build_transitions(args.role == "first", opponent_model),
+        gamma=args.gamma,
+        method=args.method,
+    )
+    print(
+        f"Computed {len(q_table)} Q-values with {args.method} value iteration in {perf_counter() - start:.2f}s."
+    )
+
+    with open(args.output or f"q_table_ubuntu_agent_move_{args.role}.pkl", "wb") as f:
+        pickle.dump(q_table, f)